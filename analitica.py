@@ -0,0 +1,319 @@
+"""
+Capa analítica sobre snapshots Parquet.
+
+Exporta las tablas clínicas a archivos Parquet particionados por mes
+(analytics/<tabla>/mes=YYYY-MM/) y consulta esos snapshots con pyarrow, de
+modo que los análisis de varios años no compiten con las escrituras de
+recepción y médicos sobre la base SQLite.
+
+Uso:
+    python analitica.py exportar [--desde YYYY-MM-DD] [--destino DIR]
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import database as db
+
+ANALYTICS_DIR = 'analytics'
+
+# Filas por RecordBatch al escribir Parquet
+EXPORT_BATCH_SIZE = 50_000
+
+ESQUEMAS = {
+    'pacientes': pa.schema([
+        ('id', pa.int64()), ('nombre', pa.string()), ('fecha_nacimiento', pa.string()),
+        ('sexo', pa.string()), ('es_pediatrico', pa.int64()), ('contacto', pa.string()),
+        ('tutor_legal', pa.string()), ('created_at', pa.string()),
+    ]),
+    'citas': pa.schema([
+        ('id', pa.int64()), ('paciente_id', pa.int64()), ('medico_id', pa.int64()),
+        ('fecha_hora', pa.string()), ('estado', pa.string()), ('mes', pa.string()),
+    ]),
+    'hce_comun': pa.schema([
+        ('id', pa.int64()), ('paciente_id', pa.int64()), ('medico_id', pa.int64()),
+        ('fecha_consulta', pa.string()), ('fc', pa.float64()), ('ta_sistolica', pa.float64()),
+        ('ta_diastolica', pa.float64()), ('sato2', pa.float64()), ('mes', pa.string()),
+    ]),
+    'hce_adulto': pa.schema([
+        ('id', pa.int64()), ('hce_comun_id', pa.int64()), ('paciente_id', pa.int64()),
+        ('medico_id', pa.int64()), ('fecha_consulta', pa.string()), ('tiene_hta', pa.int64()),
+        ('tiene_diabetes', pa.int64()), ('tabaquismo', pa.string()),
+        ('colesterol_total', pa.float64()), ('colesterol_hdl', pa.float64()),
+        ('riesgo_cardiovascular_score', pa.float64()),
+        ('riesgo_cardiovascular_framingham', pa.float64()),
+        ('clasificacion_riesgo', pa.string()), ('mes', pa.string()),
+    ]),
+}
+
+# Columna de fecha de la que se deriva la partición 'mes' de cada tabla
+COLUMNA_FECHA = {'citas': 'fecha_hora', 'hce_comun': 'fecha_consulta', 'hce_adulto': 'fecha_consulta'}
+
+BANDAS_EDAD = [(0, 1, '<1'), (1, 5, '1-4'), (5, 12, '5-11'), (12, 18, '12-17'), (18, 40, '18-39'),
+               (40, 60, '40-59'), (60, 75, '60-74'), (75, 200, '75+')]
+
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+
+# ==================== Exportación ====================
+
+def _lotes(filas, esquema, columna_fecha=None):
+    """Agrupa un iterable de dicts en RecordBatch con el esquema dado (y la columna 'mes')."""
+    columnas = esquema.names
+    lote = []
+    for fila in filas:
+        if columna_fecha:
+            fila['mes'] = (fila[columna_fecha] or '')[:7]
+        lote.append({c: fila.get(c) for c in columnas})
+        if len(lote) >= EXPORT_BATCH_SIZE:
+            yield pa.RecordBatch.from_pylist(lote, schema=esquema)
+            lote = []
+    if lote:
+        yield pa.RecordBatch.from_pylist(lote, schema=esquema)
+
+
+def _mes_inicial(desde):
+    if isinstance(desde, str):
+        desde = date.fromisoformat(desde[:10])
+    return desde.replace(day=1)
+
+
+def exportar_parquet(destino=ANALYTICS_DIR, desde=None):
+    """
+    Escribe el snapshot Parquet de las tablas clínicas leyendo SQLite en
+    streaming. Con desde=None se reescribe todo; con una fecha solo se
+    reemplazan las particiones desde el mes de esa fecha en adelante.
+    Retorna {tabla: filas exportadas}.
+
+    La exportación completa se escribe en un directorio temporal junto a
+    destino y recién al terminar reemplaza al snapshot anterior: mientras
+    tanto las consultas siguen leyendo el anterior, y si falla queda intacto.
+    """
+    if desde:
+        return _exportar(destino, _mes_inicial(desde))
+
+    padre = os.path.dirname(os.path.abspath(destino))
+    os.makedirs(padre, exist_ok=True)
+    temporal = tempfile.mkdtemp(prefix=f".{os.path.basename(destino)}-", dir=padre)
+    try:
+        resumen = _exportar(temporal, None)
+        if os.path.exists(destino):
+            # Un directorio no vacío no se puede reemplazar de una vez: se aparta
+            # el anterior y se renombra el nuevo en su lugar
+            anterior = temporal + '-anterior'
+            os.replace(destino, anterior)
+            os.replace(temporal, destino)
+            shutil.rmtree(anterior, ignore_errors=True)
+        else:
+            os.replace(temporal, destino)
+    except BaseException:
+        shutil.rmtree(temporal, ignore_errors=True)
+        raise
+    return resumen
+
+
+def _exportar(destino, inicio):
+    fuentes = {
+        'citas': db.iter_citas(inicio),
+        'hce_comun': db.iter_hce(inicio),
+        'hce_adulto': db.iter_hce_adulto(inicio),
+    }
+    os.makedirs(destino, exist_ok=True)
+
+    resumen = {}
+    # Pacientes es una tabla de referencia: se reescribe entera, sin particionar,
+    # lote a lote como las demás
+    ruta_pacientes = os.path.join(destino, 'pacientes.parquet')
+    resumen['pacientes'] = 0
+    with pq.ParquetWriter(ruta_pacientes + '.tmp', ESQUEMAS['pacientes']) as escritor:
+        for lote in _lotes(db.iter_pacientes(), ESQUEMAS['pacientes']):
+            escritor.write_batch(lote)
+            resumen['pacientes'] += lote.num_rows
+    os.replace(ruta_pacientes + '.tmp', ruta_pacientes)
+
+    for nombre, filas in fuentes.items():
+        contador = {'filas': 0}
+
+        def contar(lotes):
+            for lote in lotes:
+                contador['filas'] += lote.num_rows
+                yield lote
+
+        lotes = contar(_lotes(filas, ESQUEMAS[nombre], COLUMNA_FECHA[nombre]))
+        ds.write_dataset(
+            lotes,
+            os.path.join(destino, nombre),
+            schema=ESQUEMAS[nombre],
+            format='parquet',
+            partitioning=ds.partitioning(pa.schema([('mes', pa.string())]), flavor='hive'),
+            existing_data_behavior='delete_matching',
+            basename_template='part-{i}.parquet',
+        )
+        # Sin filas write_dataset no crea el directorio; lo dejamos vacío para que las consultas no fallen
+        os.makedirs(os.path.join(destino, nombre), exist_ok=True)
+        resumen[nombre] = contador['filas']
+
+    with open(os.path.join(destino, '_exportado_en'), 'w') as f:
+        f.write(datetime.now().isoformat(timespec='seconds'))
+    return resumen
+
+
+# Exportación lanzada desde la interfaz: corre en un hilo aparte para no
+# retener la petición de Streamlit; una sola a la vez por proceso
+_exportacion = {'hilo': None, 'resumen': None, 'error': None, 'terminado_en': None}
+_exportacion_lock = threading.Lock()
+
+
+def exportar_en_segundo_plano(destino=ANALYTICS_DIR):
+    """Lanza exportar_parquet(destino) en un hilo. Retorna False si ya hay una en curso."""
+    def trabajo():
+        try:
+            resumen, error = exportar_parquet(destino), None
+        except Exception as e:
+            resumen, error = None, str(e)
+        with _exportacion_lock:
+            _exportacion.update(hilo=None, resumen=resumen, error=error, terminado_en=datetime.now())
+
+    with _exportacion_lock:
+        if _exportacion['hilo'] is not None:
+            return False
+        hilo = threading.Thread(target=trabajo, name='exportacion-parquet', daemon=True)
+        _exportacion['hilo'] = hilo
+    hilo.start()
+    return True
+
+
+def estado_exportacion():
+    """{'en_curso', 'resumen', 'error', 'terminado_en'} de la última exportación en segundo plano."""
+    with _exportacion_lock:
+        return {'en_curso': _exportacion['hilo'] is not None, 'resumen': _exportacion['resumen'],
+                'error': _exportacion['error'], 'terminado_en': _exportacion['terminado_en']}
+
+
+def fecha_snapshot(destino=ANALYTICS_DIR):
+    """Fecha y hora de la última exportación, o None si no hay snapshot."""
+    ruta = os.path.join(destino, '_exportado_en')
+    if not os.path.exists(ruta):
+        return None
+    with open(ruta) as f:
+        return datetime.fromisoformat(f.read().strip())
+
+
+# ==================== Consultas ====================
+
+def _dataset(nombre, destino=ANALYTICS_DIR):
+    return ds.dataset(os.path.join(destino, nombre), schema=ESQUEMAS[nombre], format='parquet',
+                      partitioning='hive')
+
+
+def _filtro_meses(desde=None, hasta=None):
+    # Filtra por la columna de partición: pyarrow descarta los meses sin leerlos
+    filtro = None
+    if desde:
+        filtro = ds.field('mes') >= str(desde)[:7]
+    if hasta:
+        condicion = ds.field('mes') <= str(hasta)[:7]
+        filtro = condicion if filtro is None else filtro & condicion
+    return filtro
+
+
+def _filtro_citas_vigentes(desde=None, hasta=None):
+    # Las citas canceladas no cuentan en las tendencias (como en db.get_noshow_stats)
+    vigentes = ds.field('estado').is_null() | (ds.field('estado') != 'Cancelada')
+    filtro = _filtro_meses(desde, hasta)
+    return vigentes if filtro is None else filtro & vigentes
+
+
+def _timestamps(columna):
+    return pc.strptime(columna, format='%Y-%m-%d %H:%M:%S', unit='s', error_is_null=True)
+
+
+def tendencia_mensual_citas(desde=None, hasta=None, destino=ANALYTICS_DIR):
+    """Citas por mes y estado: [{'mes', 'estado', 'total'}] ordenado por mes."""
+    tabla = _dataset('citas', destino).to_table(columns=['mes', 'estado'], filter=_filtro_citas_vigentes(desde, hasta))
+    agrupado = tabla.group_by(['mes', 'estado']).aggregate([('estado', 'count')])
+    filas = [{'mes': f['mes'], 'estado': f['estado'], 'total': f['estado_count']} for f in agrupado.to_pylist()]
+    return sorted(filas, key=lambda f: (f['mes'], f['estado'] or ''))
+
+
+def noshows_por_dia_semana(desde=None, hasta=None, destino=ANALYTICS_DIR):
+    """Total de citas, no-shows y tasa de no-show por día de la semana."""
+    tabla = _dataset('citas', destino).to_table(columns=['fecha_hora', 'estado'],
+                                                filter=_filtro_citas_vigentes(desde, hasta))
+    dia = pc.day_of_week(_timestamps(tabla['fecha_hora']))  # 0 = lunes
+    es_noshow = pc.cast(pc.equal(tabla['estado'], 'No-show'), pa.int64())
+    agrupado = pa.table({'dia': dia, 'noshow': es_noshow}).group_by('dia').aggregate(
+        [('noshow', 'count'), ('noshow', 'sum')])
+
+    filas = []
+    for f in sorted(agrupado.to_pylist(), key=lambda f: f['dia'] if f['dia'] is not None else 7):
+        if f['dia'] is None:
+            continue
+        total, noshows = f['noshow_count'], f['noshow_sum'] or 0
+        filas.append({'dia': DIAS_SEMANA[f['dia']], 'total_citas': total, 'noshows': noshows,
+                      'tasa_noshow': round(noshows / total * 100, 1) if total else 0})
+    return filas
+
+
+def distribucion_riesgo(desde=None, hasta=None, destino=ANALYTICS_DIR):
+    """Consultas de adultos por clasificación de riesgo cardiovascular."""
+    tabla = _dataset('hce_adulto', destino).to_table(
+        columns=['clasificacion_riesgo', 'riesgo_cardiovascular_score'], filter=_filtro_meses(desde, hasta))
+    agrupado = tabla.group_by('clasificacion_riesgo').aggregate(
+        [('clasificacion_riesgo', 'count'), ('riesgo_cardiovascular_score', 'mean')])
+    return [{'clasificacion_riesgo': f['clasificacion_riesgo'], 'total': f['clasificacion_riesgo_count'],
+             'score_medio': round(f['riesgo_cardiovascular_score_mean'] or 0, 2)}
+            for f in agrupado.to_pylist()]
+
+
+def signos_vitales_por_edad(desde=None, hasta=None, destino=ANALYTICS_DIR):
+    """Promedio de FC, TA y SatO2 por banda de edad del paciente al momento de la consulta."""
+    consultas = _dataset('hce_comun', destino).to_table(
+        columns=['paciente_id', 'fecha_consulta', 'fc', 'ta_sistolica', 'ta_diastolica', 'sato2'],
+        filter=_filtro_meses(desde, hasta))
+    pacientes = pq.read_table(os.path.join(destino, 'pacientes.parquet'), columns=['id', 'fecha_nacimiento'])
+    tabla = consultas.join(pacientes, keys='paciente_id', right_keys='id')
+
+    nacimiento = pc.strptime(tabla['fecha_nacimiento'], format='%Y-%m-%d', unit='s', error_is_null=True)
+    edad = pc.divide(pc.days_between(nacimiento, _timestamps(tabla['fecha_consulta'])), 365)
+    banda = pa.array([None] * len(tabla), pa.string())
+    for minimo, maximo, etiqueta in BANDAS_EDAD:
+        en_banda = pc.and_(pc.greater_equal(edad, minimo), pc.less(edad, maximo))
+        banda = pc.if_else(en_banda, etiqueta, banda)
+    tabla = tabla.append_column('banda', banda)
+
+    agrupado = tabla.group_by('banda').aggregate([
+        ('fc', 'count'), ('fc', 'mean'), ('ta_sistolica', 'mean'), ('ta_diastolica', 'mean'), ('sato2', 'mean')])
+    orden = {etiqueta: i for i, (_, _, etiqueta) in enumerate(BANDAS_EDAD)}
+    filas = [f for f in agrupado.to_pylist() if f['banda'] is not None]
+    return [{'banda_edad': f['banda'], 'consultas': f['fc_count'],
+             'fc': round(f['fc_mean'] or 0, 1), 'ta_sistolica': round(f['ta_sistolica_mean'] or 0, 1),
+             'ta_diastolica': round(f['ta_diastolica_mean'] or 0, 1), 'sato2': round(f['sato2_mean'] or 0, 1)}
+            for f in sorted(filas, key=lambda f: orden[f['banda']])]
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Snapshots Parquet para analítica")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+    p_exportar = subparsers.add_parser('exportar', help="Exporta las tablas clínicas a Parquet")
+    p_exportar.add_argument('--desde', help="Reexporta solo desde el mes de esta fecha (YYYY-MM-DD)")
+    p_exportar.add_argument('--destino', default=ANALYTICS_DIR)
+    args = parser.parse_args()
+
+    db.init_db()
+    inicio = time.perf_counter()
+    resumen = exportar_parquet(args.destino, args.desde)
+    for tabla, filas in resumen.items():
+        print(f"{tabla:<12}{filas:>12,} fila(s)")
+    print(f"Snapshot escrito en {args.destino}/ en {time.perf_counter() - inicio:.1f} s")
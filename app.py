@@ -1,15 +1,27 @@
 import streamlit as st
-from database import init_db, verify_login
-from modules.hce import show as mostrar_hce
-from modules.agenda import show as mostrar_agenda
-from modules.busqueda import mostrar_buscador
-from modules.admin import mostrar_gestion_medicos
-from modules.dashboard import show as mostrar_dashboard
+import metricas
+from database import configurar_backend, init_db, verify_login
+# Los módulos de cada página se importan al abrirla (ver LÓGICA DE NAVEGACIÓN):
+# la pantalla de login no carga pandas, plotly ni reportlab
 
 # 1. Configuración de página (Debe ser lo primero)
 st.set_page_config(page_title="CardioCloud 4.0", layout="wide", page_icon="🩺")
 
-# 2. Inicializar DB
+# 2. Arranque, una sola vez por proceso (los reruns lo encuentran en caché):
+#    backend de datos desde la sección [database] de secrets.toml (SQLite si no
+#    existe) y exportación de métricas de la base (OpenMetrics), si está configurada
+@st.cache_resource(show_spinner=False)
+def iniciar_aplicacion():
+    try:
+        if "database" in st.secrets:
+            configurar_backend(**st.secrets["database"])
+    except FileNotFoundError:
+        pass
+    metricas.iniciar_exportacion()
+
+iniciar_aplicacion()
+
+# 3. Inicializar DB (migraciones pendientes; una sola verificación por proceso)
 init_db()
 
 # --- GESTIÓN DE ESTADO DE SESIÓN ---
@@ -21,6 +33,7 @@ if "logged_in" not in st.session_state:
 
 # --- PANTALLA DE LOGIN ---
 if not st.session_state.logged_in:
+    metricas.fijar_pagina("Login")
     st.title("🩺 Bienvenido a CardioCloud")
     
     col1, col2, col3 = st.columns([1, 2, 1])
@@ -52,7 +65,7 @@ else:
     st.sidebar.caption(f"Rol: {st.session_state.rol.upper()}")
     
     # 3. Menú dinámico
-    menu = ["Dashboard", "Agenda (Citas)", "Consulta Médica (HCE)", "Buscador Historial"]
+    menu = ["Dashboard", "Agenda (Citas)", "Consulta Médica (HCE)", "Buscador Historial", "Buscador Clínico"]
 
     
     # Admin menu
@@ -70,18 +83,30 @@ else:
         st.rerun()
 
     # --- LÓGICA DE NAVEGACIÓN ---
+    # Cada página importa su módulo la primera vez que se abre; después Python
+    # lo toma de sys.modules y el import no cuesta nada en los reruns.
+    metricas.fijar_pagina(opcion)  # página de origen en el registro de consultas lentas
     if opcion == "Dashboard":
+        from modules.dashboard import show as mostrar_dashboard
         mostrar_dashboard()
 
     elif opcion == "Agenda (Citas)":
+        from modules.agenda import show as mostrar_agenda
         mostrar_agenda()
 
 
     elif opcion == "Consulta Médica (HCE)":
+        from modules.hce import show as mostrar_hce
         mostrar_hce()
 
     elif opcion == "Buscador Historial":
+        from modules.busqueda import mostrar_buscador
         mostrar_buscador()
 
+    elif opcion == "Buscador Clínico":
+        from modules.busqueda import mostrar_buscador_clinico
+        mostrar_buscador_clinico()
+
     elif opcion == "Gestión de Médicos":
+        from modules.admin import mostrar_gestion_medicos
         mostrar_gestion_medicos()
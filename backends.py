@@ -0,0 +1,319 @@
+"""
+Backends de almacenamiento para database.py.
+
+Las funciones de database.py escriben su SQL en el dialecto común de SQLite
+y PostgreSQL con placeholders `?`, leen filas por índice o por nombre y usan
+cursor.lastrowid. SQLiteBackend las ejecuta tal cual sobre sqlite3;
+PostgresBackend adapta las conexiones de un pool de psycopg para que esas
+mismas funciones corran sin cambios.
+
+Cada backend expone:
+    nombre                     'sqlite' o 'postgres'
+    clave                      identifica la base (archivo o DSN)
+    pool                       acquire() / release(conn) / close()
+    version(conn)              versión del esquema aplicada
+    fijar_version(conn, n)
+    bloquear(conn, tablas=())  inicia una transacción de escritura exclusiva
+"""
+
+import queue
+import re
+import sqlite3
+from functools import lru_cache
+
+
+# Observador opcional de sentencias: recibe el SQL tal como se escribió (con
+# placeholders, sin valores). Lo usa metricas.py para el registro de lentas.
+observador_sql = None
+
+
+# --- SQLITE ---
+
+# PRAGMAs que se aplican una sola vez al abrir cada conexión
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",     # ~16 MB de caché de páginas
+    "PRAGMA mmap_size=134217728",   # 128 MB mapeados en memoria
+)
+
+
+class CursorSQLite(sqlite3.Cursor):
+    def execute(self, sql, params=()):
+        if observador_sql is not None:
+            observador_sql(sql)
+        return super().execute(sql, params)
+
+    def executemany(self, sql, filas):
+        if observador_sql is not None:
+            observador_sql(sql)
+        return super().executemany(sql, filas)
+
+
+class ConexionSQLite(sqlite3.Connection):
+    """sqlite3.Connection cuyos cursores avisan cada sentencia a observador_sql."""
+
+    def cursor(self, factory=CursorSQLite):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, filas):
+        return self.cursor().executemany(sql, filas)
+
+
+def conectar_sqlite(db_name):
+    """Abre una conexión nueva con los PRAGMAs de rendimiento aplicados."""
+    conn = sqlite3.connect(db_name, check_same_thread=False, factory=ConexionSQLite)
+    conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Pool acotado de conexiones SQLite reutilizables entre reruns y hilos."""
+
+    def __init__(self, db_name, size):
+        self.db_name = db_name
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._closed = False
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return conectar_sqlite(self.db_name)
+
+    def release(self, conn):
+        if self._closed:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class SQLiteBackend:
+    nombre = 'sqlite'
+
+    def __init__(self, db_name, pool_size):
+        self.clave = db_name
+        self.pool = ConnectionPool(db_name, pool_size)
+
+    def version(self, conn):
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def fijar_version(self, conn, numero):
+        conn.execute(f"PRAGMA user_version = {int(numero)}")
+
+    def bloquear(self, conn, tablas=()):
+        # Toma el lock de escritura de toda la base al iniciar la transacción
+        conn.execute("BEGIN IMMEDIATE")
+
+    def close(self):
+        self.pool.close()
+
+
+# --- POSTGRESQL ---
+
+# Tablas sin columna id: sus INSERT no llevan RETURNING id
+TABLAS_SIN_ID = {'citas_resumen_diario', 'esquema_version', 'pacientes_fts', 'hce_fts', 'horarios_medico'}
+
+# Clave del advisory lock que serializa migraciones y otras escrituras exclusivas
+LOCK_ESCRITURA = 7301
+
+_INSERT = re.compile(r"\s*INSERT\s+INTO\s+(\w+)", re.IGNORECASE)
+_LITERAL_O_PLACEHOLDER = re.compile(r"'(?:[^']|'')*'|\?")
+
+
+@lru_cache(maxsize=512)
+def _traducir(sql):
+    """Placeholders `?` -> `%s` fuera de literales; `%` se escapa como `%%`."""
+    sql = sql.replace('%', '%%')
+    return _LITERAL_O_PLACEHOLDER.sub(lambda m: '%s' if m.group() == '?' else m.group(), sql)
+
+
+def _valor(v):
+    # Los booleanos se guardan como 0/1, igual que en SQLite
+    return int(v) if isinstance(v, bool) else v
+
+
+class Fila:
+    """Fila accesible por índice y por nombre de columna, como sqlite3.Row."""
+
+    __slots__ = ('_valores', '_indice')
+
+    def __init__(self, valores, indice):
+        self._valores = valores
+        self._indice = indice
+
+    def __getitem__(self, clave):
+        if isinstance(clave, str):
+            return self._valores[self._indice[clave]]
+        return self._valores[clave]
+
+    def __iter__(self):
+        return iter(self._valores)
+
+    def __len__(self):
+        return len(self._valores)
+
+    def keys(self):
+        return list(self._indice)
+
+
+def _fabrica_filas(cursor):
+    indice = {col.name: i for i, col in enumerate(cursor.description or ())}
+    return lambda valores: Fila(valores, indice)
+
+
+class CursorPG:
+    """Cursor de psycopg con la interfaz de sqlite3 que usa database.py."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.lastrowid = None
+
+    def execute(self, sql, params=()):
+        if observador_sql is not None:
+            observador_sql(sql)
+        # Sin parámetros psycopg no interpreta % ni placeholders
+        if params:
+            sql = _traducir(sql)
+            params = [_valor(v) for v in params]
+        else:
+            params = None
+        insert = _INSERT.match(sql)
+        if insert and insert.group(1).lower() not in TABLAS_SIN_ID and 'RETURNING' not in sql.upper():
+            self._cursor.execute(sql + " RETURNING id", params)
+            fila = self._cursor.fetchone()
+            self.lastrowid = fila[0] if fila else None
+        else:
+            self._cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, filas):
+        if observador_sql is not None:
+            observador_sql(sql)
+        filas = [[_valor(v) for v in fila] for fila in filas]
+        if filas:
+            self._cursor.executemany(_traducir(sql), filas)
+        return self
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class ConexionPG:
+    """Conexión de psycopg con la interfaz de sqlite3 que usa database.py."""
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def cursor(self, nombre=None):
+        # Con nombre se crea un cursor del lado del servidor (lectura en streaming)
+        return CursorPG(self.raw.cursor(name=nombre) if nombre else self.raw.cursor())
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, filas):
+        return self.cursor().executemany(sql, filas)
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+
+def _psycopg_pool():
+    # PostgreSQL es opcional: psycopg se importa recién al crear su backend,
+    # así SQLite no paga su tiempo de import ni necesita instalarlo
+    try:
+        from psycopg_pool import ConnectionPool
+    except ImportError:
+        raise RuntimeError("El backend 'postgres' requiere instalar psycopg y psycopg_pool") from None
+    return ConnectionPool
+
+
+class PostgresPool:
+    """Adapta psycopg_pool.ConnectionPool a acquire/release."""
+
+    def __init__(self, dsn, size):
+        self._pool = _psycopg_pool()(dsn, min_size=1, max_size=size, open=True,
+                                     kwargs={'row_factory': _fabrica_filas})
+
+    def acquire(self):
+        return ConexionPG(self._pool.getconn())
+
+    def release(self, conn):
+        self._pool.putconn(conn.raw)
+
+    def close(self):
+        self._pool.close()
+
+
+class PostgresBackend:
+    nombre = 'postgres'
+
+    def __init__(self, dsn, pool_size):
+        self.clave = dsn
+        self.pool = PostgresPool(dsn, pool_size)
+
+    def version(self, conn):
+        if conn.execute("SELECT to_regclass('esquema_version')").fetchone()[0] is None:
+            return 0
+        row = conn.execute("SELECT version FROM esquema_version").fetchone()
+        return row[0] if row else 0
+
+    def fijar_version(self, conn, numero):
+        conn.execute("CREATE TABLE IF NOT EXISTS esquema_version (version INTEGER NOT NULL)")
+        conn.execute("DELETE FROM esquema_version")
+        conn.execute("INSERT INTO esquema_version (version) VALUES (?)", (numero,))
+
+    def bloquear(self, conn, tablas=()):
+        conn.execute("SELECT pg_advisory_xact_lock(?)", (LOCK_ESCRITURA,))
+        for tabla in tablas:
+            # SHARE ROW EXCLUSIVE: permite leer, bloquea escrituras concurrentes
+            conn.execute(f"LOCK TABLE {tabla} IN SHARE ROW EXCLUSIVE MODE")
+
+    def close(self):
+        self.pool.close()
+
+
+def crear_backend(nombre, db_name=None, dsn=None, pool_size=8):
+    if nombre == 'sqlite':
+        return SQLiteBackend(db_name, pool_size)
+    if nombre == 'postgres':
+        return PostgresBackend(dsn, pool_size)
+    raise ValueError(f"Backend desconocido: {nombre!r}")
@@ -0,0 +1,77 @@
+"""
+Benchmark de búsqueda de pacientes: LIKE '%q%' (anterior) vs. índice FTS5.
+
+Genera registros sintéticos de pacientes y mide la latencia media de
+search_pacientes() para varias consultas típicas de recepción.
+
+Uso:
+    python benchmarks/bench_busqueda_pacientes.py [tamaño ...]   (por defecto 100000 1000000)
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+NOMBRES = ['Juan', 'María', 'José', 'Lucía', 'Pedro', 'Ana', 'Luis', 'Carmen', 'Andrés', 'Sofía',
+           'Miguel', 'Valentina', 'Jesús', 'Isabel', 'Ramón', 'Gabriela', 'Óscar', 'Beatriz']
+APELLIDOS = ['Pérez', 'González', 'Rodríguez', 'Fernández', 'López', 'Martínez', 'Sánchez', 'Gómez',
+             'Díaz', 'Núñez', 'Hernández', 'Muñoz', 'Álvarez', 'Romero', 'Ramírez', 'Castillo']
+CONSULTAS = ['perez', 'maria gonz', 'nuñez', 'castillo ramon', '555-01']
+
+
+def poblar(n, semilla=42):
+    rnd = random.Random(semilla)
+    filas = ((f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}",
+              f"{rnd.randint(1940, 2023)}-01-01", 0, f"555-{rnd.randint(0, 99999):05d}", '')
+             for _ in range(n))
+    with db.db_connection() as conn:
+        conn.executemany('''INSERT INTO pacientes (nombre, fecha_nacimiento, es_pediatrico, contacto, tutor_legal)
+                            VALUES (?, ?, ?, ?, ?)''', filas)
+
+
+def busqueda_like(query):
+    # Consulta anterior a FTS5, sin LIMIT
+    param = f"%{query}%"
+    with db.db_connection() as conn:
+        rows = conn.execute("SELECT * FROM pacientes WHERE nombre LIKE ? OR CAST(id AS TEXT) LIKE ?",
+                            (param, param)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def medir(fn, repeticiones=5):
+    tiempos = {}
+    for q in CONSULTAS:
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            fn(q)
+        tiempos[q] = (time.perf_counter() - inicio) / repeticiones * 1000
+    return tiempos
+
+
+def main():
+    tamaños = [int(x) for x in sys.argv[1:]] or [100_000, 1_000_000]
+    for n in tamaños:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_NAME = os.path.join(tmp, 'bench.db')
+            db.init_db()
+            inicio = time.perf_counter()
+            poblar(n)
+            print(f"\n{n:,} pacientes (carga + índice FTS: {time.perf_counter() - inicio:.1f} s)")
+
+            like = medir(busqueda_like)
+            fts = medir(db.search_pacientes)
+            db.close_pool()
+
+        print(f"{'consulta':<18}{'LIKE (ms)':>12}{'FTS5 (ms)':>12}")
+        for q in CONSULTAS:
+            print(f"{q:<18}{like[q]:>12.2f}{fts[q]:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
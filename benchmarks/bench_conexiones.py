@@ -0,0 +1,53 @@
+"""
+Benchmark de latencia por llamada: conexión nueva por llamada vs. pool.
+
+Uso:
+    python benchmarks/bench_conexiones.py [iteraciones]
+"""
+
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+
+def llamada_sin_pool(paciente_id):
+    # Patrón anterior: abrir, consultar y cerrar en cada llamada
+    conn = sqlite3.connect(db.DB_NAME, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM pacientes WHERE id=?", (paciente_id,)).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+
+def medir(fn, iteraciones):
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        fn()
+    return (time.perf_counter() - inicio) / iteraciones * 1e6
+
+
+def main():
+    iteraciones = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        paciente_id = db.create_paciente('Paciente Benchmark', '1980-01-01', False, '555', '')
+
+        antes = medir(lambda: llamada_sin_pool(paciente_id), iteraciones)
+        despues = medir(lambda: db.get_paciente(paciente_id), iteraciones)
+        db.close_pool()
+
+    print(f"Iteraciones: {iteraciones}")
+    print(f"Conexión por llamada : {antes:8.1f} µs/llamada")
+    print(f"Pool de conexiones   : {despues:8.1f} µs/llamada")
+    print(f"Mejora               : {antes / despues:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
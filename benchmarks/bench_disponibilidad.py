@@ -0,0 +1,104 @@
+"""
+Benchmark del motor de disponibilidad (disponibilidad.py).
+
+Cada médico tiene 10.000 citas: las próximas 8 semanas casi llenas (según
+--ocupacion) y el resto en los años anteriores. Se mide cuánto tarda
+proximos_libres() en encontrar los primeros N turnos libres de un médico y de
+cualquier médico, frente a recorrer la agenda día por día con
+get_citas_by_medico_fecha() como hacía recepción.
+
+Uso:
+    python benchmarks/bench_disponibilidad.py [--medicos 10] [--citas 10000] [--ocupacion 0.95] [-n 10]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import disponibilidad
+from datos_sinteticos import FIN_TURNO, TURNOS
+
+DESDE = datetime(2025, 6, 30, 7, 0)
+
+
+def poblar(medicos, citas_por_medico, ocupacion, semilla=42):
+    rng = random.Random(semilla)
+    with db.db_connection() as conn:
+        conn.execute("INSERT INTO pacientes (nombre, fecha_nacimiento, es_pediatrico) VALUES ('Bench', '1970-01-01', 0)")
+        conn.executemany("INSERT INTO medicos (id, nombre, especialidad) VALUES (?, ?, 'Cardiología')",
+                         [(m, f'Médico {m}') for m in range(1, medicos + 1)])
+    ventana = [DESDE.date() + timedelta(days=d) for d in range(disponibilidad.SEMANAS * 7)]
+    ventana = [d for d in ventana if d.weekday() < 5]
+    for medico_id in range(1, medicos + 1):
+        filas = []
+        for dia in ventana:
+            filas.extend((medico_id, f'{dia} {t}', f'{dia} {FIN_TURNO[t]}') for t in TURNOS if rng.random() < ocupacion)
+        historia = DESDE.date() - timedelta(days=1)
+        while len(filas) < citas_por_medico:
+            if historia.weekday() < 5:
+                filas.extend((medico_id, f'{historia} {t}', f'{historia} {FIN_TURNO[t]}')
+                             for t in TURNOS[:citas_por_medico - len(filas)])
+            historia -= timedelta(days=1)
+        with db.db_connection() as conn:
+            conn.executemany('''INSERT INTO citas (paciente_id, medico_id, fecha_hora, fecha_hora_fin, estado)
+                                VALUES (1, ?, ?, ?, 'Pendiente')''', filas)
+
+
+def dia_por_dia(medico_id, n, duracion_min):
+    """Recorrido previo: pedir la agenda de cada día y buscar huecos entre las citas."""
+    turnos, dia = [], DESDE.date()
+    while len(turnos) < n and dia < DESDE.date() + timedelta(weeks=disponibilidad.SEMANAS):
+        if dia.weekday() < 5:
+            ocupadas = {c['fecha_hora'][11:] for c in db.get_citas_by_medico_fecha(medico_id, dia.isoformat())}
+            turnos.extend(f'{dia} {t}' for t in TURNOS if t not in ocupadas)
+        dia += timedelta(days=1)
+    return turnos[:n]
+
+
+def medir(fn, repeticiones=20):
+    fn()
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = fn()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--medicos', type=int, default=10)
+    parser.add_argument('--citas', type=int, default=10_000, help="citas por médico")
+    parser.add_argument('--ocupacion', type=float, default=0.95, help="fracción ocupada de las próximas 8 semanas")
+    parser.add_argument('-n', type=int, default=10, help="turnos libres pedidos")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        inicio = time.perf_counter()
+        poblar(args.medicos, args.citas, args.ocupacion)
+        print(f"{args.medicos} médicos x {args.citas:,} citas, ocupación {args.ocupacion:.0%} "
+              f"(carga: {time.perf_counter() - inicio:.1f} s)")
+
+        casos = [
+            ("un médico, motor", lambda: disponibilidad.proximos_libres(args.n, 20, medico_id=1, desde=DESDE)),
+            ("un médico, día por día", lambda: dia_por_dia(1, args.n, 20)),
+            ("cualquier médico, motor", lambda: disponibilidad.proximos_libres(args.n, 20, desde=DESDE)),
+            ("un médico, 60 min", lambda: disponibilidad.proximos_libres(args.n, 60, medico_id=1, desde=DESDE,
+                                                                         paso_min=20)),
+        ]
+        for nombre, fn in casos:
+            ms, turnos = medir(fn)
+            ultimo = turnos[-1]['fecha_hora'] if turnos and isinstance(turnos[-1], dict) else (turnos or ['-'])[-1]
+            print(f"{nombre:<26}{ms:>9.2f} ms  {len(turnos)} turno(s), el último {ultimo}")
+        db.close_pool()
+
+
+if __name__ == '__main__':
+    main()
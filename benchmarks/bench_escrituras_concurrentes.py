@@ -0,0 +1,85 @@
+"""
+Estrés de escrituras concurrentes: N escritores simultáneos (hilos, como
+sesiones de Streamlit) crean citas y las marcan como "Llegó". Compara cada
+escritura en su propia conexión del pool contra la cola de escritura con
+group commit (WRITE_QUEUE_ENABLED). Reporta tasa de error y throughput.
+
+Uso:
+    python benchmarks/bench_escrituras_concurrentes.py [escritores] [citas_por_escritor] [busy_timeout_ms]
+
+busy_timeout_ms (por defecto el de PRAGMAS, 5000) permite simular esperas
+de lock más cortas, donde la contención se ve como "database is locked".
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backends
+import database as db
+
+
+def correr(escritores, citas_por_escritor):
+    paciente_id = db.create_paciente('Paciente Benchmark', '1970-01-01', False, '555', '')
+    errores = []
+    barrera = threading.Barrier(escritores)
+
+    def escritor(medico_id):
+        barrera.wait()  # todos empiezan a la vez, como al inicio de un turno
+        for i in range(citas_por_escritor):
+            try:
+                cita_id = db.create_cita(paciente_id, medico_id, f'2024-03-05 {8 + i // 60:02d}:{i % 60:02d}:00')
+                db.update_estado_cita(cita_id, 'Llegó')
+            except Exception as e:
+                errores.append(e)
+
+    hilos = [threading.Thread(target=escritor, args=(m,)) for m in range(1, escritores + 1)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    segundos = time.perf_counter() - inicio
+
+    operaciones = escritores * citas_por_escritor * 2
+    fallidas = len(errores)
+    return {
+        'operaciones': operaciones,
+        'error_rate': fallidas / (escritores * citas_por_escritor) * 100,
+        'ops_s': (operaciones - fallidas) / segundos,
+        'segundos': segundos,
+        'ejemplo_error': str(errores[0]) if errores else '',
+    }
+
+
+def main():
+    escritores = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    citas = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    if len(sys.argv) > 3:
+        backends.PRAGMAS = tuple(f"PRAGMA busy_timeout={int(sys.argv[3])}" if p.startswith("PRAGMA busy_timeout") else p
+                                 for p in backends.PRAGMAS)
+    timeout = [p for p in backends.PRAGMAS if 'busy_timeout' in p][0].split('=')[1]
+
+    print(f"{escritores} escritores x {citas} citas (crear + marcar llegada), busy_timeout={timeout} ms")
+    for modo, cola in (("Conexión por escritura", False), ("Cola de escritura", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db.DB_NAME = os.path.join(tmp, 'bench.db')
+            db.WRITE_QUEUE_ENABLED = cola
+            db.init_db()
+            r = correr(escritores, citas)
+            stats = db.get_write_queue_stats()
+            db.close_pool()
+
+        print(f"{modo:24}: {r['ops_s']:8.0f} escrituras/s  errores {r['error_rate']:5.1f}%  ({r['segundos']:.2f} s)")
+        if stats:
+            print(f"{'':24}  {stats['commits']} commits, {stats['trabajos_por_commit']} trabajos por commit")
+        if r['ejemplo_error']:
+            print(f"{'':24}  p. ej.: {r['ejemplo_error']}")
+
+
+if __name__ == '__main__':
+    main()
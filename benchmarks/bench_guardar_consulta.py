@@ -0,0 +1,75 @@
+"""
+Benchmark de guardado de una consulta completa (adulto, 2 exámenes, 12 recetas):
+llamadas independientes (una transacción por fila) vs. save_consulta().
+
+Uso:
+    python benchmarks/bench_guardar_consulta.py [iteraciones]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+CONSULTA = {
+    'fecha_consulta': '2024-03-05 10:00:00', 'motivo_consulta': 'Control', 'diagnostico': 'HTA',
+    'fc': 80, 'ta_sistolica': 140, 'ta_diastolica': 90, 'sato2': 98.0,
+    'ef_general': 'Normal', 'ef_cardio': 'Ruidos rítmicos', 'ef_respiratorio': 'Normal',
+    'ef_otros': '', 'ecg_hallazgos': 'Ritmo sinusal', 'echo_hallazgos': '', 'observaciones': ''
+}
+DETALLE = {
+    'tiene_hta': True, 'tiene_diabetes': False, 'tabaquismo': 'No', 'colesterol_total': 200.0,
+    'colesterol_hdl': 50.0, 'riesgo_cardiovascular_score': 4.2,
+    'riesgo_cardiovascular_framingham': 4.2, 'clasificacion_riesgo': 'Bajo'
+}
+EXAMENES = [{'tipo_examen': 'Perfil Lipídico', 'indicacion': 'Ayunas'},
+            {'tipo_examen': 'RX Tórax', 'indicacion': 'PA y lateral'}]
+RECETAS = [{'medicamento': f'Medicamento {i}', 'dosis': '1 tab', 'frecuencia': 'Cada 12h',
+            'duracion': '30 días', 'indicaciones_adicionales': ''} for i in range(12)]
+
+
+def guardar_por_partes(paciente_id):
+    # Secuencia que usaba hce.py antes de save_consulta
+    hce_id = db.create_hce_comun(paciente_id=paciente_id, medico_id=1, **CONSULTA)
+    db.create_hce_adulto(hce_comun_id=hce_id, **DETALLE)
+    db.update_paciente_sexo(paciente_id, 'Masculino')
+    for ex in EXAMENES:
+        db.create_indicacion_examen(hce_id, ex['tipo_examen'], ex['indicacion'])
+    for rx in RECETAS:
+        db.create_receta(hce_id, rx['medicamento'], rx['dosis'], rx['frecuencia'], rx['duracion'], rx['indicaciones_adicionales'])
+
+
+def guardar_atomico(paciente_id):
+    db.save_consulta(paciente_id, 1, CONSULTA, 'adulto', DETALLE, EXAMENES, RECETAS, sexo='Masculino')
+
+
+def medir(fn, paciente_id, iteraciones):
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        fn(paciente_id)
+    return (time.perf_counter() - inicio) / iteraciones * 1000
+
+
+def main():
+    iteraciones = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        paciente_id = db.create_paciente('Paciente Benchmark', '1970-01-01', False, '555', '')
+
+        antes = medir(guardar_por_partes, paciente_id, iteraciones)
+        despues = medir(guardar_atomico, paciente_id, iteraciones)
+        db.close_pool()
+
+    print(f"Iteraciones: {iteraciones} (12 recetas, 2 exámenes)")
+    print(f"Llamadas independientes : {antes:7.3f} ms/consulta")
+    print(f"save_consulta()         : {despues:7.3f} ms/consulta")
+    print(f"Mejora                  : {antes / despues:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark de carga de la historia clínica de un paciente con 200 visitas:
+una consulta por visita para exámenes y recetas (N+1) vs. get_historia_completa().
+
+Uso:
+    python benchmarks/bench_historia_completa.py [visitas] [iteraciones]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+CONSULTA = {
+    'motivo_consulta': 'Control', 'diagnostico': 'HTA grado I', 'fc': 80, 'ta_sistolica': 140,
+    'ta_diastolica': 90, 'sato2': 98.0, 'observaciones': ''
+}
+DETALLE = {
+    'tiene_hta': True, 'tiene_diabetes': False, 'tabaquismo': 'No', 'colesterol_total': 200.0,
+    'colesterol_hdl': 50.0, 'riesgo_cardiovascular_score': 4.2,
+    'riesgo_cardiovascular_framingham': 4.2, 'clasificacion_riesgo': 'Bajo'
+}
+EXAMENES = [{'tipo_examen': 'Perfil Lipídico', 'indicacion': 'Ayunas'}]
+RECETAS = [{'medicamento': f'Medicamento {i}', 'dosis': '1 tab', 'frecuencia': 'Diaria',
+            'duracion': '30 días', 'indicaciones_adicionales': ''} for i in range(3)]
+
+
+def historia_n_mas_1(paciente_id):
+    # Patrón previo: listado de consultas y luego exámenes y recetas de cada una
+    historial = db.get_hce_by_paciente(paciente_id)
+    for registro in historial:
+        registro['indicaciones'] = db.get_indicaciones_by_hce(registro['id'])
+        registro['recetas'] = db.get_recetas_by_hce(registro['id'])
+    return historial
+
+
+def medir(fn, paciente_id, iteraciones):
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        fn(paciente_id)
+    return (time.perf_counter() - inicio) / iteraciones * 1000
+
+
+def main():
+    visitas = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    iteraciones = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        paciente_id = db.create_paciente('Paciente Benchmark', '1960-01-01', False, '555', '')
+        for i in range(visitas):
+            consulta = dict(CONSULTA, fecha_consulta=f'2010-01-01 10:00:{i % 60:02d}')
+            db.save_consulta(paciente_id, 1, consulta, 'adulto', DETALLE, EXAMENES, RECETAS)
+
+        antes = medir(historia_n_mas_1, paciente_id, iteraciones)
+        despues = medir(db.get_historia_completa, paciente_id, iteraciones)
+        db.close_pool()
+
+    print(f"Paciente con {visitas} visitas ({iteraciones} iteraciones)")
+    print(f"N+1 (sin detalle infantil/adulto) : {antes:7.2f} ms  ({1 + 2 * visitas} consultas SQL)")
+    print(f"get_historia_completa() (completo): {despues:7.2f} ms  (5 consultas SQL)")
+    print(f"Mejora                            : {antes / despues:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
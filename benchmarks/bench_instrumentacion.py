@@ -0,0 +1,68 @@
+"""
+Costo de la instrumentación de database.py (metricas.py) por llamada.
+
+Compara la misma función con y sin envoltura:
+  - una función vacía (el costo puro de la envoltura);
+  - get_medico, que responde desde la caché de referencia (una llamada muy barata);
+  - get_paciente, que hace una consulta real sobre SQLite.
+
+Uso:
+    python benchmarks/bench_instrumentacion.py [repeticiones]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backends
+import database as db
+import metricas
+
+
+def medir(fn, repeticiones, *args):
+    for _ in range(min(repeticiones, 1000)):
+        fn(*args)
+    mejor = float('inf')
+    for _ in range(5):
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            fn(*args)
+        mejor = min(mejor, (time.perf_counter() - inicio) / repeticiones)
+    return mejor * 1e6  # µs por llamada
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    metricas.SLOW_QUERY_LOG = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_NAME = os.path.join(tmp, 'bench.db')
+        db.init_db()
+        db.create_medico_con_usuario('Dra. Benchmark', 'Cardiología', 'b@x', 'bench', 'x')
+        medico_id = db.get_all_medicos()[0]['id']
+        paciente_id = db.create_paciente('Paciente Benchmark', '1970-01-01', False, '555', '')
+
+        def vacia():
+            return None
+
+        casos = [
+            ("función vacía", vacia, metricas.instrumentar(vacia), ()),
+            ("get_medico (caché)", db.get_medico.__wrapped__, db.get_medico, (medico_id,)),
+            ("get_paciente (SQLite)", db.get_paciente.__wrapped__, db.get_paciente, (paciente_id,)),
+        ]
+        print(f"{repeticiones} llamadas por caso, mejor de 5")
+        for nombre, base, instrumentada, args in casos:
+            # Sin instrumentar tampoco se observan las sentencias
+            backends.observador_sql = None
+            t_base = medir(base, repeticiones, *args)
+            backends.observador_sql = metricas._anotar_sql
+            t_inst = medir(instrumentada, repeticiones, *args)
+            print(f"{nombre:24}: {t_base:7.2f} µs -> {t_inst:7.2f} µs  (+{t_inst - t_base:.2f} µs por llamada)")
+        db.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark de memoria al exportar una tabla grande de citas a CSV:
+fetchall() + lista de dicts (patrón anterior) vs. iter_citas() en streaming.
+
+Cada modo se ejecuta en un subproceso aparte y se reporta el pico de memoria
+de Python (tracemalloc) y el RSS máximo, para que un modo no contamine la
+medición del otro. El RSS incluye las páginas de la DB mapeadas en memoria
+(PRAGMA mmap_size), que el sistema operativo acota y puede liberar.
+
+Uso:
+    python benchmarks/bench_memoria_streaming.py [filas]   (por defecto 1000000)
+"""
+
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+
+def poblar(n, semilla=42):
+    rnd = random.Random(semilla)
+    estados = ['Pendiente', 'Completada', 'No-show', 'Llegó']
+    filas = ((rnd.randint(1, 50_000), rnd.randint(1, 4),
+              f"20{rnd.randint(15, 24)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} {rnd.randint(8, 17):02d}:00:00",
+              rnd.choice(estados))
+             for _ in range(n))
+    with db.db_connection() as conn:
+        conn.executemany("INSERT INTO citas (paciente_id, medico_id, fecha_hora, estado) VALUES (?, ?, ?, ?)", filas)
+
+
+def exportar_materializando(destino):
+    with db.db_connection() as conn:
+        rows = conn.execute("SELECT * FROM citas ORDER BY fecha_hora").fetchall()
+    citas = [dict(row) for row in rows]
+    return db.exportar_csv(citas, destino)
+
+
+def ejecutar_modo(modo, ruta_db):
+    db.DB_NAME = ruta_db
+    db.init_db()
+    destino = ruta_db + f'.{modo}.csv'
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    if modo == 'materializado':
+        filas = exportar_materializando(destino)
+    else:
+        filas = db.exportar_csv(db.iter_citas(), destino)
+    segundos = time.perf_counter() - inicio
+    pico_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    # ru_maxrss está en KiB en Linux
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{modo:<14}{filas:>12,}{segundos:>10.1f}{pico_mb:>18.1f}{rss_mb:>14.1f}")
+
+
+def main():
+    if len(sys.argv) == 4 and sys.argv[1] == '--modo':
+        ejecutar_modo(sys.argv[2], sys.argv[3])
+        return
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta_db = os.path.join(tmp, 'bench.db')
+        db.DB_NAME = ruta_db
+        db.init_db()
+        poblar(n)
+        db.close_pool()
+
+        print(f"{'modo':<14}{'filas':>12}{'seg':>10}{'pico Python (MB)':>18}{'RSS máx (MB)':>14}")
+        for modo in ('materializado', 'streaming'):
+            subprocess.run([sys.executable, __file__, '--modo', modo, ruta_db], check=True)
+
+
+if __name__ == '__main__':
+    main()
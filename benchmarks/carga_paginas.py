@@ -0,0 +1,293 @@
+"""
+Prueba de carga por página con streamlit.testing.v1.AppTest sobre el dataset
+sintético (datos_sinteticos.py, con "hoy" como fecha de referencia para que
+la agenda y los dashboards del día tengan datos).
+
+1. Latencia: inicia sesión por el formulario como admin y como médico, recorre
+   cada página del menú de app.py y reporta por página la latencia del rerun
+   (p50/p95), las sentencias SQL y llamadas a database.py por rerun y el pico
+   de memoria de Python (tracemalloc, en una pasada aparte para no inflar las
+   latencias).
+2. Concurrencia: N sesiones simuladas recorren las páginas a la vez contra
+   la misma base; se reporta el throughput de reruns y el punto donde deja
+   de escalar. AppTest no admite sesiones en hilos de un mismo proceso, así
+   que cada sesión corre en su propio proceso: mide la contención en la base
+   y la CPU, no el GIL que comparten las sesiones de un servidor Streamlit.
+
+Uso:
+    python benchmarks/carga_paginas.py [escala] [--repeticiones 20] [--sesiones 1,2,4,8,16] [--json salida.json]
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import date
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from streamlit.testing.v1 import AppTest
+
+import backends
+import database as db
+import datos_sinteticos
+import metricas
+
+APP = os.path.join(RAIZ, 'app.py')
+TIMEOUT = 120
+
+# Interacción que hace cada página útil: sin texto, los buscadores no consultan nada
+ACCIONES = {
+    'Buscador Historial': ('búsqueda', lambda at: at.text_input[0].set_value('maria gonzalez')),
+    'Buscador Clínico': ('búsqueda', lambda at: at.text_input[0].set_value('soplo sistolico')),
+}
+
+# Un rerun con una mejora de throughput menor a esta se considera saturado
+UMBRAL_ESCALADO = 1.10
+
+
+class ContadorSQL:
+    """Cuenta las sentencias que ejecutan los backends (encadena al observador previo)."""
+
+    def __init__(self):
+        self.total = 0
+        self._siguiente = backends.observador_sql
+        self._lock = threading.Lock()
+
+    def __call__(self, sql):
+        with self._lock:
+            self.total += 1
+        if self._siguiente is not None:
+            self._siguiente(sql)
+
+
+def _llamadas_db():
+    return sum(r['llamadas'] for r in metricas.get_resumen_funciones())
+
+
+def _silenciar_streamlit():
+    # Avisos que Streamlit registra en cada rerun fuera de un servidor real
+    for nombre in ('streamlit.deprecation_util', 'streamlit.runtime.scriptrunner_utils.script_run_context'):
+        logging.getLogger(nombre).disabled = True
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0.0
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def preparar_datos(escala, directorio):
+    """Genera (o reutiliza) la base sintética de la escala con fecha de referencia hoy."""
+    hoy = date.today()
+    ruta = os.path.join(directorio, f"carga-{escala}-{datos_sinteticos.SEMILLA}-{hoy}-v{db.SCHEMA_VERSION}.db")
+    db.DB_NAME = ruta
+    if not os.path.exists(ruta):
+        db.DB_NAME = ruta + '.tmp'
+        db.init_db()
+        print(f"Generando datos sintéticos ({escala})...")
+        datos_sinteticos.generar(**datos_sinteticos.ESCALAS[escala], referencia=hoy)
+        db.close_pool()
+        os.replace(db.DB_NAME, ruta)
+        db.DB_NAME = ruta
+    db.init_db()
+    with db.db_connection() as conn:
+        medico_id = conn.execute("SELECT min(id) FROM medicos").fetchone()[0]
+    return [('admin', 'admin', 'admin123'), ('médico', f"medico{medico_id}", f"medico{medico_id}")]
+
+
+def iniciar_sesion(usuario, clave):
+    at = AppTest.from_file(APP, default_timeout=TIMEOUT)
+    at.run()
+    at.text_input[0].set_value(usuario)
+    at.text_input[1].set_value(clave)
+    at.button[0].click().run()
+    if not at.session_state['logged_in']:
+        raise RuntimeError(f"No se pudo iniciar sesión como {usuario}")
+    return at
+
+
+def _rerun(at, preparar=None):
+    if preparar:
+        preparar(at)
+    inicio = time.perf_counter()
+    at.run()
+    segundos = time.perf_counter() - inicio
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+    return segundos
+
+
+def _pasos(at):
+    """(página, etapa, función que prepara el rerun) de un recorrido por todo el menú."""
+    pasos = []
+    for pagina in at.sidebar.radio[0].options:
+        pasos.append((pagina, 'navegación', lambda at, p=pagina: at.sidebar.radio[0].set_value(p)))
+        if pagina in ACCIONES:
+            etapa, accion = ACCIONES[pagina]
+            pasos.append((pagina, etapa, accion))
+    return pasos
+
+
+def medir_latencias(usuarios, repeticiones):
+    contador = ContadorSQL()
+    backends.observador_sql = contador
+    filas = []
+    try:
+        for rol, usuario, clave in usuarios:
+            at = iniciar_sesion(usuario, clave)
+            muestras = {}
+            for _ in range(repeticiones):
+                for pagina, etapa, preparar in _pasos(at):
+                    if etapa == 'navegación':
+                        at.sidebar.radio[0].set_value(at.sidebar.radio[0].options[0]).run()  # salir y volver
+                    sql, llamadas = contador.total, _llamadas_db()
+                    segundos = _rerun(at, preparar)
+                    m = muestras.setdefault((pagina, etapa), {'tiempos': [], 'sql': [], 'llamadas': []})
+                    m['tiempos'].append(segundos)
+                    m['sql'].append(contador.total - sql)
+                    m['llamadas'].append(_llamadas_db() - llamadas)
+
+            # Pico de memoria en una pasada aparte: tracemalloc hace todo más lento
+            tracemalloc.start()
+            for pagina, etapa, preparar in _pasos(at):
+                if etapa == 'navegación':
+                    at.sidebar.radio[0].set_value(at.sidebar.radio[0].options[0]).run()
+                tracemalloc.reset_peak()
+                _rerun(at, preparar)
+                muestras[(pagina, etapa)]['pico_mb'] = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+
+            for (pagina, etapa), m in muestras.items():
+                filas.append({
+                    'rol': rol, 'pagina': pagina, 'etapa': etapa,
+                    'p50_ms': percentil(m['tiempos'], 50) * 1000,
+                    'p95_ms': percentil(m['tiempos'], 95) * 1000,
+                    'sql_por_rerun': statistics.mean(m['sql']),
+                    'llamadas_db_por_rerun': statistics.mean(m['llamadas']),
+                    'pico_mb': m['pico_mb'],
+                })
+    finally:
+        backends.observador_sql = contador._siguiente
+    return filas
+
+
+def _sesion(db_name, usuario, clave, vueltas, listas, resultados):
+    # Proceso de una sesión simulada: login, espera al resto y recorre las páginas
+    _silenciar_streamlit()
+    metricas.SLOW_QUERY_LOG = None
+    db.DB_NAME = db_name
+    tiempos, errores = [], []
+    try:
+        at = iniciar_sesion(usuario, clave)
+        pasos = _pasos(at)
+    except Exception as e:
+        errores.append(str(e))
+        pasos = []
+    listas.wait()  # todas las sesiones empiezan a navegar a la vez
+    for _ in range(vueltas):
+        for _, _, preparar in pasos:
+            try:
+                tiempos.append(_rerun(at, preparar))
+            except Exception as e:
+                errores.append(str(e))
+    resultados.put((tiempos, errores))
+
+
+def medir_concurrencia(usuarios, sesiones, vueltas):
+    # AppTest mantiene un Runtime de Streamlit global por proceso y no admite
+    # varias sesiones en hilos del mismo proceso: cada sesión es un proceso.
+    # Con fork (no spawn): AppTest reemplaza __main__ por app.py y spawn lo reimportaría
+    ctx = multiprocessing.get_context('fork')
+    db.close_pool()  # los procesos hijos abren sus propias conexiones
+    resultados = []
+    for n in sesiones:
+        listas = ctx.Barrier(n + 1)
+        cola = ctx.Queue()
+        procesos = [ctx.Process(target=_sesion, args=(db.DB_NAME, *usuarios[i % len(usuarios)][1:], vueltas,
+                                                      listas, cola))
+                    for i in range(n)]
+        for p in procesos:
+            p.start()
+        listas.wait()
+        inicio = time.perf_counter()
+        tiempos, errores = [], []
+        for _ in procesos:
+            propios, fallos = cola.get()
+            tiempos += propios
+            errores += fallos
+        segundos = time.perf_counter() - inicio
+        for p in procesos:
+            p.join()
+        resultados.append({
+            'sesiones': n,
+            'reruns_s': len(tiempos) / segundos if segundos else 0.0,
+            'p50_ms': percentil(tiempos, 50) * 1000,
+            'p95_ms': percentil(tiempos, 95) * 1000,
+            'errores': len(errores),
+            'ejemplo_error': errores[0] if errores else '',
+        })
+    return resultados
+
+
+def punto_de_saturacion(concurrencia):
+    """Primer número de sesiones a partir del cual el throughput ya no mejora UMBRAL_ESCALADO."""
+    for anterior, actual in zip(concurrencia, concurrencia[1:]):
+        if actual['reruns_s'] < anterior['reruns_s'] * UMBRAL_ESCALADO:
+            return anterior['sesiones']
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia y concurrencia por página con AppTest")
+    parser.add_argument('escala', nargs='?', default='pequeña', choices=list(datos_sinteticos.ESCALAS))
+    parser.add_argument('--repeticiones', type=int, default=10, help="Recorridos por rol para la latencia")
+    parser.add_argument('--sesiones', default='1,2,4,8,16', help="Sesiones concurrentes a probar")
+    parser.add_argument('--vueltas', type=int, default=3, help="Recorridos por sesión concurrente")
+    parser.add_argument('--datos', default=os.path.join(RAIZ, '.benchmarks', 'datos'),
+                        help="Directorio donde se guardan las bases sintéticas")
+    parser.add_argument('--json', help="Guarda los resultados en este archivo")
+    args = parser.parse_args()
+
+    _silenciar_streamlit()
+    os.makedirs(args.datos, exist_ok=True)
+    metricas.SLOW_QUERY_LOG = None
+    usuarios = preparar_datos(args.escala, args.datos)
+
+    latencias = medir_latencias(usuarios, args.repeticiones)
+    print(f"\nLatencia por página ({args.escala}, {args.repeticiones} repeticiones)")
+    print(f"{'rol':7} {'página':24} {'etapa':11} {'p50 ms':>8} {'p95 ms':>8} {'SQL':>6} {'db.*':>6} {'pico MB':>8}")
+    for f in latencias:
+        print(f"{f['rol']:7} {f['pagina']:24} {f['etapa']:11} {f['p50_ms']:8.1f} {f['p95_ms']:8.1f} "
+              f"{f['sql_por_rerun']:6.1f} {f['llamadas_db_por_rerun']:6.1f} {f['pico_mb']:8.1f}")
+
+    sesiones = [int(s) for s in args.sesiones.split(',') if s]
+    concurrencia = medir_concurrencia(usuarios, sesiones, args.vueltas)
+    print(f"\nSesiones concurrentes ({args.vueltas} recorridos por sesión)")
+    print(f"{'sesiones':>8} {'reruns/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'errores':>8}")
+    for r in concurrencia:
+        print(f"{r['sesiones']:8} {r['reruns_s']:9.1f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['errores']:8}")
+        if r['ejemplo_error']:
+            print(f"{'':8} p. ej.: {r['ejemplo_error']}")
+    saturacion = punto_de_saturacion(concurrencia)
+    if saturacion:
+        print(f"\nEl throughput deja de escalar a partir de {saturacion} sesión(es).")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'escala': args.escala, 'fecha': date.today().isoformat(), 'latencias': latencias,
+                       'concurrencia': concurrencia, 'saturacion': saturacion}, f, ensure_ascii=False, indent=2)
+    db.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,286 @@
+"""
+Generador determinista de datos sintéticos para benchmarks y pruebas de carga.
+
+Con la misma semilla, escala y fecha de referencia produce exactamente las
+mismas filas: pacientes (≈20 % pediátricos), médicos con usuario de login,
+citas en horario hábil de los últimos años y las próximas semanas, consultas
+con su detalle pediátrico o adulto, exámenes y recetas. Las consultas se
+enlazan a citas completadas mientras haya; el resto queda sin cita.
+
+Las filas se insertan por lotes con executemany, con ids explícitos a
+continuación de los existentes, así los enlaces entre tablas no dependen de
+los autoincrementales. Los triggers del resumen diario y de búsqueda de texto
+completo se mantienen como en producción.
+
+Uso:
+    python benchmarks/datos_sinteticos.py destino.db [escala] [semilla]
+    python benchmarks/datos_sinteticos.py destino.db --pacientes 200000 --citas 2000000 --consultas 500000
+
+Los médicos generados entran con usuario y contraseña medicoN (N = id del médico).
+"""
+
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+
+ESCALAS = {
+    'pequeña': {'medicos': 10, 'pacientes': 2_000, 'citas': 20_000, 'consultas': 5_000},
+    'mediana': {'medicos': 20, 'pacientes': 20_000, 'citas': 200_000, 'consultas': 50_000},
+    'completa': {'medicos': 40, 'pacientes': 200_000, 'citas': 2_000_000, 'consultas': 500_000},
+}
+
+SEMILLA = 2024
+REFERENCIA = date(2025, 6, 30)  # "hoy" de los datos; fija para que sean reproducibles
+AÑOS_HISTORIA = 3
+DIAS_FUTURO = 30
+LOTE = 10_000
+
+NOMBRES = ['Juan', 'María', 'José', 'Ana', 'Luis', 'Carmen', 'Carlos', 'Rosa', 'Jorge', 'Elena',
+           'Pedro', 'Lucía', 'Miguel', 'Sofía', 'Diego', 'Valentina', 'Andrés', 'Camila', 'Javier',
+           'Isabel', 'Fernando', 'Paula', 'Ricardo', 'Gabriela', 'Tomás', 'Martina', 'Raúl', 'Inés']
+APELLIDOS = ['González', 'Rodríguez', 'Pérez', 'Fernández', 'López', 'Martínez', 'Sánchez', 'Gómez',
+             'Díaz', 'Torres', 'Ramírez', 'Flores', 'Rojas', 'Muñoz', 'Vargas', 'Castro', 'Herrera',
+             'Núñez', 'Jiménez', 'Morales', 'Ortiz', 'Silva', 'Romero', 'Álvarez', 'Reyes', 'Medina']
+ESPECIALIDADES = ['Cardiología', 'Cardiología Pediátrica', 'Electrofisiología', 'Ecocardiografía']
+
+MOTIVOS = ['Control', 'Dolor torácico', 'Palpitaciones', 'Disnea de esfuerzo', 'Soplo cardíaco',
+           'Síncope', 'Hipertensión arterial', 'Control post-operatorio', 'Evaluación prequirúrgica']
+DIAGNOSTICOS = ['HTA grado I', 'HTA grado II', 'Fibrilación auricular', 'Insuficiencia cardíaca',
+                'Cardiopatía isquémica', 'Sin hallazgos patológicos', 'Extrasistolia ventricular',
+                'Estenosis aórtica leve', 'Insuficiencia mitral moderada']
+DIAGNOSTICOS_PEDIATRICOS = ['Soplo inocente', 'CIA ostium secundum', 'CIV perimembranosa',
+                            'Ductus arterioso persistente', 'Foramen oval permeable',
+                            'Sin hallazgos patológicos', 'Taquicardia supraventricular']
+EF_CARDIO = ['Ruidos cardíacos rítmicos, sin soplos', 'Soplo sistólico II/VI en foco mitral',
+             'Soplo sistólico eyectivo en foco pulmonar', 'Arritmia completa', 'R2 desdoblado fijo']
+ECG = ['Ritmo sinusal', 'Ritmo sinusal, HVI', 'Fibrilación auricular', 'Bloqueo de rama derecha',
+       'Extrasístoles ventriculares aisladas']
+ECO = ['FEVI conservada', 'FEVI 40%', 'Hipertrofia concéntrica del VI', 'Shunt izquierda-derecha',
+       'Válvulas sin alteraciones']
+EXAMENES = ['Laboratorio Completo', 'Perfil Lipídico', 'RX Tórax', 'Prueba de Esfuerzo', 'MAPA 24h',
+            'RNM Cardíaca', 'Holter 24h', 'Ecocardiograma']
+MEDICAMENTOS = [('Enalapril', '10 mg'), ('Losartán', '50 mg'), ('Atorvastatina', '20 mg'),
+                ('Ácido acetilsalicílico', '100 mg'), ('Bisoprolol', '5 mg'), ('Furosemida', '40 mg'),
+                ('Apixabán', '5 mg'), ('Amlodipino', '5 mg'), ('Propranolol', '1 mg/kg')]
+FRECUENCIAS = ['Cada 24 horas', 'Cada 12 horas', 'Cada 8 horas']
+DURACIONES = ['30 días', '90 días', 'Indefinido']
+DUCTUS = ['Cerrado', 'Abierto', 'Restrictivo']
+TABAQUISMO = ['No', 'Activo', 'Ex-fumador']
+RIESGOS = ['Bajo', 'Moderado', 'Alto', 'Muy Alto']
+
+# Estado de las citas pasadas (las futuras quedan Pendiente)
+ESTADOS_PASADOS = ['Completada'] * 78 + ['No-show'] * 14 + ['Llegó'] * 3 + ['Pendiente'] * 5
+
+# Horas de atención: turnos de 20 minutos de 08:00 a 17:40
+TURNOS = [f"{h:02d}:{m:02d}:00" for h in range(8, 18) for m in (0, 20, 40)]
+# Hora de fin de cada turno (duración por defecto de database.py)
+FIN_TURNO = {t: f"{(int(t[:2]) * 60 + int(t[3:5]) + db.DURACION_CITA) // 60:02d}:"
+                f"{(int(t[3:5]) + db.DURACION_CITA) % 60:02d}:00" for t in TURNOS}
+
+
+def _siguiente_id(conn, tabla):
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {tabla}").fetchone()[0] + 1
+
+
+def _insertar(tabla, columnas, filas):
+    if not filas:
+        return
+    marcas = ', '.join('?' * len(columnas))
+    with db.db_connection() as conn:
+        conn.executemany(f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({marcas})", filas)
+    filas.clear()
+
+
+def _dias_habiles(desde, hasta):
+    dias = []
+    dia = desde
+    while dia <= hasta:
+        if dia.weekday() < 5:
+            dias.append(dia.isoformat())
+        dia += timedelta(days=1)
+    return dias
+
+
+def generar(medicos=10, pacientes=2_000, citas=20_000, consultas=5_000, semilla=SEMILLA,
+            referencia=REFERENCIA, lote=LOTE, progreso=None):
+    """
+    Inserta los datos sintéticos en la base configurada en database.py (que
+    debe estar inicializada). Retorna la cantidad de filas creadas por tabla.
+    progreso(tabla, filas), si se indica, se llama al terminar cada tabla.
+    """
+    rng = random.Random(semilla)
+    avisar = progreso or (lambda tabla, filas: None)
+
+    with db.db_connection() as conn:
+        ids = {t: _siguiente_id(conn, t) for t in ('usuarios', 'medicos', 'pacientes', 'citas', 'hce_comun',
+                                                  'hce_infantil', 'hce_adulto', 'indicaciones_examenes',
+                                                  'recetas_medicas')}
+
+    # Médicos, cada uno con su usuario de login
+    usuarios, filas_medicos = [], []
+    for i in range(medicos):
+        medico_id, user_id = ids['medicos'] + i, ids['usuarios'] + i
+        nombre = f"Dr(a). {rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}"
+        usuarios.append((user_id, f"medico{medico_id}", f"medico{medico_id}", 'medico'))
+        filas_medicos.append((medico_id, nombre, rng.choice(ESPECIALIDADES), f"medico{medico_id}@clinica.test",
+                              user_id))
+    _insertar('usuarios', ('id', 'username', 'password', 'rol'), usuarios)
+    _insertar('medicos', ('id', 'nombre', 'especialidad', 'email', 'user_id'), filas_medicos)
+    db.invalidate_reference_cache()
+    avisar('medicos', medicos)
+    ids_medicos = range(ids['medicos'], ids['medicos'] + medicos)
+
+    # Pacientes: se recuerda cuáles son pediátricos para el detalle de sus consultas
+    pediatricos = bytearray(pacientes)
+    # created_at fijo: con el valor por defecto (hora actual) dos corridas no serían idénticas
+    registro = f"{referencia} 00:00:00"
+    columnas_pacientes = ('id', 'nombre', 'fecha_nacimiento', 'sexo', 'es_pediatrico', 'contacto', 'tutor_legal',
+                          'created_at')
+    filas = []
+    for i in range(pacientes):
+        es_pediatrico = rng.random() < 0.2
+        pediatricos[i] = es_pediatrico
+        edad_dias = rng.randrange(30, 17 * 365) if es_pediatrico else rng.randrange(18 * 365, 90 * 365)
+        nombre = f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}"
+        tutor = f"{rng.choice(NOMBRES)} {nombre.split(' ', 1)[1]}" if es_pediatrico else ''
+        filas.append((ids['pacientes'] + i, nombre, (referencia - timedelta(days=edad_dias)).isoformat(),
+                      rng.choice(('Masculino', 'Femenino')), int(es_pediatrico),
+                      str(rng.randrange(600_000_000, 1_000_000_000)), tutor, registro))
+        if len(filas) >= lote:
+            _insertar('pacientes', columnas_pacientes, filas)
+    _insertar('pacientes', columnas_pacientes, filas)
+    avisar('pacientes', pacientes)
+
+    # Citas y consultas: las citas completadas se convierten en consulta con
+    # la probabilidad justa para repartir `consultas` sobre toda la historia
+    dias_pasados = _dias_habiles(referencia - timedelta(days=365 * AÑOS_HISTORIA), referencia - timedelta(days=1))
+    dias_futuros = _dias_habiles(referencia, referencia + timedelta(days=DIAS_FUTURO))
+    fraccion_futuras = len(dias_futuros) / (len(dias_pasados) + len(dias_futuros))
+    completadas_esperadas = citas * (1 - fraccion_futuras) * ESTADOS_PASADOS.count('Completada') / len(ESTADOS_PASADOS)
+    prob_consulta = min(1.0, consultas / completadas_esperadas) if completadas_esperadas else 0.0
+
+    contador = {'citas': 0, 'hce_comun': 0, 'hce_infantil': 0, 'hce_adulto': 0,
+                'indicaciones_examenes': 0, 'recetas_medicas': 0}
+    pendientes = {t: [] for t in contador}
+    columnas = {
+        'citas': ('id', 'paciente_id', 'medico_id', 'fecha_hora', 'duracion_min', 'fecha_hora_fin', 'estado'),
+        'hce_comun': ('id', 'paciente_id', 'medico_id', 'cita_id', 'fecha_consulta', 'motivo_consulta',
+                      'diagnostico', 'fc', 'ta_sistolica', 'ta_diastolica', 'sato2', 'ef_general', 'ef_cardio',
+                      'ef_respiratorio', 'ef_otros', 'ecg_hallazgos', 'echo_hallazgos', 'observaciones'),
+        'hce_infantil': ('id', 'hce_comun_id', 'peso_kg', 'talla_cm', 'percentil_peso', 'percentil_talla',
+                         'zscore_aortico', 'zscore_pulmonar', 'zscore_mitral', 'zscore_tricuspide',
+                         'ductus_estado', 'ductus_tamano_mm'),
+        'hce_adulto': ('id', 'hce_comun_id', 'tiene_hta', 'tiene_diabetes', 'tabaquismo', 'colesterol_total',
+                       'colesterol_hdl', 'riesgo_cardiovascular_score', 'riesgo_cardiovascular_framingham',
+                       'clasificacion_riesgo'),
+        'indicaciones_examenes': ('id', 'hce_id', 'tipo_examen', 'indicacion'),
+        'recetas_medicas': ('id', 'hce_id', 'medicamento', 'dosis', 'frecuencia', 'duracion',
+                            'indicaciones_adicionales'),
+    }
+
+    def agregar(tabla, fila):
+        contador[tabla] += 1
+        pendientes[tabla].append(fila)
+        if len(pendientes[tabla]) >= lote:
+            # Los padres van antes que los hijos para que los ids referenciados ya existan
+            for t in columnas:
+                _insertar(t, columnas[t], pendientes[t])
+
+    def consulta(paciente_idx, medico_id, cita_id, fecha_hora):
+        hce_id = ids['hce_comun'] + contador['hce_comun']
+        pediatrico = pediatricos[paciente_idx]
+        agregar('hce_comun', (
+            hce_id, ids['pacientes'] + paciente_idx, medico_id, cita_id, fecha_hora, rng.choice(MOTIVOS),
+            rng.choice(DIAGNOSTICOS_PEDIATRICOS if pediatrico else DIAGNOSTICOS),
+            rng.randrange(60, 140) if pediatrico else rng.randrange(50, 110),
+            rng.randrange(90, 180), rng.randrange(50, 110), round(rng.uniform(90, 100), 1),
+            'Buen estado general', rng.choice(EF_CARDIO), 'Murmullo vesicular conservado', '',
+            rng.choice(ECG), rng.choice(ECO), ''))
+        if pediatrico:
+            ductus = rng.choice(DUCTUS)
+            agregar('hce_infantil', (
+                ids['hce_infantil'] + contador['hce_infantil'], hce_id, round(rng.uniform(3, 70), 1),
+                round(rng.uniform(50, 180), 1), rng.randrange(3, 98), rng.randrange(3, 98),
+                *(round(rng.gauss(0, 1.2), 2) for _ in range(4)), ductus,
+                round(rng.uniform(1, 6), 1) if ductus != 'Cerrado' else None))
+        else:
+            agregar('hce_adulto', (
+                ids['hce_adulto'] + contador['hce_adulto'], hce_id, int(rng.random() < 0.4),
+                int(rng.random() < 0.15), rng.choice(TABAQUISMO), round(rng.uniform(140, 300)),
+                round(rng.uniform(30, 80)), round(rng.uniform(0.5, 25), 1), round(rng.uniform(1, 35), 1),
+                rng.choice(RIESGOS)))
+        for examen in rng.sample(EXAMENES, rng.randrange(0, 3)):
+            agregar('indicaciones_examenes', (
+                ids['indicaciones_examenes'] + contador['indicaciones_examenes'], hce_id, examen, 'Ayunas'))
+        for medicamento, dosis in rng.sample(MEDICAMENTOS, rng.randrange(0, 3)):
+            agregar('recetas_medicas', (
+                ids['recetas_medicas'] + contador['recetas_medicas'], hce_id, medicamento, dosis,
+                rng.choice(FRECUENCIAS), rng.choice(DURACIONES), ''))
+
+    for i in range(citas):
+        cita_id = ids['citas'] + i
+        paciente_idx = rng.randrange(pacientes)
+        medico_id = rng.choice(ids_medicos)
+        futura = rng.random() < fraccion_futuras
+        dia = rng.choice(dias_futuros if futura else dias_pasados)
+        turno = rng.choice(TURNOS)
+        fecha_hora = f"{dia} {turno}"
+        estado = 'Pendiente' if futura else rng.choice(ESTADOS_PASADOS)
+        agregar('citas', (cita_id, ids['pacientes'] + paciente_idx, medico_id, fecha_hora, db.DURACION_CITA,
+                          f"{dia} {FIN_TURNO[turno]}", estado))
+        if estado == 'Completada' and contador['hce_comun'] < consultas and rng.random() < prob_consulta:
+            consulta(paciente_idx, medico_id, cita_id, fecha_hora)
+
+    # Consultas que no alcanzaron a salir de citas: sin cita asociada
+    while contador['hce_comun'] < consultas:
+        fecha_hora = f"{rng.choice(dias_pasados)} {rng.choice(TURNOS)}"
+        consulta(rng.randrange(pacientes), rng.choice(ids_medicos), None, fecha_hora)
+
+    for t in columnas:
+        _insertar(t, columnas[t], pendientes[t])
+    for t in columnas:
+        avisar(t, contador[t])
+
+    if db.DB_BACKEND == 'postgres':
+        # Con ids explícitos las secuencias IDENTITY no avanzan solas
+        with db.db_connection() as conn:
+            for tabla in ids:
+                conn.execute(f"SELECT setval(pg_get_serial_sequence('{tabla}', 'id'), "
+                             f"(SELECT COALESCE(MAX(id), 1) FROM {tabla}))")
+
+    return {'usuarios': medicos, 'medicos': medicos, 'pacientes': pacientes, **contador}
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Genera datos sintéticos deterministas")
+    parser.add_argument('destino', help="Archivo SQLite a crear o completar")
+    parser.add_argument('escala', nargs='?', default='completa', choices=list(ESCALAS))
+    parser.add_argument('semilla', nargs='?', type=int, default=SEMILLA)
+    for campo in ('medicos', 'pacientes', 'citas', 'consultas'):
+        parser.add_argument(f'--{campo}', type=int, help="Reemplaza el valor de la escala")
+    parser.add_argument('--referencia', type=date.fromisoformat, default=REFERENCIA,
+                        help="Fecha 'hoy' de los datos (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    tamaños = dict(ESCALAS[args.escala])
+    tamaños.update({k: v for k in tamaños if (v := getattr(args, k)) is not None})
+
+    db.DB_NAME = args.destino
+    db.init_db()
+    inicio = time.perf_counter()
+    generar(**tamaños, semilla=args.semilla, referencia=args.referencia,
+            progreso=lambda tabla, filas: print(f"{tabla:22}: {filas:>10,} filas "
+                                                f"({time.perf_counter() - inicio:.1f} s)"))
+    db.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+"""
+Suite de benchmarks (pytest-benchmark) de la capa de datos sobre el dataset
+sintético de datos_sinteticos.py: cada función pública de database.py y el
+recorrido de acceso a datos de cada página de la app.
+
+El dataset se genera una vez por escala y semilla en .benchmarks/datos/ y
+cada corrida trabaja sobre una copia, así las escrituras no alteran la base
+de referencia.
+
+Uso (los resultados quedan en JSON en .benchmarks/ para comparar corridas):
+    pip install -r requirements-dev.txt
+    python -m pytest benchmarks/suite_rendimiento.py --benchmark-autosave
+    python -m pytest benchmarks/suite_rendimiento.py --benchmark-compare --benchmark-compare-fail=median:25%
+
+Escala con CLINICA_BENCH_ESCALA=pequeña|mediana|completa (por defecto pequeña).
+"""
+
+import inspect
+import itertools
+import os
+import shutil
+import sys
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database as db
+import datos_sinteticos
+
+ESCALA = os.environ.get('CLINICA_BENCH_ESCALA', 'pequeña')
+DIRECTORIO_DATOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.benchmarks', 'datos')
+
+HOY = datos_sinteticos.REFERENCIA
+INICIO_MES = HOY.replace(day=1).isoformat()
+HACE_UN_AÑO = (HOY - timedelta(days=365)).isoformat()
+
+CONSULTA = {'fecha_consulta': f'{HOY} 10:00:00', 'motivo_consulta': 'Control', 'diagnostico': 'HTA grado I',
+            'fc': 80, 'ta_sistolica': 140, 'ta_diastolica': 90, 'sato2': 98.0, 'observaciones': ''}
+DETALLE_ADULTO = {'tiene_hta': True, 'tiene_diabetes': False, 'tabaquismo': 'No', 'colesterol_total': 200.0,
+                  'colesterol_hdl': 50.0, 'riesgo_cardiovascular_score': 4.2,
+                  'riesgo_cardiovascular_framingham': 4.2, 'clasificacion_riesgo': 'Bajo'}
+EXAMENES = [{'tipo_examen': 'Perfil Lipídico', 'indicacion': 'Ayunas'}]
+RECETAS = [{'medicamento': 'Enalapril', 'dosis': '10 mg', 'frecuencia': 'Cada 12 horas',
+            'duracion': '30 días', 'indicaciones_adicionales': ''}]
+
+
+@pytest.fixture(scope='module')
+def datos(tmp_path_factory):
+    """Copia de la base sintética de la escala elegida, con ids de referencia para las consultas."""
+    tamaños = datos_sinteticos.ESCALAS[ESCALA]
+    referencia = os.path.join(DIRECTORIO_DATOS,
+                              f"{ESCALA}-{datos_sinteticos.SEMILLA}-v{db.SCHEMA_VERSION}.db")
+    anteriores = (db.DB_BACKEND, db.DB_NAME, db.SNAPSHOT_INTERVAL)
+    db.DB_BACKEND = 'sqlite'
+    db.SNAPSHOT_INTERVAL = 0  # se mide la consulta, no la copia en memoria
+    if not os.path.exists(referencia):
+        os.makedirs(DIRECTORIO_DATOS, exist_ok=True)
+        db.DB_NAME = referencia + '.tmp'
+        db.init_db()
+        datos_sinteticos.generar(**tamaños)
+        db.close_pool()  # el último cierre hace checkpoint del WAL
+        os.replace(db.DB_NAME, referencia)
+
+    db.DB_NAME = str(tmp_path_factory.mktemp('bench') / 'clinica.db')
+    shutil.copy(referencia, db.DB_NAME)
+    db.init_db()
+    with db.db_connection() as conn:
+        medico_id = conn.execute("SELECT min(id) FROM medicos").fetchone()[0]
+        user_id = conn.execute("SELECT user_id FROM medicos WHERE id = ?", (medico_id,)).fetchone()[0]
+        # El paciente con más consultas: la historia clínica más pesada
+        paciente_id, hce_id = conn.execute(
+            "SELECT paciente_id, max(id) FROM hce_comun GROUP BY paciente_id ORDER BY count(*) DESC LIMIT 1"
+        ).fetchone()
+        cita_id = conn.execute("SELECT max(id) FROM citas").fetchone()[0]
+        paciente = dict(conn.execute("SELECT * FROM pacientes WHERE id = ?", (paciente_id,)).fetchone())
+    yield SimpleNamespace(medico_id=medico_id, user_id=user_id, username=f"medico{medico_id}",
+                          paciente_id=paciente_id, paciente=paciente, hce_id=hce_id, cita_id=cita_id,
+                          medico_ids=[m['id'] for m in db.get_all_medicos()],
+                          tmp=tmp_path_factory.mktemp('csv'), secuencia=itertools.count())
+    db.close_pool()
+    db.DB_BACKEND, db.DB_NAME, db.SNAPSHOT_INTERVAL = anteriores
+
+
+def _consumir(filas):
+    n = 0
+    for _ in filas:
+        n += 1
+    return n
+
+
+# --- FUNCIONES DE database.py ---
+
+LECTURAS = {
+    'verify_login': lambda d: db.verify_login(d.username, d.username),
+    'get_medico_id_by_user': lambda d: db.get_medico_id_by_user(d.user_id),
+    'get_all_medicos': lambda d: db.get_all_medicos(),
+    'get_medico': lambda d: db.get_medico(d.medico_id),
+    'get_all_pacientes': lambda d: db.get_all_pacientes(),
+    'list_pacientes': lambda d: db.list_pacientes(),
+    'get_resumen_clinica': lambda d: db.get_resumen_clinica(),
+    'get_paciente': lambda d: db.get_paciente(d.paciente_id),
+    'search_pacientes': lambda d: db.search_pacientes('mar gonz'),
+    'get_citas_by_medico_fecha': lambda d: db.get_citas_by_medico_fecha(d.medico_id, HOY.isoformat()),
+    'get_citas_solapadas': lambda d: db.get_citas_solapadas(d.medico_id, f'{HOY} 10:00:00', 30),
+    'get_conflictos_ocurrencias': lambda d: db.get_conflictos_ocurrencias(
+        d.medico_id, [f'{HOY + timedelta(weeks=n)} 10:00:00' for n in range(24)], 30),
+    'get_series_paciente': lambda d: db.get_series_paciente(d.paciente_id),
+    'get_citas_serie': lambda d: db.get_citas_serie(1),
+    'get_citas_rango': lambda d: db.get_citas_rango(HOY - timedelta(days=HOY.weekday()),
+                                                    HOY + timedelta(days=6 - HOY.weekday())),
+    'get_citas_por_dia': lambda d: db.get_citas_por_dia(INICIO_MES, HOY.isoformat()),
+    'get_citas_ocupadas': lambda d: db.get_citas_ocupadas(d.medico_ids, HOY, HOY + timedelta(weeks=8)),
+    'get_horarios_medicos': lambda d: db.get_horarios_medicos(),
+    'get_horario_medico': lambda d: db.get_horario_medico(d.medico_id),
+    'get_noshow_stats': lambda d: db.get_noshow_stats(d.medico_id, HACE_UN_AÑO, HOY.isoformat()),
+    'get_citas_stats_por_medico': lambda d: db.get_citas_stats_por_medico(INICIO_MES, HOY.isoformat(),
+                                                                          d.medico_ids),
+    'get_citas_hoy_por_medico': lambda d: db.get_citas_hoy_por_medico(d.medico_ids),
+    'verificar_resumen_diario': lambda d: db.verificar_resumen_diario(),
+    'get_hce_by_paciente': lambda d: db.get_hce_by_paciente(d.paciente_id),
+    'get_historia_completa': lambda d: db.get_historia_completa(d.paciente_id),
+    'search_hce': lambda d: db.search_hce('fibrilacion', fecha_inicio=HACE_UN_AÑO, fecha_fin=HOY.isoformat()),
+    'iter_pacientes': lambda d: _consumir(db.iter_pacientes()),
+    'iter_citas': lambda d: _consumir(db.iter_citas(INICIO_MES, HOY.isoformat())),
+    'iter_hce': lambda d: _consumir(db.iter_hce(INICIO_MES, HOY.isoformat())),
+    'iter_hce_adulto': lambda d: _consumir(db.iter_hce_adulto(INICIO_MES, HOY.isoformat())),
+    'exportar_csv': lambda d: db.exportar_csv(db.iter_citas(INICIO_MES, HOY.isoformat()),
+                                              str(d.tmp / 'citas.csv')),
+    'get_indicaciones_by_hce': lambda d: db.get_indicaciones_by_hce(d.hce_id),
+    'get_recetas_by_hce': lambda d: db.get_recetas_by_hce(d.hce_id),
+    'get_schema_version': lambda d: db.get_schema_version(),
+    'init_db': lambda d: db.init_db(),
+    'migrate': lambda d: db.migrate(),
+    'refresh_snapshot': lambda d: db.refresh_snapshot(),
+}
+
+ESCRITURAS = {
+    'create_medico_con_usuario': lambda d: db.create_medico_con_usuario(
+        'Dr. Bench', 'Cardiología', 'bench@clinica.test', f"bench{next(d.secuencia)}", 'x'),
+    'create_paciente': lambda d: db.create_paciente('Paciente Bench', '1970-01-01', False, '555', ''),
+    'update_paciente_sexo': lambda d: db.update_paciente_sexo(d.paciente_id, d.paciente['sexo']),
+    'update_paciente_registro': lambda d: db.update_paciente_registro(
+        d.paciente_id, d.paciente['fecha_nacimiento'], d.paciente['es_pediatrico'], d.paciente['contacto'],
+        d.paciente['tutor_legal'], d.paciente['sexo']),
+    'set_horario_medico': lambda d: db.set_horario_medico(d.medico_id, db.HORARIO_POR_DEFECTO),
+    'create_cita': lambda d: db.create_cita(d.paciente_id, d.medico_id, f'{HOY} 07:00:00'),
+    # Tras la primera ronda el horario queda ocupado: mide la verificación que rechaza
+    'reservar_cita': lambda d: db.reservar_cita(d.paciente_id, d.medico_id, f'{HOY} 06:00:00', 30),
+    # Serie semanal de 24 citas; desde la segunda ronda todas chocan con la primera
+    'create_serie_citas': lambda d: db.create_serie_citas(
+        d.paciente_id, d.medico_id, [f'{HOY + timedelta(weeks=n)} 05:00:00' for n in range(24)], 30, 'semanal', 1),
+    'update_serie_citas': lambda d: db.update_serie_citas(1, hora='05:00', desde=HOY.isoformat()),
+    'cancelar_serie_citas': lambda d: db.cancelar_serie_citas(1, desde=HOY.isoformat()),
+    'update_estado_cita': lambda d: db.update_estado_cita(d.cita_id, 'Pendiente'),
+    'create_hce_comun': lambda d: db.create_hce_comun(d.paciente_id, d.medico_id, f'{HOY} 10:00:00', 'Control',
+                                                      80, 120, 80, 98.0, ''),
+    'create_hce_infantil': lambda d: db.create_hce_infantil(d.hce_id, 20.0, 110.0, 50, 50, 0.1, 0.2, 0.3, 0.4,
+                                                            'Cerrado', None),
+    'create_hce_adulto': lambda d: db.create_hce_adulto(d.hce_id, *DETALLE_ADULTO.values()),
+    'save_consulta': lambda d: db.save_consulta(d.paciente_id, d.medico_id, CONSULTA, 'adulto', DETALLE_ADULTO,
+                                                EXAMENES, RECETAS),
+    'create_indicacion_examen': lambda d: db.create_indicacion_examen(d.hce_id, 'RX Tórax', ''),
+    'create_receta': lambda d: db.create_receta(d.hce_id, 'Enalapril', '10 mg', 'Cada 12 horas', '30 días', ''),
+}
+
+# Infraestructura sin acceso a datos clínicos (no se mide)
+SIN_BENCHMARK = {'get_connection', 'configurar_backend', 'close_pool', 'db_connection', 'close_snapshot',
+                 'snapshot_connection', 'get_snapshot_info', 'close_write_queue', 'get_write_queue_stats',
+                 'invalidate_reference_cache', 'get_cache_stats'}
+
+
+def test_cobertura_de_funciones_publicas():
+    # Una función pública nueva en database.py debe sumarse a LECTURAS o ESCRITURAS
+    publicas = {nombre for nombre, valor in vars(db).items()
+                if inspect.isfunction(valor) and not nombre.startswith('_') and valor.__module__ == 'database'}
+    assert publicas - SIN_BENCHMARK == set(LECTURAS) | set(ESCRITURAS)
+
+
+@pytest.mark.parametrize('nombre', list(LECTURAS))
+def test_lectura(benchmark, datos, nombre):
+    benchmark.group = 'lecturas'
+    benchmark.extra_info['escala'] = ESCALA
+    benchmark(LECTURAS[nombre], datos)
+
+
+@pytest.mark.parametrize('nombre', list(ESCRITURAS))
+def test_escritura(benchmark, datos, nombre):
+    benchmark.group = 'escrituras'
+    benchmark.extra_info['escala'] = ESCALA
+    # Sin calentamiento ni miles de rondas: cada ronda agrega filas
+    benchmark.pedantic(ESCRITURAS[nombre], args=(datos,), rounds=50, iterations=1)
+
+
+# --- RECORRIDOS POR PÁGINA ---
+# Las mismas llamadas, con los mismos argumentos, que hace cada página al renderizarse.
+
+def _dashboard_general(d):
+    db.get_resumen_clinica()
+    medicos = db.get_all_medicos()
+    db.get_citas_stats_por_medico(INICIO_MES, HOY.isoformat(), medico_ids=[m['id'] for m in medicos])
+
+
+def _dashboard_medico(d):
+    db.get_medico(d.medico_id)
+    db.get_citas_by_medico_fecha(d.medico_id, HOY.isoformat())
+    db.get_noshow_stats(medico_id=d.medico_id, fecha_inicio=INICIO_MES, fecha_fin=HOY.isoformat())
+
+
+def _agenda(d):
+    medicos = db.get_all_medicos()
+    db.get_citas_by_medico_fecha(medicos[0]['id'], HOY.isoformat())
+    db.list_pacientes(limit=db.PAGE_SIZE)
+    db.get_noshow_stats(medico_id=None, fecha_inicio=INICIO_MES, fecha_fin=HOY.isoformat())
+    db.get_citas_stats_por_medico(INICIO_MES, HOY.isoformat(), medico_ids=[m['id'] for m in medicos])
+
+
+def _hce(d):
+    db.get_medico(d.medico_id)
+    db.list_pacientes(limit=db.PAGE_SIZE)
+    db.get_historia_completa(d.paciente_id)
+    db.get_citas_by_medico_fecha(d.medico_id, HOY.isoformat())
+
+
+def _buscador(d):
+    resultados = db.search_pacientes(d.paciente['nombre'].split()[0])
+    db.get_hce_by_paciente(resultados[0]['id'] if resultados else d.paciente_id)
+
+
+def _buscador_clinico(d):
+    db.get_all_medicos()
+    db.search_hce('soplo sistolico', fecha_inicio=HACE_UN_AÑO, fecha_fin=HOY.isoformat())
+
+
+def _agenda_semana(d):
+    # Vista de semana con todos los médicos: una consulta, sin importar cuántos sean
+    medicos = db.get_all_medicos()
+    lunes = HOY - timedelta(days=HOY.weekday())
+    db.get_citas_rango(lunes, lunes + timedelta(days=6))
+    db.list_pacientes(limit=db.PAGE_SIZE)
+    db.get_noshow_stats(medico_id=None, fecha_inicio=INICIO_MES, fecha_fin=HOY.isoformat())
+    db.get_citas_stats_por_medico(INICIO_MES, HOY.isoformat(), medico_ids=[m['id'] for m in medicos])
+
+
+def _gestion_medicos(d):
+    db.get_all_medicos()
+    db.get_horarios_medicos()
+    db.get_cache_stats()
+    db.get_write_queue_stats()
+
+
+PAGINAS = {
+    'Dashboard (admin)': _dashboard_general,
+    'Dashboard (médico)': _dashboard_medico,
+    'Agenda (Citas)': _agenda,
+    'Agenda (semana, todos)': _agenda_semana,
+    'Consulta Médica (HCE)': _hce,
+    'Buscador Historial': _buscador,
+    'Buscador Clínico': _buscador_clinico,
+    'Gestión de Médicos': _gestion_medicos,
+}
+
+
+@pytest.mark.parametrize('pagina', list(PAGINAS))
+def test_pagina(benchmark, datos, pagina):
+    benchmark.group = 'páginas'
+    benchmark.extra_info['escala'] = ESCALA
+    benchmark(PAGINAS[pagina], datos)
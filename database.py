@@ -1,16 +1,413 @@
+import csv
+import os
+import queue
+import re
 import sqlite3
-import pandas as pd
-from datetime import datetime, date
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+
+import backends
+import metricas
+from backends import PRAGMAS, ConnectionPool, conectar_sqlite
 
 DB_NAME = 'clinica_cardiologia.db'
 
+# --- BACKEND Y CONEXIONES (POOL) ---
+# 'sqlite' usa el archivo DB_NAME; 'postgres' usa la cadena de conexión DB_DSN.
+# Se configuran con las variables de entorno CLINICA_DB_BACKEND/CLINICA_DB_DSN
+# o con la sección [database] de .streamlit/secrets.toml (ver configurar_backend).
+DB_BACKEND = os.environ.get('CLINICA_DB_BACKEND', 'sqlite')
+DB_DSN = os.environ.get('CLINICA_DB_DSN')
+
+# Tamaño máximo del pool: conexiones ociosas que se conservan abiertas.
+# Si todas están en uso se abre una extra que se descarta al liberarla (SQLite)
+# o se espera a que se libere una (PostgreSQL).
+POOL_SIZE = 8
+
 def get_connection():
-    return sqlite3.connect(DB_NAME, check_same_thread=False)
+    """Abre una conexión SQLite nueva con los PRAGMAs de rendimiento aplicados."""
+    return conectar_sqlite(DB_NAME)
 
-def init_db():
-    conn = get_connection()
-    cursor = conn.cursor()
-    
+def configurar_backend(backend='sqlite', dsn=None, host=None, port=None, database=None, user=None, password=None,
+                       write_queue=None, **_):
+    """
+    Selecciona el backend de almacenamiento. Para PostgreSQL se puede pasar el
+    DSN completo o sus partes (host, port, database, user, password), como en
+    la sección [database] de secrets.toml. write_queue activa la cola de
+    escritura (ver WRITE_QUEUE_ENABLED).
+    """
+    global DB_BACKEND, DB_DSN, WRITE_QUEUE_ENABLED
+    if write_queue is not None:
+        WRITE_QUEUE_ENABLED = bool(write_queue)
+    if backend == 'postgres' and dsn is None:
+        partes = {'host': host, 'port': port, 'dbname': database, 'user': user, 'password': password}
+        dsn = ' '.join(f"{k}={v}" for k, v in partes.items() if v)
+    DB_BACKEND, DB_DSN = backend, dsn
+
+def _clave_db():
+    # Identifica la base activa (archivo o DSN) para el pool y las cachés
+    return DB_NAME if DB_BACKEND == 'sqlite' else DB_DSN
+
+def _es_postgres():
+    return DB_BACKEND == 'postgres'
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def _get_backend():
+    global _backend
+    with _backend_lock:
+        # Se recrea si cambió la base configurada (p. ej. en tests)
+        if _backend is None or (_backend.nombre, _backend.clave) != (DB_BACKEND, _clave_db()):
+            if _backend is not None:
+                _backend.close()
+            _backend = backends.crear_backend(DB_BACKEND, db_name=DB_NAME, dsn=DB_DSN, pool_size=POOL_SIZE)
+        return _backend
+
+def _get_pool():
+    return _get_backend().pool
+
+def close_pool():
+    """Cierra todas las conexiones ociosas del pool."""
+    global _backend
+    # La cola de escritura tiene una conexión prestada: se detiene primero
+    close_write_queue()
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
+
+@contextmanager
+def db_connection():
+    """
+    Presta una conexión del pool.
+    Hace commit al salir sin errores y rollback si hubo una excepción.
+    """
+    pool = _get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        pool.release(conn)
+
+# --- SNAPSHOT DE LECTURA PARA REPORTES ---
+# Dashboards y estadísticas leen de una copia en memoria de la base tomada con
+# la API de backup de SQLite. La copia se renueva cuando tiene más de
+# SNAPSHOT_INTERVAL segundos, así los reportes nunca compiten con las
+# escrituras de citas y consultas. Con SNAPSHOT_INTERVAL = 0 se lee directo
+# de la base. En PostgreSQL no hace falta: MVCC ya aísla las lecturas.
+
+SNAPSHOT_INTERVAL = 60  # segundos
+
+class ReadSnapshot:
+    """
+    Copia de solo lectura de la base, refrescada como máximo cada `intervalo` segundos.
+
+    Los lectores no se serializan: cada uno toma la copia vigente bajo el lock
+    y la usa sin él (la conexión es de solo lectura y sqlite3 la comparte
+    entre hilos). Al refrescar, la copia anterior sigue abierta hasta que
+    termina su último lector.
+    """
+
+    def __init__(self, db_name, intervalo=SNAPSHOT_INTERVAL):
+        self.db_name = db_name
+        self.intervalo = intervalo
+        self.tomado_en = None       # datetime de la última copia
+        self._tomado_mono = None
+        self._conn = None
+        self._lectores = {}                     # conexión -> lectores que la usan
+        self._lock = threading.Lock()           # protege _conn y _lectores, no las consultas
+        self._refresco_lock = threading.Lock()  # un solo hilo copia a la vez
+
+    def _vencido(self):
+        return self._conn is None or time.monotonic() - self._tomado_mono >= self.intervalo
+
+    def _copiar(self):
+        # Requiere _refresco_lock
+        nueva = sqlite3.connect(':memory:', check_same_thread=False, factory=backends.ConexionSQLite)
+        nueva.row_factory = sqlite3.Row
+        # backup() lee desde una transacción de lectura: en WAL no bloquea a los escritores
+        with db_connection() as origen:
+            origen.backup(nueva)
+        nueva.execute("PRAGMA query_only=ON")
+
+        with self._lock:
+            anterior, self._conn = self._conn, nueva
+            self.tomado_en = datetime.now()
+            self._tomado_mono = time.monotonic()
+            cerrar = anterior is not None and not self._lectores.get(anterior)
+        if cerrar:
+            anterior.close()
+
+    def refrescar(self):
+        with self._refresco_lock:
+            self._copiar()
+
+    def _tomar(self):
+        """La copia vigente con un lector más registrado; None si no hay copia."""
+        with self._lock:
+            conn = self._conn
+            if conn is not None:
+                self._lectores[conn] = self._lectores.get(conn, 0) + 1
+            return conn
+
+    def _soltar(self, conn):
+        with self._lock:
+            self._lectores[conn] -= 1
+            cerrar = not self._lectores[conn] and conn is not self._conn
+            if not self._lectores[conn]:
+                del self._lectores[conn]
+        if cerrar:
+            conn.close()
+
+    @contextmanager
+    def conexion(self):
+        if self._vencido() and self._refresco_lock.acquire(blocking=False):
+            # Una copia vencida la renueva un solo hilo; los demás leen la anterior
+            try:
+                if self._vencido():
+                    self._copiar()
+            finally:
+                self._refresco_lock.release()
+        conn = self._tomar()
+        while conn is None:
+            # Todavía no hay copia (o se cerró): esperar a la que está tomando otro hilo
+            with self._refresco_lock:
+                if self._conn is None:
+                    self._copiar()
+            conn = self._tomar()
+        try:
+            yield conn
+        finally:
+            self._soltar(conn)
+
+    def info(self):
+        with self._lock:
+            antiguedad = time.monotonic() - self._tomado_mono if self._tomado_mono is not None else None
+            return {
+                'activo': True,
+                'intervalo': self.intervalo,
+                'tomado_en': self.tomado_en,
+                'antiguedad_s': round(antiguedad, 1) if antiguedad is not None else None
+            }
+
+    def close(self):
+        with self._lock:
+            conn, self._conn = self._conn, None
+            self.tomado_en = self._tomado_mono = None
+            # Si hay lectores, la cierra el último (ver _soltar)
+            cerrar = conn is not None and not self._lectores.get(conn)
+        if cerrar:
+            conn.close()
+
+
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+def _get_snapshot():
+    global _snapshot
+    with _snapshot_lock:
+        # Se recrea si cambió la base o el intervalo configurado
+        if _snapshot is None or (_snapshot.db_name, _snapshot.intervalo) != (DB_NAME, SNAPSHOT_INTERVAL):
+            if _snapshot is not None:
+                _snapshot.close()
+            _snapshot = ReadSnapshot(DB_NAME, SNAPSHOT_INTERVAL)
+        return _snapshot
+
+def close_snapshot():
+    """Libera la copia en memoria usada por los reportes."""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is not None:
+            _snapshot.close()
+            _snapshot = None
+
+@contextmanager
+def snapshot_connection():
+    """
+    Conexión de solo lectura para reportes. Los datos pueden tener hasta
+    SNAPSHOT_INTERVAL segundos de antigüedad (ver get_snapshot_info).
+    """
+    if SNAPSHOT_INTERVAL <= 0 or _es_postgres():
+        with db_connection() as conn:
+            yield conn
+        return
+    with _get_snapshot().conexion() as conn:
+        yield conn
+
+def refresh_snapshot():
+    """Fuerza una copia nueva del snapshot de reportes."""
+    if SNAPSHOT_INTERVAL > 0 and not _es_postgres():
+        _get_snapshot().refrescar()
+
+def get_snapshot_info():
+    """Estado del snapshot: activo, intervalo, tomado_en y antiguedad_s (segundos)."""
+    if SNAPSHOT_INTERVAL <= 0 or _es_postgres():
+        return {'activo': False, 'intervalo': 0, 'tomado_en': None, 'antiguedad_s': None}
+    return _get_snapshot().info()
+
+# --- COLA DE ESCRITURA ---
+# Opcional (WRITE_QUEUE_ENABLED): un único hilo escritor con su propia
+# conexión ejecuta todas las escrituras en orden. Los trabajos que llegan
+# juntos se confirman con un solo commit (group commit), cada uno dentro de
+# un SAVEPOINT para que el fallo de uno no deshaga los demás. Quien escribe
+# espera su resultado en un Future. Así las sesiones no compiten por el lock
+# de escritura de SQLite ("database is locked") en las ráfagas de uso.
+
+WRITE_QUEUE_ENABLED = os.environ.get('CLINICA_WRITE_QUEUE') == '1'
+WRITE_BATCH_MAX = 64    # trabajos por commit
+WRITE_TIMEOUT = 30      # segundos que espera quien escribe
+
+class WriteQueue:
+    """Hilo escritor único con group commit; submit() retorna un Future."""
+
+    def __init__(self, backend, lote_max=WRITE_BATCH_MAX):
+        self.backend = backend
+        self.lote_max = lote_max
+        self.commits = 0
+        self.trabajos = 0
+        self.errores = 0
+        self._cola = queue.Queue()
+        self._hilo = threading.Thread(target=self._ejecutar, name='clinica-escritor', daemon=True)
+        self._hilo.start()
+
+    def submit(self, trabajo, tablas=()):
+        """
+        Encola trabajo(cursor); el Future recibe su resultado tras el commit.
+        tablas se bloquean (backend.bloquear) durante todo el lote que lo incluya.
+        """
+        futuro = Future()
+        self._cola.put((trabajo, futuro, tuple(tablas)))
+        return futuro
+
+    def _ejecutar(self):
+        conn = self.backend.pool.acquire()
+        try:
+            cerrar = False
+            while not cerrar:
+                lote = [self._cola.get()]
+                # Junta lo que ya esté esperando, sin demorar al primero
+                while len(lote) < self.lote_max:
+                    try:
+                        lote.append(self._cola.get_nowait())
+                    except queue.Empty:
+                        break
+                if None in lote:
+                    cerrar = True
+                    lote = [item for item in lote if item is not None]
+                if lote:
+                    self._procesar(conn, lote)
+        finally:
+            self.backend.pool.release(conn)
+
+    def _procesar(self, conn, lote):
+        lote = [item for item in lote if item[1].set_running_or_notify_cancel()]
+        tablas = sorted({tabla for _, _, tablas_trabajo in lote for tabla in tablas_trabajo})
+        resultados = []
+        try:
+            self.backend.bloquear(conn, tablas)
+            cursor = conn.cursor()
+            for trabajo, futuro, _ in lote:
+                cursor.execute("SAVEPOINT trabajo")
+                try:
+                    resultados.append((futuro, trabajo(cursor), None))
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT trabajo")
+                    resultados.append((futuro, None, e))
+                cursor.execute("RELEASE SAVEPOINT trabajo")
+            conn.commit()
+        except BaseException as e:
+            conn.rollback()
+            self.errores += len(lote)
+            for _, futuro, _ in lote:
+                futuro.set_exception(e)
+            return
+        
+        self.commits += 1
+        self.trabajos += len(lote)
+        for futuro, valor, error in resultados:
+            if error is None:
+                futuro.set_result(valor)
+            else:
+                self.errores += 1
+                futuro.set_exception(error)
+
+    def stats(self):
+        return {
+            'trabajos': self.trabajos,
+            'commits': self.commits,
+            'errores': self.errores,
+            'pendientes': self._cola.qsize(),
+            'trabajos_por_commit': round(self.trabajos / self.commits, 1) if self.commits else 0
+        }
+
+    def close(self):
+        self._cola.put(None)
+        self._hilo.join(timeout=WRITE_TIMEOUT)
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+def _get_write_queue():
+    global _write_queue
+    if not WRITE_QUEUE_ENABLED:
+        return None
+    backend = _get_backend()
+    with _write_queue_lock:
+        # Se recrea si cambió la base configurada
+        if _write_queue is None or _write_queue.backend is not backend:
+            if _write_queue is not None:
+                _write_queue.close()
+            _write_queue = WriteQueue(backend)
+        return _write_queue
+
+def close_write_queue():
+    """Procesa lo pendiente y detiene el hilo escritor."""
+    global _write_queue
+    with _write_queue_lock:
+        if _write_queue is not None:
+            _write_queue.close()
+            _write_queue = None
+
+def get_write_queue_stats():
+    """Contadores de la cola de escritura, o None si está desactivada."""
+    return _write_queue.stats() if WRITE_QUEUE_ENABLED and _write_queue is not None else None
+
+def _escribir(trabajo, bloquear=None):
+    """
+    Ejecuta trabajo(cursor) en una transacción: en la cola de escritura si está
+    activa o, si no, en una conexión del pool. Retorna lo que retorne trabajo.
+    bloquear (tupla de tablas) toma el lock de escritura antes de empezar, para
+    trabajos que leen y deciden qué escribir sin que otro escritor se cuele.
+    """
+    cola = _get_write_queue()
+    if cola is None:
+        with db_connection() as conn:
+            if bloquear is not None:
+                _get_backend().bloquear(conn, bloquear)
+            return trabajo(conn.cursor())
+    return cola.submit(trabajo, bloquear or ()).result(timeout=WRITE_TIMEOUT)
+
+# --- ESQUEMA Y MIGRACIONES ---
+# La versión del esquema se guarda en PRAGMA user_version (en PostgreSQL, en la
+# tabla esquema_version). Cada migración se aplica una sola vez y en orden;
+# init_db() solo verifica la versión una vez por proceso, así que los reruns
+# de Streamlit no tocan el esquema. Las migraciones que dependen del dialecto
+# tienen su variante PostgreSQL en MIGRACIONES_POSTGRES.
+
+def _columnas(cursor, tabla):
+    return {row[1] for row in cursor.execute(f"PRAGMA table_info({tabla})")}
+
+def _migracion_esquema_inicial(cursor):
     # 1. Usuarios (Auth)
     cursor.execute('''CREATE TABLE IF NOT EXISTS usuarios (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -81,12 +478,10 @@ def init_db():
         ("ecg_hallazgos", "TEXT"),
         ("echo_hallazgos", "TEXT")
     ]
+    existentes = _columnas(cursor, 'hce_comun')
     for col_name, col_type in columnas_nuevas:
-        try:
+        if col_name not in existentes:
             cursor.execute(f"ALTER TABLE hce_comun ADD COLUMN {col_name} {col_type}")
-        except:
-            pass # Ya existe
-
 
     # 6. HCE Infantil
     cursor.execute('''CREATE TABLE IF NOT EXISTS hce_infantil (
@@ -142,165 +537,1024 @@ def init_db():
     if not cursor.fetchone():
         cursor.execute("INSERT INTO usuarios (username, password, rol) VALUES (?, ?, ?)",
                        ('admin', 'admin123', 'admin'))
-    
-    conn.commit()
-    conn.close()
+
+def _migracion_indices_basicos(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_citas_medico_fecha ON citas(medico_id, fecha_hora)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_hce_comun_paciente_fecha ON hce_comun(paciente_id, fecha_consulta)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_hce_infantil_hce ON hce_infantil(hce_comun_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_hce_adulto_hce ON hce_adulto(hce_comun_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_indicaciones_hce ON indicaciones_examenes(hce_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_recetas_hce ON recetas_medicas(hce_id)")
+
+def _migracion_indice_citas_fecha(cursor):
+    # Para rangos de fechas sin filtro de médico (estadísticas de "Todos")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_citas_fecha ON citas(fecha_hora)")
+
+def _migracion_resumen_diario(cursor):
+    # Conteo de citas por (médico, día, estado) mantenido por triggers, para que
+    # los dashboards de mes/año lean pocas filas en lugar de todo el historial.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS citas_resumen_diario (
+                        medico_id INTEGER NOT NULL,
+                        dia TEXT NOT NULL,
+                        estado TEXT NOT NULL,
+                        total INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (medico_id, dia, estado)) WITHOUT ROWID''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_resumen_dia ON citas_resumen_diario(dia)")
+
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_citas_resumen_insert AFTER INSERT ON citas
+                      BEGIN
+                          INSERT INTO citas_resumen_diario (medico_id, dia, estado, total)
+                          VALUES (COALESCE(NEW.medico_id, 0), substr(NEW.fecha_hora, 1, 10), COALESCE(NEW.estado, ''), 1)
+                          ON CONFLICT(medico_id, dia, estado) DO UPDATE SET total = total + 1;
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_citas_resumen_delete AFTER DELETE ON citas
+                      BEGIN
+                          UPDATE citas_resumen_diario SET total = total - 1
+                          WHERE medico_id = COALESCE(OLD.medico_id, 0) AND dia = substr(OLD.fecha_hora, 1, 10)
+                            AND estado = COALESCE(OLD.estado, '');
+                          DELETE FROM citas_resumen_diario
+                          WHERE medico_id = COALESCE(OLD.medico_id, 0) AND dia = substr(OLD.fecha_hora, 1, 10)
+                            AND estado = COALESCE(OLD.estado, '') AND total <= 0;
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_citas_resumen_update
+                      AFTER UPDATE OF medico_id, fecha_hora, estado ON citas
+                      BEGIN
+                          UPDATE citas_resumen_diario SET total = total - 1
+                          WHERE medico_id = COALESCE(OLD.medico_id, 0) AND dia = substr(OLD.fecha_hora, 1, 10)
+                            AND estado = COALESCE(OLD.estado, '');
+                          DELETE FROM citas_resumen_diario
+                          WHERE medico_id = COALESCE(OLD.medico_id, 0) AND dia = substr(OLD.fecha_hora, 1, 10)
+                            AND estado = COALESCE(OLD.estado, '') AND total <= 0;
+                          INSERT INTO citas_resumen_diario (medico_id, dia, estado, total)
+                          VALUES (COALESCE(NEW.medico_id, 0), substr(NEW.fecha_hora, 1, 10), COALESCE(NEW.estado, ''), 1)
+                          ON CONFLICT(medico_id, dia, estado) DO UPDATE SET total = total + 1;
+                      END''')
+
+    _reconstruir_resumen_diario(cursor)
+
+def _migracion_pacientes_fts(cursor):
+    # Índice de texto completo sobre pacientes (contenido externo: no duplica datos).
+    # remove_diacritics permite encontrar "Pérez" escribiendo "perez".
+    cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS pacientes_fts USING fts5(
+                        nombre, contacto, tutor_legal,
+                        content='pacientes', content_rowid='id',
+                        tokenize='unicode61 remove_diacritics 2',
+                        prefix='2 3')''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_pacientes_fts_insert AFTER INSERT ON pacientes
+                      BEGIN
+                          INSERT INTO pacientes_fts (rowid, nombre, contacto, tutor_legal)
+                          VALUES (NEW.id, NEW.nombre, NEW.contacto, NEW.tutor_legal);
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_pacientes_fts_delete AFTER DELETE ON pacientes
+                      BEGIN
+                          INSERT INTO pacientes_fts (pacientes_fts, rowid, nombre, contacto, tutor_legal)
+                          VALUES ('delete', OLD.id, OLD.nombre, OLD.contacto, OLD.tutor_legal);
+                      END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS trg_pacientes_fts_update
+                      AFTER UPDATE OF nombre, contacto, tutor_legal ON pacientes
+                      BEGIN
+                          INSERT INTO pacientes_fts (pacientes_fts, rowid, nombre, contacto, tutor_legal)
+                          VALUES ('delete', OLD.id, OLD.nombre, OLD.contacto, OLD.tutor_legal);
+                          INSERT INTO pacientes_fts (rowid, nombre, contacto, tutor_legal)
+                          VALUES (NEW.id, NEW.nombre, NEW.contacto, NEW.tutor_legal);
+                      END''')
+    cursor.execute("INSERT INTO pacientes_fts (pacientes_fts) VALUES ('rebuild')")
+
+# Campos narrativos de hce_comun indexados para búsqueda clínica
+HCE_CAMPOS_TEXTO = ('motivo_consulta', 'diagnostico', 'ef_general', 'ef_cardio', 'ef_respiratorio',
+                    'ef_otros', 'ecg_hallazgos', 'echo_hallazgos', 'observaciones')
+
+def _migracion_hce_fts(cursor):
+    columnas = ', '.join(HCE_CAMPOS_TEXTO)
+    nuevos = ', '.join(f'NEW.{c}' for c in HCE_CAMPOS_TEXTO)
+    viejos = ', '.join(f'OLD.{c}' for c in HCE_CAMPOS_TEXTO)
+    cursor.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS hce_fts USING fts5(
+                         {columnas},
+                         content='hce_comun', content_rowid='id',
+                         tokenize='unicode61 remove_diacritics 2')''')
+    # Actualización incremental: cada consulta nueva se indexa al insertarla
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_hce_fts_insert AFTER INSERT ON hce_comun
+                       BEGIN
+                           INSERT INTO hce_fts (rowid, {columnas}) VALUES (NEW.id, {nuevos});
+                       END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_hce_fts_delete AFTER DELETE ON hce_comun
+                       BEGIN
+                           INSERT INTO hce_fts (hce_fts, rowid, {columnas}) VALUES ('delete', OLD.id, {viejos});
+                       END''')
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_hce_fts_update AFTER UPDATE OF {columnas} ON hce_comun
+                       BEGIN
+                           INSERT INTO hce_fts (hce_fts, rowid, {columnas}) VALUES ('delete', OLD.id, {viejos});
+                           INSERT INTO hce_fts (rowid, {columnas}) VALUES (NEW.id, {nuevos});
+                       END''')
+    # Indexa una única vez las consultas existentes
+    cursor.execute("INSERT INTO hce_fts (hce_fts) VALUES ('rebuild')")
+
+def _migracion_indice_pacientes_nombre(cursor):
+    # Orden (nombre, id) para la paginación por keyset de list_pacientes
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_nombre ON pacientes(nombre, id)")
+
+def _migracion_indice_pacientes_pediatrico(cursor):
+    # Índice angosto para contar pacientes pediátricos sin leer la tabla completa
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_pediatrico ON pacientes(es_pediatrico)")
+
+def _migracion_duracion_citas(cursor):
+    # Cada cita ocupa [fecha_hora, fecha_hora_fin); el fin se guarda calculado
+    # para que el solapamiento sea una comparación de textos sobre el índice
+    columnas = _columnas(cursor, 'citas')
+    if 'duracion_min' not in columnas:
+        cursor.execute(f"ALTER TABLE citas ADD COLUMN duracion_min INTEGER NOT NULL DEFAULT {DURACION_CITA}")
+    if 'fecha_hora_fin' not in columnas:
+        cursor.execute("ALTER TABLE citas ADD COLUMN fecha_hora_fin TEXT")
+    cursor.execute("UPDATE citas SET fecha_hora_fin = datetime(fecha_hora, '+' || duracion_min || ' minutes') "
+                   "WHERE fecha_hora_fin IS NULL")
+
+def _migracion_horarios_medico(cursor):
+    # Bloques de atención semanales; un día puede tener varios (turno cortado).
+    # Mismo SQL en ambos dialectos.
+    cursor.execute('''CREATE TABLE IF NOT EXISTS horarios_medico (
+                        medico_id INTEGER NOT NULL,
+                        dia_semana INTEGER NOT NULL,
+                        hora_inicio TEXT NOT NULL,
+                        hora_fin TEXT NOT NULL,
+                        PRIMARY KEY (medico_id, dia_semana, hora_inicio))''')
+    # idx_citas_medico_fecha pasa a cubrir fin y estado: la ocupación de un
+    # período (get_citas_ocupadas) se lee del índice sin tocar la tabla citas
+    cursor.execute("DROP INDEX IF EXISTS idx_citas_medico_fecha")
+    cursor.execute("CREATE INDEX idx_citas_medico_fecha ON citas(medico_id, fecha_hora, fecha_hora_fin, estado)")
+
+def _migracion_series_citas(cursor):
+    # Series de citas recurrentes: cada cita de la serie guarda serie_id
+    cursor.execute('''CREATE TABLE IF NOT EXISTS series_citas (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        paciente_id INTEGER,
+                        medico_id INTEGER,
+                        frecuencia TEXT,
+                        intervalo INTEGER,
+                        duracion_min INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    if 'serie_id' not in _columnas(cursor, 'citas'):
+        cursor.execute("ALTER TABLE citas ADD COLUMN serie_id INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_citas_serie ON citas(serie_id)")
+
+# --- Variantes PostgreSQL ---
+# Mismos tipos que en SQLite (fechas como TEXT 'YYYY-MM-DD HH:MM:SS', booleanos
+# como 0/1) para que las consultas y los valores devueltos sean idénticos.
+# Tampoco se declaran claves foráneas en las tablas clínicas: SQLite no las
+# aplica (PRAGMA foreign_keys está apagado) y ambos backends deben aceptar
+# los mismos datos.
+
+def _migracion_esquema_inicial_pg(cursor):
+    id_col = "id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY"
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS usuarios (
+                         {id_col},
+                         username TEXT UNIQUE,
+                         password TEXT,
+                         rol TEXT)''')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS medicos (
+                         {id_col},
+                         nombre TEXT,
+                         especialidad TEXT,
+                         email TEXT,
+                         user_id INTEGER)''')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS pacientes (
+                         {id_col},
+                         nombre TEXT,
+                         fecha_nacimiento TEXT,
+                         sexo TEXT,
+                         es_pediatrico INTEGER,
+                         contacto TEXT,
+                         tutor_legal TEXT,
+                         created_at TEXT DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS'))''')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS citas (
+                         {id_col},
+                         paciente_id INTEGER,
+                         medico_id INTEGER,
+                         fecha_hora TEXT,
+                         estado TEXT DEFAULT 'Pendiente')''')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS hce_comun (
+                         {id_col},
+                         paciente_id INTEGER,
+                         medico_id INTEGER,
+                         cita_id INTEGER,
+                         fecha_consulta TEXT,
+                         motivo_consulta TEXT,
+                         diagnostico TEXT,
+                         fc INTEGER,
+                         ta_sistolica INTEGER,
+                         ta_diastolica INTEGER,
+                         sato2 DOUBLE PRECISION,
+                         ef_general TEXT,
+                         ef_cardio TEXT,
+                         ef_respiratorio TEXT,
+                         ef_otros TEXT,
+                         ecg_hallazgos TEXT,
+                         echo_hallazgos TEXT,
+                         observaciones TEXT)''')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS hce_infantil (
+                         {id_col},
+                         hce_comun_id INTEGER,
+                         peso_kg DOUBLE PRECISION,
+                         talla_cm DOUBLE PRECISION,
+                         percentil_peso DOUBLE PRECISION,
+                         percentil_talla DOUBLE PRECISION,
+                         zscore_aortico DOUBLE PRECISION,
+                         zscore_pulmonar DOUBLE PRECISION,
+                         zscore_mitral DOUBLE PRECISION,
+                         zscore_tricuspide DOUBLE PRECISION,
+                         ductus_estado TEXT,
+                         ductus_tamano_mm DOUBLE PRECISION)''')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS hce_adulto (
+                         {id_col},
+                         hce_comun_id INTEGER,
+                         tiene_hta INTEGER,
+                         tiene_diabetes INTEGER,
+                         tabaquismo TEXT,
+                         colesterol_total DOUBLE PRECISION,
+                         colesterol_hdl DOUBLE PRECISION,
+                         riesgo_cardiovascular_score DOUBLE PRECISION,
+                         riesgo_cardiovascular_framingham DOUBLE PRECISION,
+                         clasificacion_riesgo TEXT)''')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS indicaciones_examenes (
+                         {id_col},
+                         hce_id INTEGER,
+                         tipo_examen TEXT,
+                         indicacion TEXT)''')
+    cursor.execute(f'''CREATE TABLE IF NOT EXISTS recetas_medicas (
+                         {id_col},
+                         hce_id INTEGER,
+                         medicamento TEXT,
+                         dosis TEXT,
+                         frecuencia TEXT,
+                         duracion TEXT,
+                         indicaciones_adicionales TEXT)''')
+
+    cursor.execute("SELECT * FROM usuarios WHERE username='admin'")
+    if not cursor.fetchone():
+        cursor.execute("INSERT INTO usuarios (username, password, rol) VALUES (?, ?, ?)",
+                       ('admin', 'admin123', 'admin'))
+
+def _migracion_resumen_diario_pg(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS citas_resumen_diario (
+                        medico_id INTEGER NOT NULL,
+                        dia TEXT NOT NULL,
+                        estado TEXT NOT NULL,
+                        total INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (medico_id, dia, estado))''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_resumen_dia ON citas_resumen_diario(dia)")
+    cursor.execute('''CREATE OR REPLACE FUNCTION citas_resumen_ajustar(p_medico INTEGER, p_fecha TEXT, p_estado TEXT, p_delta INTEGER)
+                      RETURNS void AS $$
+                      BEGIN
+                          INSERT INTO citas_resumen_diario (medico_id, dia, estado, total)
+                          VALUES (COALESCE(p_medico, 0), substr(p_fecha, 1, 10), COALESCE(p_estado, ''), p_delta)
+                          ON CONFLICT (medico_id, dia, estado)
+                          DO UPDATE SET total = citas_resumen_diario.total + EXCLUDED.total;
+                          DELETE FROM citas_resumen_diario
+                          WHERE medico_id = COALESCE(p_medico, 0) AND dia = substr(p_fecha, 1, 10)
+                            AND estado = COALESCE(p_estado, '') AND total <= 0;
+                      END $$ LANGUAGE plpgsql''')
+    cursor.execute('''CREATE OR REPLACE FUNCTION trg_citas_resumen() RETURNS trigger AS $$
+                      BEGIN
+                          IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                              PERFORM citas_resumen_ajustar(OLD.medico_id, OLD.fecha_hora, OLD.estado, -1);
+                          END IF;
+                          IF TG_OP IN ('UPDATE', 'INSERT') THEN
+                              PERFORM citas_resumen_ajustar(NEW.medico_id, NEW.fecha_hora, NEW.estado, 1);
+                          END IF;
+                          RETURN NULL;
+                      END $$ LANGUAGE plpgsql''')
+    cursor.execute("DROP TRIGGER IF EXISTS trg_citas_resumen ON citas")
+    cursor.execute('''CREATE TRIGGER trg_citas_resumen
+                      AFTER INSERT OR DELETE OR UPDATE OF medico_id, fecha_hora, estado ON citas
+                      FOR EACH ROW EXECUTE FUNCTION trg_citas_resumen()''')
+
+    _reconstruir_resumen_diario(cursor)
+
+def _migracion_pacientes_fts_pg(cursor):
+    # Equivalente a remove_diacritics de FTS5; IMMUTABLE para poder indexarla
+    cursor.execute('''CREATE OR REPLACE FUNCTION sin_acentos(texto TEXT) RETURNS TEXT AS $$
+                          SELECT translate(lower(texto), 'áàäâãéèëêíìïîóòöôõúùüûñç', 'aaaaaeeeeiiiiooooouuuunc')
+                      $$ LANGUAGE sql IMMUTABLE''')
+    # Pesos A/B/C: nombre, contacto, tutor (como los pesos de bm25 en SQLite)
+    cursor.execute('''CREATE TABLE IF NOT EXISTS pacientes_fts (
+                        id INTEGER PRIMARY KEY REFERENCES pacientes(id) ON DELETE CASCADE,
+                        documento tsvector NOT NULL)''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pacientes_fts ON pacientes_fts USING GIN (documento)")
+    documento = '''setweight(to_tsvector('simple', sin_acentos(COALESCE({0}nombre, ''))), 'A') ||
+                    setweight(to_tsvector('simple', sin_acentos(COALESCE({0}contacto, ''))), 'B') ||
+                    setweight(to_tsvector('simple', sin_acentos(COALESCE({0}tutor_legal, ''))), 'C')'''
+    cursor.execute(f'''CREATE OR REPLACE FUNCTION trg_pacientes_fts() RETURNS trigger AS $$
+                       BEGIN
+                           INSERT INTO pacientes_fts (id, documento) VALUES (NEW.id, {documento.format('NEW.')})
+                           ON CONFLICT (id) DO UPDATE SET documento = EXCLUDED.documento;
+                           RETURN NULL;
+                       END $$ LANGUAGE plpgsql''')
+    cursor.execute("DROP TRIGGER IF EXISTS trg_pacientes_fts ON pacientes")
+    cursor.execute('''CREATE TRIGGER trg_pacientes_fts
+                      AFTER INSERT OR UPDATE OF nombre, contacto, tutor_legal ON pacientes
+                      FOR EACH ROW EXECUTE FUNCTION trg_pacientes_fts()''')
+    cursor.execute(f"INSERT INTO pacientes_fts (id, documento) SELECT id, {documento.format('')} FROM pacientes "
+                   "ON CONFLICT (id) DO NOTHING")
+
+def _migracion_hce_fts_pg(cursor):
+    documento = "to_tsvector('simple', sin_acentos(concat_ws(' ', {})))"
+    cursor.execute('''CREATE TABLE IF NOT EXISTS hce_fts (
+                        id INTEGER PRIMARY KEY REFERENCES hce_comun(id) ON DELETE CASCADE,
+                        documento tsvector NOT NULL)''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_hce_fts ON hce_fts USING GIN (documento)")
+    nuevos = documento.format(', '.join(f'NEW.{c}' for c in HCE_CAMPOS_TEXTO))
+    cursor.execute(f'''CREATE OR REPLACE FUNCTION trg_hce_fts() RETURNS trigger AS $$
+                       BEGIN
+                           INSERT INTO hce_fts (id, documento) VALUES (NEW.id, {nuevos})
+                           ON CONFLICT (id) DO UPDATE SET documento = EXCLUDED.documento;
+                           RETURN NULL;
+                       END $$ LANGUAGE plpgsql''')
+    cursor.execute("DROP TRIGGER IF EXISTS trg_hce_fts ON hce_comun")
+    cursor.execute(f'''CREATE TRIGGER trg_hce_fts
+                       AFTER INSERT OR UPDATE OF {', '.join(HCE_CAMPOS_TEXTO)} ON hce_comun
+                       FOR EACH ROW EXECUTE FUNCTION trg_hce_fts()''')
+    cursor.execute(f"INSERT INTO hce_fts (id, documento) SELECT id, {documento.format(', '.join(HCE_CAMPOS_TEXTO))} "
+                   "FROM hce_comun ON CONFLICT (id) DO NOTHING")
+
+def _migracion_duracion_citas_pg(cursor):
+    cursor.execute(f"ALTER TABLE citas ADD COLUMN IF NOT EXISTS duracion_min INTEGER NOT NULL DEFAULT {DURACION_CITA}")
+    cursor.execute("ALTER TABLE citas ADD COLUMN IF NOT EXISTS fecha_hora_fin TEXT")
+    cursor.execute("UPDATE citas SET fecha_hora_fin = to_char(fecha_hora::timestamp + duracion_min * interval '1 minute', "
+                   "'YYYY-MM-DD HH24:MI:SS') WHERE fecha_hora_fin IS NULL")
+
+def _migracion_series_citas_pg(cursor):
+    cursor.execute('''CREATE TABLE IF NOT EXISTS series_citas (
+                        id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+                        paciente_id INTEGER,
+                        medico_id INTEGER,
+                        frecuencia TEXT,
+                        intervalo INTEGER,
+                        duracion_min INTEGER,
+                        created_at TEXT DEFAULT to_char(now() AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS'))''')
+    cursor.execute("ALTER TABLE citas ADD COLUMN IF NOT EXISTS serie_id INTEGER")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_citas_serie ON citas(serie_id)")
+
+# Lista ordenada: (versión, descripción, función). Solo se agregan al final.
+MIGRACIONES = [
+    (1, "Esquema inicial", _migracion_esquema_inicial),
+    (2, "Índices de citas, HCE y tablas hijas", _migracion_indices_basicos),
+    (3, "Índice de citas por fecha", _migracion_indice_citas_fecha),
+    (4, "Resumen diario de citas", _migracion_resumen_diario),
+    (5, "Búsqueda de texto completo de pacientes", _migracion_pacientes_fts),
+    (6, "Búsqueda de texto completo en HCE", _migracion_hce_fts),
+    (7, "Índice de pacientes por nombre", _migracion_indice_pacientes_nombre),
+    (8, "Índice de pacientes pediátricos", _migracion_indice_pacientes_pediatrico),
+    (9, "Duración de las citas", _migracion_duracion_citas),
+    (10, "Horarios de atención de los médicos", _migracion_horarios_medico),
+    (11, "Series de citas recurrentes", _migracion_series_citas),
+]
+
+# Migraciones con SQL propio de PostgreSQL; las demás se comparten
+MIGRACIONES_POSTGRES = {
+    1: _migracion_esquema_inicial_pg,
+    4: _migracion_resumen_diario_pg,
+    5: _migracion_pacientes_fts_pg,
+    6: _migracion_hce_fts_pg,
+    9: _migracion_duracion_citas_pg,
+    11: _migracion_series_citas_pg,
+}
+
+SCHEMA_VERSION = MIGRACIONES[-1][0]
+
+_esquema_verificado = set()
+_esquema_lock = threading.Lock()
+
+def get_schema_version():
+    with db_connection() as conn:
+        return _get_backend().version(conn)
+
+def migrate():
+    """Aplica en una transacción las migraciones pendientes. Retorna la versión final."""
+    backend = _get_backend()
+    with db_connection() as conn:
+        backend.bloquear(conn)
+        # Se relee dentro del lock de escritura por si otro proceso migró antes
+        version = backend.version(conn)
+        cursor = conn.cursor()
+        for numero, descripcion, migracion in MIGRACIONES:
+            if numero > version:
+                if backend.nombre == 'postgres':
+                    migracion = MIGRACIONES_POSTGRES.get(numero, migracion)
+                migracion(cursor)
+                backend.fijar_version(conn, numero)
+                version = numero
+    return version
+
+def init_db():
+    """Deja el esquema al día. Tras la primera llamada del proceso no consulta la DB."""
+    clave = (DB_BACKEND, _clave_db())
+    if clave in _esquema_verificado:
+        return
+    with _esquema_lock:
+        if clave in _esquema_verificado:
+            return
+        if get_schema_version() < SCHEMA_VERSION:
+            migrate()
+        _esquema_verificado.add(clave)
+
+# --- CACHÉ DE DATOS DE REFERENCIA ---
+# Médicos y la relación usuario -> médico casi nunca cambian. Se guardan en una
+# caché del proceso con TTL; las escrituras incrementan un contador de
+# generación que invalida todas las entradas de inmediato.
+
+CACHE_TTL = 300  # segundos
+
+class ReferenceCache:
+    """Caché de lectura con TTL e invalidación por contador de generación."""
+
+    def __init__(self, ttl=CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._generacion = 0
+        self._entradas = {}  # clave -> (generacion, expira_en, valor)
+        self._lock = threading.Lock()
+
+    def get(self, clave, cargar):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada and entrada[0] == self._generacion and entrada[1] > ahora:
+                self.hits += 1
+                return entrada[2]
+            self.misses += 1
+            generacion = self._generacion
+        
+        valor = cargar()
+        with self._lock:
+            # Si hubo una escritura durante la carga, el valor puede estar desactualizado
+            if generacion == self._generacion:
+                self._entradas[clave] = (generacion, ahora + self.ttl, valor)
+        return valor
+
+    def invalidate(self):
+        with self._lock:
+            self._generacion += 1
+            self._entradas.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 1) if total else 0,
+                'generacion': self._generacion,
+                'entradas': len(self._entradas)
+            }
+
+_reference_cache = ReferenceCache()
+
+def _cacheado(clave, cargar):
+    # La clave incluye la base activa para no mezclar bases distintas (p. ej. en tests).
+    # Se devuelven copias para que las páginas no modifiquen el valor compartido.
+    valor = _reference_cache.get((_clave_db(),) + clave, cargar)
+    if isinstance(valor, list):
+        return [dict(v) for v in valor]
+    if isinstance(valor, dict):
+        return dict(valor)
+    return valor
+
+def invalidate_reference_cache():
+    """Invalida los datos de referencia cacheados (llamar tras modificar médicos o usuarios)."""
+    _reference_cache.invalidate()
+
+def get_cache_stats():
+    """Contadores de aciertos/fallos de la caché de datos de referencia."""
+    return _reference_cache.stats()
 
 # --- AUTH & USERS ---
 
 def verify_login(username, password):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT u.id, u.username, u.rol, m.id FROM usuarios u LEFT JOIN medicos m ON u.id = m.user_id WHERE u.username=? AND u.password=?", 
-                   (username, password))
-    row = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        row = conn.execute("SELECT id, username, rol FROM usuarios WHERE username=? AND password=?", 
+                           (username, password)).fetchone()
     if row:
-        # row: id, username, rol, medico_id
-        return {'user_id': row[0], 'username': row[1], 'rol': row[2], 'medico_id': row[3]}
+        return {'user_id': row[0], 'username': row[1], 'rol': row[2], 'medico_id': get_medico_id_by_user(row[0])}
     return None
 
+def get_medico_id_by_user(user_id):
+    def cargar():
+        with db_connection() as conn:
+            row = conn.execute("SELECT id FROM medicos WHERE user_id=?", (user_id,)).fetchone()
+        return row[0] if row else None
+    return _cacheado(('medico_id_by_user', user_id), cargar)
+
 def create_medico_con_usuario(nombre, especialidad, email, username, password):
-    conn = get_connection()
-    cursor = conn.cursor()
-    try:
+    def trabajo(cursor):
         cursor.execute("INSERT INTO usuarios (username, password, rol) VALUES (?, ?, ?)", 
                        (username, password, 'medico'))
         user_id = cursor.lastrowid
         cursor.execute("INSERT INTO medicos (nombre, especialidad, email, user_id) VALUES (?, ?, ?, ?)", 
                        (nombre, especialidad, email, user_id))
-        conn.commit()
+    
+    try:
+        _escribir(trabajo)
+        invalidate_reference_cache()
         return True
     except Exception as e:
         print(f"Error creating medico: {e}")
         return False
-    finally:
-        conn.close()
 
 def get_all_medicos():
-    conn = get_connection()
-    # Usamos pandas id possible but list of dicts is safer for portability
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, nombre, especialidad, email FROM medicos")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    def cargar():
+        with db_connection() as conn:
+            rows = conn.execute("SELECT id, nombre, especialidad, email FROM medicos").fetchall()
+        return [dict(row) for row in rows]
+    return _cacheado(('all_medicos',), cargar)
 
 def get_medico(id):
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM medicos WHERE id=?", (id,))
-    row = cursor.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    def cargar():
+        with db_connection() as conn:
+            row = conn.execute("SELECT * FROM medicos WHERE id=?", (id,)).fetchone()
+        return dict(row) if row else None
+    return _cacheado(('medico', id), cargar)
+
+# Horario de quien no tiene uno cargado: lunes a viernes de 08:00 a 18:00.
+# Bloques (dia_semana, 'HH:MM', 'HH:MM') con 0 = lunes, como date.weekday().
+HORARIO_POR_DEFECTO = tuple((dia, '08:00', '18:00') for dia in range(5))
+
+_HORA = re.compile(r'^([01]\d|2[0-3]):[0-5]\d$|^24:00$')
+
+def get_horarios_medicos():
+    """{medico_id: ((dia_semana, hora_inicio, hora_fin), ...)} de los médicos con horario cargado."""
+    def cargar():
+        with db_connection() as conn:
+            rows = conn.execute("SELECT medico_id, dia_semana, hora_inicio, hora_fin FROM horarios_medico "
+                                "ORDER BY medico_id, dia_semana, hora_inicio").fetchall()
+        horarios = {}
+        for medico_id, dia, inicio, fin in rows:
+            horarios[medico_id] = horarios.get(medico_id, ()) + ((dia, inicio, fin),)
+        return horarios
+    return _cacheado(('horarios_medicos',), cargar)
+
+def get_horario_medico(medico_id):
+    """Bloques semanales del médico, o HORARIO_POR_DEFECTO si no tiene uno cargado."""
+    return get_horarios_medicos().get(medico_id, HORARIO_POR_DEFECTO)
+
+def set_horario_medico(medico_id, bloques):
+    """Reemplaza el horario semanal del médico; bloques = [(dia_semana, 'HH:MM', 'HH:MM'), ...]."""
+    bloques = sorted((int(dia), inicio, fin) for dia, inicio, fin in bloques)
+    for dia, inicio, fin in bloques:
+        if not 0 <= dia <= 6 or not _HORA.match(inicio) or not _HORA.match(fin) or inicio >= fin:
+            raise ValueError(f"Bloque de horario inválido: {dia} {inicio}-{fin}")
+    for (dia, _, fin), (dia_sig, inicio_sig, _) in zip(bloques, bloques[1:]):
+        if dia == dia_sig and inicio_sig < fin:
+            raise ValueError(f"Bloques superpuestos el día {dia}: termina {fin} y empieza {inicio_sig}")
+
+    def trabajo(cursor):
+        cursor.execute("DELETE FROM horarios_medico WHERE medico_id = ?", (medico_id,))
+        cursor.executemany("INSERT INTO horarios_medico (medico_id, dia_semana, hora_inicio, hora_fin) "
+                           "VALUES (?, ?, ?, ?)", [(medico_id, *bloque) for bloque in bloques])
+    _escribir(trabajo)
+    invalidate_reference_cache()
 
 # --- PACIENTES ---
 
 def create_paciente(nombre, fecha_nacimiento, es_pediatrico, contacto, tutor_legal):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''INSERT INTO pacientes (nombre, fecha_nacimiento, es_pediatrico, contacto, tutor_legal)
-                      VALUES (?, ?, ?, ?, ?)''', 
-                   (nombre, fecha_nacimiento, es_pediatrico, contacto, tutor_legal))
-    id_paciente = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return id_paciente
+    def trabajo(cursor):
+        cursor.execute('''INSERT INTO pacientes (nombre, fecha_nacimiento, es_pediatrico, contacto, tutor_legal)
+                          VALUES (?, ?, ?, ?, ?)''', 
+                       (nombre, fecha_nacimiento, es_pediatrico, contacto, tutor_legal))
+        return cursor.lastrowid
+    return _escribir(trabajo)
 
 def get_all_pacientes():
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM pacientes ORDER BY nombre")
-    rows = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        rows = conn.execute("SELECT * FROM pacientes ORDER BY nombre").fetchall()
     return [dict(row) for row in rows]
 
+# Tamaño de página por defecto para listados y selectores de pacientes
+PAGE_SIZE = 50
+
+def list_pacientes(after_nombre=None, after_id=None, limit=PAGE_SIZE):
+    """
+    Página de pacientes ordenada por (nombre, id) usando paginación por keyset:
+    para la siguiente página se pasan el nombre y el id del último paciente
+    recibido. El costo no depende de cuántas páginas se hayan recorrido.
+    """
+    if after_nombre is None:
+        query = "SELECT * FROM pacientes ORDER BY nombre, id LIMIT ?"
+        params = (limit,)
+    else:
+        query = "SELECT * FROM pacientes WHERE (nombre, id) > (?, ?) ORDER BY nombre, id LIMIT ?"
+        params = (after_nombre, after_id or 0, limit)
+    
+    with db_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    return [dict(row) for row in rows]
+
+def get_resumen_clinica():
+    """
+    Métricas generales del dashboard en una sola consulta: total de pacientes,
+    pediátricos, adultos, médicos activos y citas de hoy. Se calculan con
+    COUNT/SUM en SQL, sin traer filas de pacientes a memoria.
+    """
+    query = '''SELECT
+                   (SELECT COUNT(*) FROM pacientes) AS total_pacientes,
+                   (SELECT COUNT(*) FROM pacientes WHERE es_pediatrico = 1) AS pediatricos,
+                   (SELECT COUNT(*) FROM medicos) AS medicos_activos,
+                   (SELECT COALESCE(SUM(total), 0) FROM citas_resumen_diario WHERE dia = ?) AS citas_hoy'''
+    
+    with snapshot_connection() as conn:
+        row = conn.execute(query, (date.today().isoformat(),)).fetchone()
+    
+    resumen = dict(row)
+    resumen['adultos'] = resumen['total_pacientes'] - resumen['pediatricos']
+    return resumen
+
 def get_paciente(id):
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM pacientes WHERE id=?", (id,))
-    row = cursor.fetchone()
-    conn.close()
+    with db_connection() as conn:
+        row = conn.execute("SELECT * FROM pacientes WHERE id=?", (id,)).fetchone()
     return dict(row) if row else None
 
-def search_pacientes(query):
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    # Buscar por nombre o ID
-    sql = "SELECT * FROM pacientes WHERE nombre LIKE ? OR CAST(id AS TEXT) LIKE ?"
-    param = f"%{query}%"
-    cursor.execute(sql, (param, param))
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+# Límite por defecto de resultados de búsqueda
+SEARCH_LIMIT = 50
+
+def _consulta_fts(texto):
+    """
+    Convierte el texto del usuario en una consulta FTS5 segura:
+    cada palabra entre comillas y como prefijo ('jua per' -> '"jua"* "per"*').
+    """
+    terminos = [t.replace('"', '""') for t in texto.split()]
+    return ' '.join(f'"{t}"*' for t in terminos if t)
+
+def _consulta_tsquery(texto):
+    """Equivalente PostgreSQL de _consulta_fts: 'jua per' -> 'jua:* & per:*'."""
+    return ' & '.join(f"{t}:*" for t in re.findall(r'\w+', texto))
+
+def search_pacientes(query, limit=SEARCH_LIMIT):
+    """
+    Busca pacientes por ID exacto o por nombre/contacto/tutor (sin acentos,
+    por prefijo de palabra), ordenados por relevancia.
+    """
+    query = (query or '').strip()
+    resultados = []
+    
+    with db_connection() as conn:
+        # Camino rápido: ID exacto
+        if query.isdigit():
+            row = conn.execute("SELECT * FROM pacientes WHERE id=?", (int(query),)).fetchone()
+            if row:
+                resultados.append(dict(row))
+        
+        if _es_postgres():
+            consulta = _consulta_tsquery(query)
+            # Pesos {D, C, B, A}: nombre (A) pesa 10 veces más que tutor (C), como en bm25
+            sql = '''SELECT p.* FROM pacientes_fts f
+                     JOIN pacientes p ON p.id = f.id,
+                          to_tsquery('simple', sin_acentos(?)) q
+                     WHERE f.documento @@ q
+                     ORDER BY ts_rank('{0, 0.1, 0.2, 1.0}', f.documento, q) DESC, p.id
+                     LIMIT ?'''
+        else:
+            consulta = _consulta_fts(query)
+            # bm25 con más peso para el nombre que para contacto y tutor
+            sql = '''SELECT p.* FROM pacientes_fts f
+                     JOIN pacientes p ON p.id = f.rowid
+                     WHERE pacientes_fts MATCH ?
+                     ORDER BY bm25(pacientes_fts, 10.0, 2.0, 1.0)
+                     LIMIT ?'''
+        
+        if consulta and len(resultados) < limit:
+            rows = conn.execute(sql, (consulta, limit)).fetchall()
+            ids = {r['id'] for r in resultados}
+            resultados.extend(dict(row) for row in rows if row['id'] not in ids)
+    
+    return resultados[:limit]
 
 # --- CITAS ---
 
 def update_paciente_sexo(paciente_id, sexo):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE pacientes SET sexo = ? WHERE id = ?", (sexo, paciente_id))
-    conn.commit()
-    conn.close()
+    _escribir(lambda cursor: cursor.execute("UPDATE pacientes SET sexo = ? WHERE id = ?", (sexo, paciente_id)))
 
 def update_paciente_registro(paciente_id, fecha_nacimiento, es_pediatrico, contacto, tutor_legal, sexo):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''UPDATE pacientes 
-                      SET fecha_nacimiento = ?, es_pediatrico = ?, contacto = ?, tutor_legal = ?, sexo = ?
-                      WHERE id = ?''', 
-                   (fecha_nacimiento, es_pediatrico, contacto, tutor_legal, sexo, paciente_id))
-    conn.commit()
-    conn.close()
-
-def create_cita(paciente_id, medico_id, fecha_hora):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO citas (paciente_id, medico_id, fecha_hora, estado) VALUES (?, ?, ?, 'Pendiente')",
-                   (paciente_id, medico_id, fecha_hora))
-    id_cita = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return id_cita
+    _escribir(lambda cursor: cursor.execute('''UPDATE pacientes 
+                                               SET fecha_nacimiento = ?, es_pediatrico = ?, contacto = ?, tutor_legal = ?, sexo = ?
+                                               WHERE id = ?''', 
+                                            (fecha_nacimiento, es_pediatrico, contacto, tutor_legal, sexo, paciente_id)))
+
+# --- Duración y solapamiento de citas ---
+# Una cita ocupa el intervalo semiabierto [fecha_hora, fecha_hora_fin). Como
+# ninguna dura más de DURACION_MAXIMA, las que pueden pisar [inicio, fin) tienen
+# fecha_hora en [inicio - DURACION_MAXIMA, fin): un rango acotado sobre
+# idx_citas_medico_fecha, sin importar cuántas citas tenga el médico.
+
+DURACION_CITA = 20         # minutos, por defecto
+DURACION_MAXIMA = 240      # minutos
+DURACIONES = (15, 20, 30, 45, 60, 90)
+
+# Estados que ya no ocupan el horario del médico
+ESTADOS_SIN_HORARIO = ('No-show', 'Cancelada')
+
+_FILTRO_SOLAPAMIENTO = f'''medico_id = ? AND fecha_hora >= ? AND fecha_hora < ? AND fecha_hora_fin > ?
+                           AND estado NOT IN ({', '.join(f"'{e}'" for e in ESTADOS_SIN_HORARIO)})'''
+
+def _intervalo_cita(fecha_hora, duracion_min):
+    """Retorna (inicio, fin, cota) como texto 'YYYY-MM-DD HH:MM:SS'; cota = inicio - DURACION_MAXIMA."""
+    if not 0 < duracion_min <= DURACION_MAXIMA:
+        raise ValueError(f"La duración debe estar entre 1 y {DURACION_MAXIMA} minutos")
+    if isinstance(fecha_hora, str):
+        fecha_hora = datetime.fromisoformat(fecha_hora)
+    formato = '%Y-%m-%d %H:%M:%S'
+    return (fecha_hora.strftime(formato),
+            (fecha_hora + timedelta(minutes=duracion_min)).strftime(formato),
+            (fecha_hora - timedelta(minutes=DURACION_MAXIMA)).strftime(formato))
+
+def create_cita(paciente_id, medico_id, fecha_hora, duracion_min=DURACION_CITA):
+    """Inserta la cita sin verificar solapamientos (cargas e importaciones); para agendar, reservar_cita."""
+    inicio, fin, _ = _intervalo_cita(fecha_hora, duracion_min)
+    def trabajo(cursor):
+        cursor.execute('''INSERT INTO citas (paciente_id, medico_id, fecha_hora, duracion_min, fecha_hora_fin, estado)
+                          VALUES (?, ?, ?, ?, ?, 'Pendiente')''',
+                       (paciente_id, medico_id, inicio, duracion_min, fin))
+        return cursor.lastrowid
+    return _escribir(trabajo)
+
+def reservar_cita(paciente_id, medico_id, fecha_hora, duracion_min=DURACION_CITA):
+    """
+    Agenda la cita solo si el médico está libre en [fecha_hora, fecha_hora + duración).
+    Verificación e inserción son una sola sentencia (INSERT ... WHERE NOT EXISTS)
+    dentro de una transacción con citas bloqueada: dos recepcionistas que
+    reservan el mismo horario a la vez no pueden duplicarlo.
+    Retorna el id de la cita, o None si el horario se superpone con otra.
+    """
+    inicio, fin, cota = _intervalo_cita(fecha_hora, duracion_min)
+    def trabajo(cursor):
+        cursor.execute(f'''INSERT INTO citas (paciente_id, medico_id, fecha_hora, duracion_min, fecha_hora_fin, estado)
+                           SELECT ?, ?, ?, ?, ?, 'Pendiente'
+                           WHERE NOT EXISTS (SELECT 1 FROM citas WHERE {_FILTRO_SOLAPAMIENTO})''',
+                       (paciente_id, medico_id, inicio, duracion_min, fin, medico_id, cota, fin, inicio))
+        return cursor.lastrowid if cursor.rowcount == 1 else None
+    return _escribir(trabajo, bloquear=('citas',))
+
+def get_citas_solapadas(medico_id, fecha_hora, duracion_min=DURACION_CITA):
+    """Citas vigentes del médico que se superponen con [fecha_hora, fecha_hora + duración)."""
+    inicio, fin, cota = _intervalo_cita(fecha_hora, duracion_min)
+    query = f'''SELECT id, paciente_id, fecha_hora, fecha_hora_fin, duracion_min, estado FROM citas
+                WHERE {_FILTRO_SOLAPAMIENTO} ORDER BY fecha_hora'''
+    with db_connection() as conn:
+        rows = conn.execute(query, (medico_id, cota, fin, inicio)).fetchall()
+    return [dict(row) for row in rows]
+
+# --- Series de citas ---
+# Todas las ocurrencias de una serie se verifican con una sola consulta: una
+# fila VALUES por ocurrencia, unida a citas por idx_citas_medico_fecha con el
+# mismo rango acotado que reservar_cita.
+
+MAX_OCURRENCIAS = 200
+
+def _conflictos_ocurrencias(conn, medico_id, intervalos, excluir_serie=None):
+    """intervalos = [(inicio, fin, cota), ...] -> {índice: [cita_id, ...]} de las que se superponen."""
+    if not intervalos:
+        return {}
+    valores = ', '.join(['(?, ?, ?, ?)'] * len(intervalos))
+    query = f'''WITH ocurrencias (n, inicio, fin, cota) AS (VALUES {valores})
+                SELECT o.n, c.id FROM ocurrencias o
+                JOIN citas c ON c.medico_id = ? AND c.fecha_hora >= o.cota AND c.fecha_hora < o.fin
+                             AND c.fecha_hora_fin > o.inicio
+                WHERE c.estado NOT IN ({', '.join(f"'{e}'" for e in ESTADOS_SIN_HORARIO)})'''
+    params = [valor for n, intervalo in enumerate(intervalos) for valor in (n, *intervalo)]
+    params.append(medico_id)
+    if excluir_serie is not None:
+        query += " AND (c.serie_id IS NULL OR c.serie_id <> ?)"
+        params.append(excluir_serie)
+    conflictos = {}
+    for n, cita_id in conn.execute(query + " ORDER BY o.n, c.fecha_hora", params):
+        conflictos.setdefault(int(n), []).append(cita_id)
+    return conflictos
+
+def get_conflictos_ocurrencias(medico_id, fechas_horas, duracion_min=DURACION_CITA, excluir_serie=None):
+    """
+    Verifica muchas ocurrencias del mismo médico en una sola consulta.
+    Retorna {índice en fechas_horas: [cita_id, ...]} de las que se superponen
+    con citas vigentes (las de excluir_serie no cuentan).
+    """
+    if len(fechas_horas) > MAX_OCURRENCIAS:
+        raise ValueError(f"Una serie admite hasta {MAX_OCURRENCIAS} citas")
+    intervalos = [_intervalo_cita(fecha_hora, duracion_min) for fecha_hora in fechas_horas]
+    with db_connection() as conn:
+        return _conflictos_ocurrencias(conn, medico_id, intervalos, excluir_serie)
+
+def create_serie_citas(paciente_id, medico_id, fechas_horas, duracion_min=DURACION_CITA,
+                       frecuencia=None, intervalo=None):
+    """
+    Crea la serie y sus citas en una sola transacción con citas bloqueada:
+    un executemany de INSERT ... WHERE NOT EXISTS, así que una ocurrencia que
+    se volvió a ocupar desde la verificación previa no se duplica, se omite.
+    Retorna (serie_id, fechas_horas efectivamente agendadas); si no se pudo
+    agendar ninguna, la serie no se crea y retorna (None, []).
+    """
+    if len(fechas_horas) > MAX_OCURRENCIAS:
+        raise ValueError(f"Una serie admite hasta {MAX_OCURRENCIAS} citas")
+    intervalos = [_intervalo_cita(fecha_hora, duracion_min) for fecha_hora in fechas_horas]
+
+    def trabajo(cursor):
+        cursor.execute('''INSERT INTO series_citas (paciente_id, medico_id, frecuencia, intervalo, duracion_min)
+                          VALUES (?, ?, ?, ?, ?)''', (paciente_id, medico_id, frecuencia, intervalo, duracion_min))
+        serie_id = cursor.lastrowid
+        cursor.executemany(f'''INSERT INTO citas (paciente_id, medico_id, fecha_hora, duracion_min, fecha_hora_fin,
+                                                  estado, serie_id)
+                               SELECT ?, ?, ?, ?, ?, 'Pendiente', ?
+                               WHERE NOT EXISTS (SELECT 1 FROM citas WHERE {_FILTRO_SOLAPAMIENTO})''',
+                           [(paciente_id, medico_id, inicio, duracion_min, fin, serie_id, medico_id, cota, fin, inicio)
+                            for inicio, fin, cota in intervalos])
+        agendadas = [row[0] for row in cursor.execute(
+            "SELECT fecha_hora FROM citas WHERE serie_id = ? ORDER BY fecha_hora", (serie_id,))]
+        if not agendadas:
+            # Todas se ocuparon desde la verificación: no queda una serie vacía
+            cursor.execute("DELETE FROM series_citas WHERE id = ?", (serie_id,))
+            return None, []
+        return serie_id, agendadas
+    return _escribir(trabajo, bloquear=('citas',))
+
+def get_series_paciente(paciente_id):
+    """Series del paciente con su médico, cantidad de citas, pendientes y rango de fechas."""
+    query = '''SELECT s.id, s.medico_id, m.nombre as medico_nombre, s.frecuencia, s.intervalo, s.duracion_min,
+                      count(c.id) as total,
+                      sum(CASE WHEN c.estado = 'Pendiente' THEN 1 ELSE 0 END) as pendientes,
+                      min(c.fecha_hora) as primera, max(c.fecha_hora) as ultima
+               FROM series_citas s
+               LEFT JOIN medicos m ON m.id = s.medico_id
+               LEFT JOIN citas c ON c.serie_id = s.id
+               WHERE s.paciente_id = ?
+               GROUP BY s.id, s.medico_id, m.nombre, s.frecuencia, s.intervalo, s.duracion_min
+               ORDER BY s.id DESC'''
+    with db_connection() as conn:
+        rows = conn.execute(query, (paciente_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+def get_citas_serie(serie_id):
+    with db_connection() as conn:
+        rows = conn.execute('''SELECT id, medico_id, fecha_hora, fecha_hora_fin, duracion_min, estado
+                               FROM citas WHERE serie_id = ? ORDER BY fecha_hora''', (serie_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+def _ahora():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+def update_serie_citas(serie_id, hora=None, duracion_min=None, medico_id=None, desde=None, en_horario=None):
+    """
+    Cambia de una vez las citas pendientes de la serie desde `desde` (por
+    defecto, ahora): nueva hora ('HH:MM', se mantiene cada fecha), duración
+    y/o médico. No se modifican las ocurrencias que quedarían superpuestas
+    con otras citas ni, si se da en_horario(medico_id, fecha_hora,
+    duracion_min) -> bool, las que quedarían fuera del horario de atención
+    (ver recurrencia.editar_serie). Verificación y cambios van en una
+    transacción con citas bloqueada.
+
+    La serie guarda el nuevo médico y duración solo si todas sus citas
+    pendientes cambiaron; si no, serie_actualizada es False y las que no se
+    movieron siguen con el médico y la duración anteriores.
+    Retorna {'actualizadas': n, 'en_conflicto': [fecha_hora, ...],
+    'fuera_de_horario': [fecha_hora, ...], 'serie_actualizada': bool}.
+    """
+    desde = desde or _ahora()
+
+    def trabajo(cursor):
+        cursor.execute("SELECT medico_id, duracion_min FROM series_citas WHERE id = ?", (serie_id,))
+        serie = cursor.fetchone()
+        if serie is None:
+            raise ValueError(f"No existe la serie {serie_id}")
+        nuevo_medico = medico_id or serie[0]
+        nueva_duracion = duracion_min or serie[1]
+        cursor.execute('''SELECT id, fecha_hora FROM citas
+                          WHERE serie_id = ? AND estado = 'Pendiente' AND fecha_hora >= ?
+                          ORDER BY fecha_hora''', (serie_id, desde))
+        citas = cursor.fetchall()
+        intervalos = [_intervalo_cita(f"{fecha_hora[:10]} {hora}:00" if hora else fecha_hora, nueva_duracion)
+                      for _, fecha_hora in citas]
+        conflictos = _conflictos_ocurrencias(cursor, nuevo_medico, intervalos, excluir_serie=serie_id)
+        fuera = set()
+        if en_horario is not None:
+            fuera = {n for n, (inicio, _, _) in enumerate(intervalos)
+                     if n not in conflictos and not en_horario(nuevo_medico, inicio, nueva_duracion)}
+        cambios = [(nuevo_medico, inicio, nueva_duracion, fin, cita_id)
+                   for n, ((cita_id, _), (inicio, fin, _)) in enumerate(zip(citas, intervalos))
+                   if n not in conflictos and n not in fuera]
+        cursor.executemany('''UPDATE citas SET medico_id = ?, fecha_hora = ?, duracion_min = ?, fecha_hora_fin = ?
+                              WHERE id = ?''', cambios)
+        serie_actualizada = len(cambios) == len(citas)
+        if serie_actualizada:
+            cursor.execute("UPDATE series_citas SET medico_id = ?, duracion_min = ? WHERE id = ?",
+                           (nuevo_medico, nueva_duracion, serie_id))
+        return {'actualizadas': len(cambios),
+                'en_conflicto': [citas[n][1] for n in sorted(conflictos)],
+                'fuera_de_horario': [citas[n][1] for n in sorted(fuera)],
+                'serie_actualizada': serie_actualizada}
+    return _escribir(trabajo, bloquear=('citas',))
+
+def cancelar_serie_citas(serie_id, desde=None):
+    """Cancela de una vez las citas pendientes de la serie desde `desde` (por defecto, ahora). Retorna cuántas."""
+    def trabajo(cursor):
+        cursor.execute('''UPDATE citas SET estado = 'Cancelada'
+                          WHERE serie_id = ? AND estado = 'Pendiente' AND fecha_hora >= ?''',
+                       (serie_id, desde or _ahora()))
+        return cursor.rowcount
+    return _escribir(trabajo)
+
+def _rango_fechas(fecha_inicio, fecha_fin=None):
+    """
+    Convierte días inclusivos ('YYYY-MM-DD' o date) en un rango semiabierto
+    [inicio, fin + 1 día) comparable directamente con fecha_hora.
+    Así el filtro usa el índice en vez de aplicar date() a cada fila.
+    """
+    if isinstance(fecha_inicio, str):
+        fecha_inicio = date.fromisoformat(fecha_inicio[:10])
+    if fecha_fin is None:
+        fecha_fin = fecha_inicio
+    elif isinstance(fecha_fin, str):
+        fecha_fin = date.fromisoformat(fecha_fin[:10])
+    return fecha_inicio.isoformat(), (fecha_fin + timedelta(days=1)).isoformat()
 
 def get_citas_by_medico_fecha(medico_id, fecha_str):
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = '''SELECT c.id, c.fecha_hora, c.estado, c.paciente_id, p.nombre as paciente_nombre 
+    query = '''SELECT c.id, c.fecha_hora, c.duracion_min, c.fecha_hora_fin, c.estado, c.paciente_id,
+                      p.nombre as paciente_nombre
                FROM citas c 
                JOIN pacientes p ON c.paciente_id = p.id
-               WHERE c.medico_id = ? AND date(c.fecha_hora) = ?
+               WHERE c.medico_id = ? AND c.fecha_hora >= ? AND c.fecha_hora < ?
                ORDER BY c.fecha_hora'''
     
-    cursor.execute(query, (medico_id, fecha_str))
-    rows = cursor.fetchall()
-    conn.close()
+    inicio, fin = _rango_fechas(fecha_str)
+    with db_connection() as conn:
+        rows = conn.execute(query, (medico_id, inicio, fin)).fetchall()
     return [dict(row) for row in rows]
 
+# Columnas de las filas de get_citas_rango, en orden
+COLUMNAS_CALENDARIO = ('id', 'medico_id', 'fecha_hora', 'fecha_hora_fin', 'estado', 'paciente_nombre')
+
+def get_citas_rango(fecha_inicio, fecha_fin, medico_id=None):
+    """
+    Citas entre los días inclusivos fecha_inicio y fecha_fin, de un médico o de
+    todos (medico_id=None), con una sola consulta por rango. Retorna tuplas
+    compactas (ver COLUMNAS_CALENDARIO) ordenadas por fecha_hora, para que la
+    vista de semana las agrupe en memoria.
+    """
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    query = '''SELECT c.id, c.medico_id, c.fecha_hora, c.fecha_hora_fin, c.estado, p.nombre
+               FROM citas c
+               JOIN pacientes p ON c.paciente_id = p.id
+               WHERE c.fecha_hora >= ? AND c.fecha_hora < ?'''
+    params = [inicio, fin]
+    if medico_id is not None:
+        query += " AND c.medico_id = ?"
+        params.append(medico_id)
+    query += " ORDER BY c.fecha_hora, c.medico_id"
+    with db_connection() as conn:
+        return [tuple(row) for row in conn.execute(query, params)]
+
+def get_citas_por_dia(fecha_inicio, fecha_fin, medico_id=None):
+    """
+    Conteo de citas por día y estado entre los días inclusivos fecha_inicio y
+    fecha_fin, leído del resumen diario: {'YYYY-MM-DD': {estado: total}}.
+    La cantidad de filas no depende de cuántos médicos haya (se agrupa en SQL).
+    """
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    query = "SELECT dia, estado, sum(total) FROM citas_resumen_diario WHERE dia >= ? AND dia < ?"
+    params = [inicio, fin]
+    if medico_id is not None:
+        query += " AND medico_id = ?"
+        params.append(medico_id)
+    query += " GROUP BY dia, estado"
+    with db_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    dias = {}
+    for dia, estado, total in rows:
+        if total:
+            dias.setdefault(dia, {})[estado] = total
+    return dias
+
+def get_citas_ocupadas(medico_ids, fecha_inicio, fecha_fin):
+    """
+    Intervalos (medico_id, fecha_hora, fecha_hora_fin) que ocupan horario entre
+    los días inclusivos fecha_inicio y fecha_fin, en una sola consulta por rango
+    que se resuelve entera en el índice cubriente idx_citas_medico_fecha.
+    """
+    if not medico_ids:
+        return []
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    # Incluye las que empezaron antes del rango y siguen ocupando al inicio
+    cota = (datetime.fromisoformat(inicio) - timedelta(minutes=DURACION_MAXIMA)).strftime('%Y-%m-%d %H:%M:%S')
+    query = f'''SELECT medico_id, fecha_hora, fecha_hora_fin FROM citas
+                WHERE medico_id IN ({', '.join('?' * len(medico_ids))})
+                  AND fecha_hora >= ? AND fecha_hora < ? AND fecha_hora_fin > ?
+                  AND estado NOT IN ({', '.join(f"'{e}'" for e in ESTADOS_SIN_HORARIO)})'''
+    with db_connection() as conn:
+        return [tuple(row) for row in conn.execute(query, [*medico_ids, cota, fin, inicio])]
+
 def update_estado_cita(cita_id, nuevo_estado):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE citas SET estado = ? WHERE id = ?", (nuevo_estado, cita_id))
-    conn.commit()
-    conn.close()
+    _escribir(lambda cursor: cursor.execute("UPDATE citas SET estado = ? WHERE id = ?", (nuevo_estado, cita_id)))
 
 def get_noshow_stats(medico_id, fecha_inicio, fecha_fin):
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Check date format to match sqlite (YYYY-MM-DD)
-    # Incoming dates are likely strings or date objects. 
-    # Calling code in agenda.py does .strftime('%Y-%m-%d'), so we get strings.
-    
-    base_query = "SELECT count(*), estado FROM citas WHERE date(fecha_hora) BETWEEN ? AND ?"
-    params = [fecha_inicio, fecha_fin]
+    # Fechas inclusivas 'YYYY-MM-DD' (o date); se consultan como rango semiabierto
+    # sobre el resumen diario en lugar de las filas de citas
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    base_query = "SELECT sum(total), estado FROM citas_resumen_diario WHERE dia >= ? AND dia < ?"
+    params = [inicio, fin]
     
     if medico_id:
         base_query += " AND medico_id = ?"
@@ -308,19 +1562,32 @@ def get_noshow_stats(medico_id, fecha_inicio, fecha_fin):
         
     base_query += " GROUP BY estado"
     
-    cursor.execute(base_query, params)
-    rows = cursor.fetchall()
-    conn.close()
+    with snapshot_connection() as conn:
+        rows = conn.execute(base_query, params).fetchall()
     
+    return _calcular_stats(rows)
+
+def _calcular_stats(rows):
+    """
+    Convierte filas (count, estado) en el dict de estadísticas de asistencia.
+    Las citas canceladas no cuentan como citas ni como asistencia: solo se
+    informan en total_canceladas.
+    """
     stats = {
         'total_citas': 0,
         'total_completadas': 0,
         'total_noshows': 0,
-        'tasa_asistencia': 0
+        'total_canceladas': 0,
+        'tasa_asistencia': 0,
+        'por_estado': {}
     }
     
     for count, estado in rows:
+        if estado == 'Cancelada':
+            stats['total_canceladas'] = count
+            continue
         stats['total_citas'] += count
+        stats['por_estado'][estado] = count
         if estado == 'Completada':
             stats['total_completadas'] = count
         elif estado == 'No-show':
@@ -331,90 +1598,421 @@ def get_noshow_stats(medico_id, fecha_inicio, fecha_fin):
         
     return stats
 
+def get_citas_stats_por_medico(fecha_inicio, fecha_fin, medico_ids=()):
+    """
+    Estadísticas de todos los médicos en un rango de fechas con una sola
+    consulta agrupada (GROUP BY medico_id, estado).
+    Retorna {medico_id: stats} con el mismo formato que get_noshow_stats.
+    Los médicos de medico_ids sin citas en el rango aparecen con stats en cero.
+    """
+    inicio, fin = _rango_fechas(fecha_inicio, fecha_fin)
+    query = '''SELECT medico_id, sum(total), estado FROM citas_resumen_diario
+               WHERE dia >= ? AND dia < ?
+               GROUP BY medico_id, estado'''
+    
+    with snapshot_connection() as conn:
+        rows = conn.execute(query, (inicio, fin)).fetchall()
+    
+    conteos = {medico_id: [] for medico_id in medico_ids}
+    for medico_id, count, estado in rows:
+        conteos.setdefault(medico_id, []).append((count, estado))
+    return {medico_id: _calcular_stats(filas) for medico_id, filas in conteos.items()}
+
+def get_citas_hoy_por_medico(medico_ids=()):
+    """Estadísticas del día actual por médico (ver get_citas_stats_por_medico)."""
+    hoy = date.today()
+    return get_citas_stats_por_medico(hoy, hoy, medico_ids)
+
+# --- RESUMEN DIARIO DE CITAS ---
+
+_SQL_RESUMEN_DESDE_CITAS = '''SELECT COALESCE(medico_id, 0), substr(fecha_hora, 1, 10), COALESCE(estado, ''), count(*)
+                              FROM citas
+                              GROUP BY 1, 2, 3'''
+
+def _reconstruir_resumen_diario(cursor):
+    cursor.execute("DELETE FROM citas_resumen_diario")
+    cursor.execute("INSERT INTO citas_resumen_diario (medico_id, dia, estado, total) " + _SQL_RESUMEN_DESDE_CITAS)
+
+def verificar_resumen_diario(reparar=False):
+    """
+    Recalcula el resumen desde citas y lo compara con citas_resumen_diario.
+    Retorna la lista de diferencias (medico_id, dia, estado, esperado, actual).
+    Con reparar=True reconstruye el resumen en la misma transacción.
+    """
+    with db_connection() as conn:
+        _get_backend().bloquear(conn, ('citas', 'citas_resumen_diario'))
+        esperado = {tuple(row[:3]): row[3] for row in conn.execute(_SQL_RESUMEN_DESDE_CITAS)}
+        actual = {tuple(row[:3]): row[3] for row in conn.execute(
+            "SELECT medico_id, dia, estado, total FROM citas_resumen_diario")}
+
+        diferencias = []
+        for clave in sorted(set(esperado) | set(actual)):
+            if esperado.get(clave, 0) != actual.get(clave, 0):
+                medico_id, dia, estado = clave
+                diferencias.append({
+                    'medico_id': medico_id, 'dia': dia, 'estado': estado,
+                    'esperado': esperado.get(clave, 0), 'actual': actual.get(clave, 0)
+                })
+
+        if reparar and diferencias:
+            _reconstruir_resumen_diario(conn.cursor())
+    return diferencias
+
 # --- HCE (HISTORIA CLINICA) ---
+# Los _insert_* reciben un cursor para poder combinarse en una sola transacción
 
-def create_hce_comun(paciente_id, medico_id, fecha_consulta, motivo_consulta, fc, ta_sistolica, ta_diastolica, sato2, observaciones, diagnostico=None, ef_general=None, ef_cardio=None, ef_respiratorio=None, ef_otros=None, ecg_hallazgos=None, echo_hallazgos=None, cita_id=None):
-    conn = get_connection()
-    cursor = conn.cursor()
+def _insert_hce_comun(cursor, paciente_id, medico_id, fecha_consulta, motivo_consulta, fc, ta_sistolica, ta_diastolica, sato2, observaciones, diagnostico=None, ef_general=None, ef_cardio=None, ef_respiratorio=None, ef_otros=None, ecg_hallazgos=None, echo_hallazgos=None, cita_id=None):
     cursor.execute('''INSERT INTO hce_comun 
                       (paciente_id, medico_id, cita_id, fecha_consulta, motivo_consulta, diagnostico, fc, ta_sistolica, ta_diastolica, sato2, ef_general, ef_cardio, ef_respiratorio, ef_otros, ecg_hallazgos, echo_hallazgos, observaciones)
                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                    (paciente_id, medico_id, cita_id, fecha_consulta, motivo_consulta, diagnostico, fc, ta_sistolica, ta_diastolica, sato2, ef_general, ef_cardio, ef_respiratorio, ef_otros, ecg_hallazgos, echo_hallazgos, observaciones))
-    hce_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return hce_id
+    return cursor.lastrowid
 
-def create_hce_infantil(hce_comun_id, peso_kg, talla_cm, percentil_peso, percentil_talla, zscore_aortico, zscore_pulmonar, zscore_mitral, zscore_tricuspide, ductus_estado, ductus_tamaño_mm):
-    conn = get_connection()
-    cursor = conn.cursor()
+def _insert_hce_infantil(cursor, hce_comun_id, peso_kg, talla_cm, percentil_peso, percentil_talla, zscore_aortico, zscore_pulmonar, zscore_mitral, zscore_tricuspide, ductus_estado, ductus_tamaño_mm):
     cursor.execute('''INSERT INTO hce_infantil
                       (hce_comun_id, peso_kg, talla_cm, percentil_peso, percentil_talla, zscore_aortico, zscore_pulmonar, zscore_mitral, zscore_tricuspide, ductus_estado, ductus_tamano_mm)
                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                    (hce_comun_id, peso_kg, talla_cm, percentil_peso, percentil_talla, zscore_aortico, zscore_pulmonar, zscore_mitral, zscore_tricuspide, ductus_estado, ductus_tamaño_mm))
-    conn.commit()
-    conn.close()
+    return cursor.lastrowid
 
-def create_hce_adulto(hce_comun_id, tiene_hta, tiene_diabetes, tabaquismo, colesterol_total, colesterol_hdl, riesgo_cardiovascular_score, riesgo_cardiovascular_framingham, clasificacion_riesgo):
-    conn = get_connection()
-    cursor = conn.cursor()
+def _insert_hce_adulto(cursor, hce_comun_id, tiene_hta, tiene_diabetes, tabaquismo, colesterol_total, colesterol_hdl, riesgo_cardiovascular_score, riesgo_cardiovascular_framingham, clasificacion_riesgo):
     cursor.execute('''INSERT INTO hce_adulto
                       (hce_comun_id, tiene_hta, tiene_diabetes, tabaquismo, colesterol_total, colesterol_hdl, riesgo_cardiovascular_score, riesgo_cardiovascular_framingham, clasificacion_riesgo)
                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
                    (hce_comun_id, tiene_hta, tiene_diabetes, tabaquismo, colesterol_total, colesterol_hdl, riesgo_cardiovascular_score, riesgo_cardiovascular_framingham, clasificacion_riesgo))
-    conn.commit()
-    conn.close()
+    return cursor.lastrowid
 
-def get_hce_by_paciente(paciente_id):
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+def create_hce_comun(paciente_id, medico_id, fecha_consulta, motivo_consulta, fc, ta_sistolica, ta_diastolica, sato2, observaciones, diagnostico=None, ef_general=None, ef_cardio=None, ef_respiratorio=None, ef_otros=None, ecg_hallazgos=None, echo_hallazgos=None, cita_id=None):
+    return _escribir(lambda cursor: _insert_hce_comun(cursor, paciente_id, medico_id, fecha_consulta, motivo_consulta, fc, ta_sistolica, ta_diastolica, sato2, observaciones,
+                                                      diagnostico, ef_general, ef_cardio, ef_respiratorio, ef_otros, ecg_hallazgos, echo_hallazgos, cita_id))
+
+def create_hce_infantil(hce_comun_id, peso_kg, talla_cm, percentil_peso, percentil_talla, zscore_aortico, zscore_pulmonar, zscore_mitral, zscore_tricuspide, ductus_estado, ductus_tamaño_mm):
+    _escribir(lambda cursor: _insert_hce_infantil(cursor, hce_comun_id, peso_kg, talla_cm, percentil_peso, percentil_talla, zscore_aortico, zscore_pulmonar, zscore_mitral, zscore_tricuspide, ductus_estado, ductus_tamaño_mm))
+
+def create_hce_adulto(hce_comun_id, tiene_hta, tiene_diabetes, tabaquismo, colesterol_total, colesterol_hdl, riesgo_cardiovascular_score, riesgo_cardiovascular_framingham, clasificacion_riesgo):
+    _escribir(lambda cursor: _insert_hce_adulto(cursor, hce_comun_id, tiene_hta, tiene_diabetes, tabaquismo, colesterol_total, colesterol_hdl, riesgo_cardiovascular_score, riesgo_cardiovascular_framingham, clasificacion_riesgo))
+
+def save_consulta(paciente_id, medico_id, consulta, hce_tipo=None, hce_detalle=None, examenes=(), recetas=(), sexo=None):
+    """
+    Guarda una consulta completa en una sola transacción: HCE común, detalle
+    infantil/adulto, sexo del paciente, exámenes y recetas (con executemany).
+    Si algo falla no queda ningún registro a medias.
+
+    consulta: dict con los campos de hce_comun (fecha_consulta, motivo_consulta, fc, ...).
+    hce_tipo: 'infantil', 'adulto' o None. hce_detalle: campos de esa tabla.
+    examenes / recetas: listas de dicts con las claves usadas en hce.py.
+
+    Retorna un dict con hce_comun_id, hce_detalle_id, examenes_ids y recetas_ids.
+    """
+    def trabajo(cursor):
+        hce_comun_id = _insert_hce_comun(cursor, paciente_id=paciente_id, medico_id=medico_id, **consulta)
+
+        hce_detalle_id = None
+        if hce_tipo == 'infantil':
+            hce_detalle_id = _insert_hce_infantil(cursor, hce_comun_id, **hce_detalle)
+        elif hce_tipo == 'adulto':
+            hce_detalle_id = _insert_hce_adulto(cursor, hce_comun_id, **hce_detalle)
+
+        if sexo:
+            cursor.execute("UPDATE pacientes SET sexo = ? WHERE id = ?", (sexo, paciente_id))
+
+        cursor.executemany("INSERT INTO indicaciones_examenes (hce_id, tipo_examen, indicacion) VALUES (?, ?, ?)",
+                           [(hce_comun_id, ex['tipo_examen'], ex['indicacion']) for ex in examenes])
+        cursor.executemany('''INSERT INTO recetas_medicas 
+                              (hce_id, medicamento, dosis, frecuencia, duracion, indicaciones_adicionales)
+                              VALUES (?, ?, ?, ?, ?, ?)''',
+                           [(hce_comun_id, rx['medicamento'], rx['dosis'], rx['frecuencia'], rx['duracion'], rx['indicaciones_adicionales'])
+                            for rx in recetas])
+
+        # executemany no expone los ids; la HCE es nueva, así que sus hijos son exactamente estos
+        examenes_ids = [row[0] for row in cursor.execute("SELECT id FROM indicaciones_examenes WHERE hce_id=? ORDER BY id", (hce_comun_id,))]
+        recetas_ids = [row[0] for row in cursor.execute("SELECT id FROM recetas_medicas WHERE hce_id=? ORDER BY id", (hce_comun_id,))]
+
+        return {
+            'hce_comun_id': hce_comun_id,
+            'hce_detalle_id': hce_detalle_id,
+            'examenes_ids': examenes_ids,
+            'recetas_ids': recetas_ids
+        }
     
+    return _escribir(trabajo)
+
+def get_hce_by_paciente(paciente_id):
     query = '''SELECT h.*, m.nombre as medico_nombre 
                FROM hce_comun h
                LEFT JOIN medicos m ON h.medico_id = m.id
                WHERE h.paciente_id = ?
                ORDER BY h.fecha_consulta DESC'''
                
-    cursor.execute(query, (paciente_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        rows = conn.execute(query, (paciente_id,)).fetchall()
     return [dict(row) for row in rows]
 
+def get_historia_completa(paciente_id):
+    """
+    Historia clínica completa de un paciente con un número fijo de consultas
+    (5, sin importar cuántas visitas tenga): consultas, detalle infantil/adulto,
+    exámenes y recetas. Retorna la lista de consultas (más reciente primero),
+    cada una con las claves 'detalle_infantil', 'detalle_adulto' (dict o None),
+    'indicaciones' y 'recetas' (listas).
+    """
+    subconsulta = "SELECT id FROM hce_comun WHERE paciente_id = ?"
+    with db_connection() as conn:
+        consultas = [dict(row) for row in conn.execute('''SELECT h.*, m.nombre as medico_nombre 
+                                                          FROM hce_comun h
+                                                          LEFT JOIN medicos m ON h.medico_id = m.id
+                                                          WHERE h.paciente_id = ?
+                                                          ORDER BY h.fecha_consulta DESC''', (paciente_id,))]
+        infantiles = conn.execute(f"SELECT * FROM hce_infantil WHERE hce_comun_id IN ({subconsulta})", (paciente_id,)).fetchall()
+        adultos = conn.execute(f"SELECT * FROM hce_adulto WHERE hce_comun_id IN ({subconsulta})", (paciente_id,)).fetchall()
+        indicaciones = conn.execute(f"SELECT * FROM indicaciones_examenes WHERE hce_id IN ({subconsulta}) ORDER BY id", (paciente_id,)).fetchall()
+        recetas = conn.execute(f"SELECT * FROM recetas_medicas WHERE hce_id IN ({subconsulta}) ORDER BY id", (paciente_id,)).fetchall()
+    
+    por_id = {}
+    for consulta in consultas:
+        consulta.update({'detalle_infantil': None, 'detalle_adulto': None, 'indicaciones': [], 'recetas': []})
+        por_id[consulta['id']] = consulta
+    
+    for row in infantiles:
+        por_id[row['hce_comun_id']]['detalle_infantil'] = dict(row)
+    for row in adultos:
+        por_id[row['hce_comun_id']]['detalle_adulto'] = dict(row)
+    for row in indicaciones:
+        por_id[row['hce_id']]['indicaciones'].append(dict(row))
+    for row in recetas:
+        por_id[row['hce_id']]['recetas'].append(dict(row))
+    
+    return consultas
+
+def search_hce(texto, medico_id=None, fecha_inicio=None, fecha_fin=None, limit=SEARCH_LIMIT, marca=('**', '**')):
+    """
+    Busca consultas por el texto de sus campos narrativos (diagnóstico, motivo,
+    examen físico, ECG, eco, observaciones), sin acentos y por prefijo.
+    Filtros opcionales por médico y por rango de fechas inclusivo.
+    Cada resultado incluye 'fragmento': el trozo coincidente con los términos
+    resaltados entre las marcas dadas (markdown en negrita por defecto).
+    """
+    columnas = '''h.id, h.paciente_id, p.nombre as paciente_nombre, h.medico_id,
+                   m.nombre as medico_nombre, h.fecha_consulta, h.motivo_consulta, h.diagnostico'''
+    if _es_postgres():
+        consulta = _consulta_tsquery(texto or '')
+        # El fragmento se arma en Python (_fragmento) sobre el texto original:
+        # ts_headline no reconoce "Fibrilación" al buscar "fibrilacion"
+        query = f'''SELECT {columnas},
+                          concat_ws(' ', {', '.join('h.' + c for c in HCE_CAMPOS_TEXTO)}) as fragmento
+                   FROM hce_fts f
+                   JOIN hce_comun h ON h.id = f.id
+                   LEFT JOIN pacientes p ON h.paciente_id = p.id
+                   LEFT JOIN medicos m ON h.medico_id = m.id,
+                   to_tsquery('simple', sin_acentos(?)) q
+                   WHERE f.documento @@ q'''
+        params = [consulta]
+        orden = " ORDER BY ts_rank(f.documento, q) DESC, h.id LIMIT ?"
+    else:
+        consulta = _consulta_fts(texto or '')
+        query = f'''SELECT {columnas},
+                          snippet(hce_fts, -1, ?, ?, '…', 16) as fragmento
+                   FROM hce_fts
+                   JOIN hce_comun h ON h.id = hce_fts.rowid
+                   LEFT JOIN pacientes p ON h.paciente_id = p.id
+                   LEFT JOIN medicos m ON h.medico_id = m.id
+                   WHERE hce_fts MATCH ?'''
+        params = [marca[0], marca[1], consulta]
+        orden = " ORDER BY bm25(hce_fts) LIMIT ?"
+    if not consulta:
+        return []
+    
+    if medico_id:
+        query += " AND h.medico_id = ?"
+        params.append(medico_id)
+    if fecha_inicio:
+        query += " AND h.fecha_consulta >= ?"
+        params.append(_rango_fechas(fecha_inicio)[0])
+    if fecha_fin:
+        query += " AND h.fecha_consulta < ?"
+        params.append(_rango_fechas(fecha_fin)[1])
+    
+    query += orden
+    params.append(limit)
+    
+    with db_connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    resultados = [dict(row) for row in rows]
+    if _es_postgres():
+        for r in resultados:
+            r['fragmento'] = _fragmento(r['fragmento'], texto, marca)
+    return resultados
+
+# Mismo plegado de acentos que sin_acentos() en PostgreSQL
+_SIN_ACENTOS = str.maketrans('áàäâãéèëêíìïîóòöôõúùüûñç', 'aaaaaeeeeiiiiooooouuuunc')
+
+def _fragmento(texto, busqueda, marca, palabras=16):
+    """
+    Equivalente a snippet() de FTS5: ventana de hasta `palabras` palabras
+    alrededor de la primera coincidencia, con las palabras que empiezan por
+    algún término de la búsqueda (sin acentos) entre las marcas.
+    """
+    terminos = [t.lower().translate(_SIN_ACENTOS) for t in re.findall(r'\w+', busqueda)]
+    tokens = list(re.finditer(r'\w+', texto))
+    coincide = [any(t.group().lower().translate(_SIN_ACENTOS).startswith(term) for term in terminos)
+                for t in tokens]
+    if not tokens:
+        return ''
+    primera = coincide.index(True) if True in coincide else 0
+    inicio = max(0, min(primera - 2, len(tokens) - palabras))
+    fin = min(len(tokens), inicio + palabras)
+    
+    partes = ['…' if inicio > 0 else '']
+    pos = tokens[inicio].start()
+    for token, marcado in zip(tokens[inicio:fin], coincide[inicio:fin]):
+        partes.append(texto[pos:token.start()])
+        partes.append(f"{marca[0]}{token.group()}{marca[1]}" if marcado else token.group())
+        pos = token.end()
+    partes.append('…' if fin < len(tokens) else texto[pos:])
+    return ''.join(partes)
+
+# --- LECTURA EN STREAMING ---
+# Variantes generadoras para exportaciones y análisis de tablas grandes: leen
+# en lotes de fetchmany, así la memoria no depende del tamaño del resultado.
+
+STREAM_BATCH_SIZE = 1000
+
+def _iter_query(query, params=(), batch_size=STREAM_BATCH_SIZE):
+    # La conexión vuelve al pool cuando el generador se agota o se cierra
+    with db_connection() as conn:
+        if _es_postgres():
+            # Cursor del lado del servidor: sin él psycopg trae todo el resultado de una vez
+            cursor = conn.cursor('iter_query').execute(query, params)
+        else:
+            cursor = conn.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+
+def _filtro_rango(columna, fecha_inicio, fecha_fin):
+    condiciones, params = [], []
+    if fecha_inicio:
+        condiciones.append(f"{columna} >= ?")
+        params.append(_rango_fechas(fecha_inicio)[0])
+    if fecha_fin:
+        condiciones.append(f"{columna} < ?")
+        params.append(_rango_fechas(fecha_fin)[1])
+    where = (" WHERE " + " AND ".join(condiciones)) if condiciones else ""
+    return where, params
+
+def iter_pacientes(batch_size=STREAM_BATCH_SIZE):
+    return _iter_query("SELECT * FROM pacientes ORDER BY id", (), batch_size)
+
+def iter_citas(fecha_inicio=None, fecha_fin=None, batch_size=STREAM_BATCH_SIZE):
+    where, params = _filtro_rango("fecha_hora", fecha_inicio, fecha_fin)
+    return _iter_query(f"SELECT * FROM citas{where} ORDER BY fecha_hora", params, batch_size)
+
+def iter_hce(fecha_inicio=None, fecha_fin=None, batch_size=STREAM_BATCH_SIZE):
+    where, params = _filtro_rango("fecha_consulta", fecha_inicio, fecha_fin)
+    return _iter_query(f"SELECT * FROM hce_comun{where} ORDER BY id", params, batch_size)
+
+def iter_hce_adulto(fecha_inicio=None, fecha_fin=None, batch_size=STREAM_BATCH_SIZE):
+    """Detalle adulto junto con la fecha y el paciente de su consulta."""
+    where, params = _filtro_rango("h.fecha_consulta", fecha_inicio, fecha_fin)
+    query = f'''SELECT a.*, h.fecha_consulta, h.paciente_id, h.medico_id
+                FROM hce_adulto a JOIN hce_comun h ON h.id = a.hce_comun_id{where}
+                ORDER BY a.id'''
+    return _iter_query(query, params, batch_size)
+
+def exportar_csv(filas, destino):
+    """
+    Escribe un iterable de dicts (p. ej. iter_citas()) como CSV sin
+    materializarlo. destino puede ser una ruta o un archivo de texto abierto.
+    Retorna la cantidad de filas escritas.
+    """
+    if isinstance(destino, str):
+        with open(destino, 'w', newline='', encoding='utf-8') as f:
+            return exportar_csv(filas, f)
+    
+    writer = None
+    total = 0
+    for fila in filas:
+        if writer is None:
+            writer = csv.DictWriter(destino, fieldnames=list(fila.keys()))
+            writer.writeheader()
+        writer.writerow(fila)
+        total += 1
+    return total
+
 # --- INDICACIONES Y RECETAS ---
 
 def create_indicacion_examen(hce_id, tipo_examen, indicacion):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO indicaciones_examenes (hce_id, tipo_examen, indicacion) VALUES (?, ?, ?)",
-                   (hce_id, tipo_examen, indicacion))
-    conn.commit()
-    conn.close()
+    _escribir(lambda cursor: cursor.execute("INSERT INTO indicaciones_examenes (hce_id, tipo_examen, indicacion) VALUES (?, ?, ?)",
+                                            (hce_id, tipo_examen, indicacion)))
 
 def get_indicaciones_by_hce(hce_id):
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM indicaciones_examenes WHERE hce_id=?", (hce_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        rows = conn.execute("SELECT * FROM indicaciones_examenes WHERE hce_id=?", (hce_id,)).fetchall()
     return [dict(row) for row in rows]
 
 def create_receta(hce_id, medicamento, dosis, frecuencia, duracion, indicaciones_adicionales):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''INSERT INTO recetas_medicas 
-                      (hce_id, medicamento, dosis, frecuencia, duracion, indicaciones_adicionales)
-                      VALUES (?, ?, ?, ?, ?, ?)''',
-                   (hce_id, medicamento, dosis, frecuencia, duracion, indicaciones_adicionales))
-    conn.commit()
-    conn.close()
+    _escribir(lambda cursor: cursor.execute('''INSERT INTO recetas_medicas 
+                                               (hce_id, medicamento, dosis, frecuencia, duracion, indicaciones_adicionales)
+                                               VALUES (?, ?, ?, ?, ?, ?)''',
+                                            (hce_id, medicamento, dosis, frecuencia, duracion, indicaciones_adicionales)))
 
 def get_recetas_by_hce(hce_id):
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM recetas_medicas WHERE hce_id=?", (hce_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        rows = conn.execute("SELECT * FROM recetas_medicas WHERE hce_id=?", (hce_id,)).fetchall()
     return [dict(row) for row in rows]
+
+
+# --- INSTRUMENTACIÓN ---
+# Cada función pública de este módulo queda medida (duración, filas, consultas
+# lentas; ver metricas.py). Se excluye la infraestructura de conexiones y
+# estadísticas, que no consulta datos clínicos.
+if metricas.INSTRUMENTACION:
+    metricas.instrumentar_modulo(globals(), excluir={
+        'get_connection', 'configurar_backend', 'close_pool', 'db_connection',
+        'close_snapshot', 'snapshot_connection', 'get_snapshot_info',
+        'close_write_queue', 'get_write_queue_stats',
+        'invalidate_reference_cache', 'get_cache_stats',
+    })
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Tareas de mantenimiento de la base de datos")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    p_resumen = subparsers.add_parser('resumen-diario', help="Verifica el resumen diario de citas")
+    p_resumen.add_argument('--reparar', action='store_true', help="Reconstruye el resumen si hay diferencias")
+
+    p_exportar = subparsers.add_parser('exportar', help="Exporta una tabla a CSV en streaming")
+    p_exportar.add_argument('tabla', choices=['pacientes', 'citas', 'hce'])
+    p_exportar.add_argument('destino', help="Ruta del archivo CSV")
+    p_exportar.add_argument('--desde', help="Fecha inicial YYYY-MM-DD (citas y hce)")
+    p_exportar.add_argument('--hasta', help="Fecha final YYYY-MM-DD inclusive (citas y hce)")
+
+    args = parser.parse_args()
+    init_db()
+
+    if args.comando == 'resumen-diario':
+        diferencias = verificar_resumen_diario(reparar=args.reparar)
+        for d in diferencias:
+            print(f"Médico {d['medico_id']} {d['dia']} {d['estado']}: esperado {d['esperado']}, actual {d['actual']}")
+        if not diferencias:
+            print("Resumen diario consistente.")
+        elif args.reparar:
+            print(f"{len(diferencias)} diferencia(s) corregida(s).")
+        else:
+            print(f"{len(diferencias)} diferencia(s). Ejecute con --reparar para reconstruir.")
+            raise SystemExit(1)
+
+    elif args.comando == 'exportar':
+        if args.tabla == 'pacientes':
+            filas = iter_pacientes()
+        elif args.tabla == 'citas':
+            filas = iter_citas(args.desde, args.hasta)
+        else:
+            filas = iter_hce(args.desde, args.hasta)
+        print(f"{exportar_csv(filas, args.destino)} fila(s) exportada(s) a {args.destino}")
@@ -0,0 +1,180 @@
+"""
+Motor de disponibilidad: horarios libres de los médicos.
+
+Cada día de cada médico se representa como un mapa de bits de ranuras de
+RESOLUCION_MIN minutos (un int de Python: bit i = minuto i * RESOLUCION_MIN).
+El mapa libre es el horario de atención menos las citas que ocupan horario.
+Un turno de k ranuras puede empezar en i si los bits i..i+k-1 están libres;
+eso se calcula para todo el día a la vez con k desplazamientos y AND, sin
+recorrer las citas una por una.
+
+Las citas se leen con una consulta por rango y por semana, resuelta en un
+índice cubriente (db.get_citas_ocupadas); se avanza a la semana siguiente solo
+si faltan turnos. Los horarios salen de la caché de referencia.
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import database as db
+
+RESOLUCION_MIN = 5
+RANURAS_DIA = 24 * 60 // RESOLUCION_MIN
+SEMANAS = 8
+
+
+def _ranura(hora):
+    """'HH:MM' o 'HH:MM:SS' -> número de ranura (redondeando hacia abajo)."""
+    return (int(hora[:2]) * 60 + int(hora[3:5])) // RESOLUCION_MIN
+
+
+def _ranura_fin(hora):
+    """Como _ranura pero redondeando hacia arriba: la ranura donde termina lo ocupado."""
+    return -(-(int(hora[:2]) * 60 + int(hora[3:5])) // RESOLUCION_MIN)
+
+
+def _bits(desde, hasta):
+    """Máscara con las ranuras [desde, hasta)."""
+    return ((1 << (hasta - desde)) - 1) << desde if hasta > desde else 0
+
+
+def _mascara_horario(bloques):
+    """{dia_semana: máscara} de los bloques de atención semanales."""
+    mascaras = [0] * 7
+    for dia, inicio, fin in bloques:
+        mascaras[dia] |= _bits(_ranura(inicio), _ranura_fin(fin))
+    return mascaras
+
+
+def dentro_de_horario(horario, fecha_hora, duracion_min):
+    """
+    Si [fecha_hora, fecha_hora + duracion_min) cae entero dentro de los bloques
+    de atención `horario` ((dia_semana, 'HH:MM', 'HH:MM'), ...). fecha_hora es
+    un datetime o texto 'YYYY-MM-DD HH:MM[:SS]'.
+    """
+    if isinstance(fecha_hora, str):
+        fecha_hora = datetime.fromisoformat(fecha_hora)
+    inicio = _ranura(fecha_hora.strftime('%H:%M'))
+    turno = _bits(inicio, inicio + -(-duracion_min // RESOLUCION_MIN))
+    return _mascara_horario(horario)[fecha_hora.weekday()] & turno == turno
+
+
+def _alineadas(paso):
+    """Ranuras en las que puede empezar un turno: múltiplos de paso desde medianoche."""
+    return sum(1 << i for i in range(0, RANURAS_DIA, paso))
+
+
+def mapas_libres(horarios, ocupadas, desde, dias):
+    """
+    Mapas de bits libres por médico y día.
+
+    horarios: {medico_id: bloques semanales}; ocupadas: iterable de
+    (medico_id, fecha_hora, fecha_hora_fin). Retorna {medico_id: [máscara por
+    día]} para los días desde, desde + 1, ..., desde + dias - 1.
+    """
+    semanales = {medico_id: _mascara_horario(bloques) for medico_id, bloques in horarios.items()}
+    mapas = {medico_id: [semanal[(desde + timedelta(days=d)).weekday()] for d in range(dias)]
+             for medico_id, semanal in semanales.items()}
+    indice = {(desde + timedelta(days=d)).isoformat(): d for d in range(dias)}
+    for medico_id, inicio, fin in ocupadas:
+        mapa = mapas.get(medico_id)
+        if mapa is None or not fin:
+            continue
+        dia = indice.get(inicio[:10])
+        if dia is not None and inicio[:10] == fin[:10]:
+            # Caso común, en línea: ranuras [inicio, fin) del mismo día
+            desde_ranura = (int(inicio[11:13]) * 60 + int(inicio[14:16])) // RESOLUCION_MIN
+            hasta_ranura = -(-(int(fin[11:13]) * 60 + int(fin[14:16])) // RESOLUCION_MIN)
+            if hasta_ranura > desde_ranura:
+                mapa[dia] &= ~(((1 << (hasta_ranura - desde_ranura)) - 1) << desde_ranura)
+            continue
+        # Una cita que cruza la medianoche ocupa el final de un día y el comienzo
+        # del siguiente; puede haber empezado antes del primer día del mapa
+        dia = (date.fromisoformat(inicio[:10]) - desde).days
+        ranura = _ranura(inicio[11:])
+        dia_fin = (date.fromisoformat(fin[:10]) - desde).days
+        ranura_fin = _ranura_fin(fin[11:])
+        while dia <= dia_fin:
+            hasta = ranura_fin if dia == dia_fin else RANURAS_DIA
+            if 0 <= dia < dias:
+                mapa[dia] &= ~_bits(ranura, hasta)
+            dia, ranura = dia + 1, 0
+    return mapas
+
+
+def inicios_libres(libre, ranuras, alineadas):
+    """Máscara de las ranuras donde empiezan `ranuras` ranuras libres consecutivas."""
+    inicios = libre
+    for k in range(1, ranuras):
+        inicios &= libre >> k
+    return inicios & alineadas
+
+
+def _iterar_bits(mascara):
+    while mascara:
+        bajo = mascara & -mascara
+        yield bajo.bit_length() - 1
+        mascara ^= bajo
+
+
+def primeros_libres(mapas, desde, n, duracion_min, paso_min=None, despues_de=None):
+    """
+    Los primeros n turnos libres de duracion_min minutos en los mapas, en orden
+    cronológico (a igual hora, por medico_id). Cada turno es un dict con
+    medico_id, fecha_hora y fecha_hora_fin. Si se da despues_de (datetime), se
+    omiten los turnos que empiezan antes.
+    """
+    ranuras = -(-duracion_min // RESOLUCION_MIN)
+    alineadas = _alineadas(max(1, (paso_min or duracion_min) // RESOLUCION_MIN))
+    dias = len(next(iter(mapas.values()), ()))
+    turnos = []
+    for d in range(dias):
+        dia = desde + timedelta(days=d)
+        if despues_de is not None and dia < despues_de.date():
+            continue
+        corte = 0
+        if despues_de is not None and dia == despues_de.date():
+            corte = _bits(0, _ranura_fin(despues_de.strftime('%H:%M')))
+        del_dia = []
+        for medico_id in sorted(mapas):
+            candidatos = inicios_libres(mapas[medico_id][d], ranuras, alineadas) & ~corte
+            # Cada médico aporta a lo sumo sus primeros n turnos del día
+            for _, i in zip(range(n - len(turnos)), _iterar_bits(candidatos)):
+                del_dia.append((i, medico_id))
+        for i, medico_id in sorted(del_dia)[:n - len(turnos)]:
+            inicio = datetime.combine(dia, time()) + timedelta(minutes=i * RESOLUCION_MIN)
+            turnos.append({'medico_id': medico_id,
+                           'fecha_hora': inicio.strftime('%Y-%m-%d %H:%M:%S'),
+                           'fecha_hora_fin': (inicio + timedelta(minutes=duracion_min)).strftime('%Y-%m-%d %H:%M:%S')})
+        if len(turnos) >= n:
+            break
+    return turnos
+
+
+def proximos_libres(n=10, duracion_min=db.DURACION_CITA, medico_id=None, desde=None,
+                    semanas=SEMANAS, paso_min=None):
+    """
+    Los primeros n turnos libres de duracion_min minutos de un médico (o de
+    cualquiera si medico_id es None) entre desde (datetime, por defecto ahora)
+    y las próximas `semanas` semanas. Los turnos empiezan en múltiplos de
+    paso_min (por defecto, la duración) contados desde medianoche.
+    """
+    desde = desde or datetime.now()
+    if medico_id is None:
+        medico_ids = [m['id'] for m in db.get_all_medicos()]
+    else:
+        medico_ids = [medico_id]
+    cargados = db.get_horarios_medicos()
+    horarios = {m: cargados.get(m, db.HORARIO_POR_DEFECTO) for m in medico_ids}
+
+    # Semana a semana: lo habitual es completar los n turnos en los primeros
+    # días, sin leer la ocupación de las 8 semanas
+    turnos = []
+    dia = desde.date()
+    fin = dia + timedelta(weeks=semanas)
+    while dia < fin and len(turnos) < n:
+        dias = min(7, (fin - dia).days)
+        ocupadas = db.get_citas_ocupadas(medico_ids, dia, dia + timedelta(days=dias - 1))
+        mapas = mapas_libres(horarios, ocupadas, dia, dias)
+        turnos += primeros_libres(mapas, dia, n - len(turnos), duracion_min, paso_min, despues_de=desde)
+        dia += timedelta(days=dias)
+    return turnos
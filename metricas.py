@@ -0,0 +1,377 @@
+"""
+Instrumentación de las funciones públicas de database.py.
+
+Cada llamada registra su duración y las filas devueltas en un histograma por
+función. Las llamadas que superan SLOW_QUERY_MS se anotan en el registro de
+consultas lentas (JSON por línea) con el SQL ejecutado, la duración y la
+página que la originó. El SQL se guarda tal como está escrito en el código,
+con placeholders `?`: los valores de los parámetros (datos de pacientes)
+nunca llegan al registro.
+
+Las métricas se exportan en formato de texto OpenMetrics, a un archivo
+(METRICS_FILE, para un textfile collector) y/o por HTTP en
+127.0.0.1:METRICS_PORT/metrics.
+
+Configuración por variables de entorno:
+    CLINICA_DB_METRICS=0        desactiva la instrumentación
+    CLINICA_SLOW_QUERY_MS       umbral del registro de lentas (200 ms)
+    CLINICA_SLOW_QUERY_LOG      archivo del registro (sin definir = solo memoria)
+    CLINICA_METRICS_FILE        archivo OpenMetrics que se reescribe cada METRICS_FILE_INTERVAL
+    CLINICA_METRICS_PORT        puerto del endpoint /metrics
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import types
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import backends
+
+INSTRUMENTACION = os.environ.get('CLINICA_DB_METRICS', '1') != '0'
+SLOW_QUERY_MS = float(os.environ.get('CLINICA_SLOW_QUERY_MS', 200))
+SLOW_QUERY_LOG = os.environ.get('CLINICA_SLOW_QUERY_LOG', '')
+METRICS_FILE = os.environ.get('CLINICA_METRICS_FILE')
+METRICS_PORT = int(os.environ.get('CLINICA_METRICS_PORT') or 0)
+METRICS_FILE_INTERVAL = 15  # segundos
+
+# Límites superiores (segundos) de los buckets de latencia
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+MAX_SENTENCIAS = 20     # sentencias que se conservan por llamada lenta
+MAX_LENTAS = 200        # entradas recientes en memoria (panel de administración)
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+
+class Histograma:
+    """Latencias de una función en buckets fijos, más filas y errores."""
+
+    __slots__ = ('cuentas', 'suma', 'total', 'filas', 'errores', '_lock')
+
+    def __init__(self):
+        self.cuentas = [0] * (len(BUCKETS) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+        self.filas = 0
+        self.errores = 0
+        self._lock = threading.Lock()
+
+    def observar(self, segundos, filas, error=False):
+        i = bisect_left(BUCKETS, segundos)
+        with self._lock:
+            self.cuentas[i] += 1
+            self.suma += segundos
+            self.total += 1
+            self.filas += filas
+            self.errores += error
+
+    def copia(self):
+        with self._lock:
+            return list(self.cuentas), self.suma, self.total, self.filas, self.errores
+
+    def percentil(self, p):
+        """Límite superior del bucket que contiene el percentil p (0-100)."""
+        cuentas, _, total, _, _ = self.copia()
+        if not total:
+            return None
+        objetivo = total * p / 100
+        acumulado = 0
+        for limite, n in zip(BUCKETS + (float('inf'),), cuentas):
+            acumulado += n
+            if acumulado >= objetivo:
+                return limite
+        return float('inf')
+
+
+_histogramas = {}
+_lentas = deque(maxlen=MAX_LENTAS)
+_lock_log = threading.Lock()
+_local = threading.local()
+
+
+# --- CAPTURA DE SQL Y PÁGINA ---
+
+def _anotar_sql(sql):
+    # Llamado por los cursores de backends.py en cada execute
+    sentencias = getattr(_local, 'sentencias', None)
+    if sentencias is not None and len(sentencias) < MAX_SENTENCIAS:
+        sentencias.append(sql)
+
+
+def fijar_pagina(pagina):
+    """Página de la app que se está renderizando en este hilo (una sesión de Streamlit por hilo)."""
+    _local.pagina = pagina
+
+
+def _pagina_actual():
+    pagina = getattr(_local, 'pagina', None)
+    if pagina:
+        return pagina
+    # Sin página fijada: el primer marco del stack que venga de modules/ o app.py
+    marco = sys._getframe(2)
+    while marco is not None:
+        archivo = marco.f_code.co_filename
+        if f'{os.sep}modules{os.sep}' in archivo or archivo.endswith('app.py'):
+            return f"{os.path.basename(archivo)}:{marco.f_code.co_name}"
+        marco = marco.f_back
+    return None
+
+
+def _contar_filas(resultado):
+    if resultado is None:
+        return 0
+    if isinstance(resultado, (list, tuple)):
+        return len(resultado)
+    return 1
+
+
+# --- INSTRUMENTACIÓN ---
+
+def instrumentar(fn):
+    """Envuelve fn para medir duración y filas y registrar las llamadas lentas."""
+    nombre = fn.__name__
+    histograma = _histogramas.setdefault(nombre, Histograma())
+
+    @functools.wraps(fn)
+    def envoltura(*args, **kwargs):
+        anteriores = getattr(_local, 'sentencias', None)
+        _local.sentencias = sentencias = []
+        inicio = time.perf_counter()
+        try:
+            resultado = fn(*args, **kwargs)
+        except BaseException:
+            segundos = time.perf_counter() - inicio
+            _local.sentencias = anteriores
+            histograma.observar(segundos, 0, error=True)
+            raise
+        segundos = time.perf_counter() - inicio
+        _local.sentencias = anteriores
+        if anteriores is not None:
+            anteriores.extend(sentencias)  # llamada anidada: el SQL también cuenta para la externa
+        if isinstance(resultado, types.GeneratorType):
+            return _medir_generador(nombre, histograma, resultado)
+        filas = _contar_filas(resultado)
+        histograma.observar(segundos, filas)
+        if segundos * 1000 >= SLOW_QUERY_MS:
+            _registrar_lenta(nombre, segundos, filas, sentencias)
+        return resultado
+
+    return envoltura
+
+
+def _medir_generador(nombre, histograma, generador):
+    # Los iter_* se miden de la primera a la última fila, con el SQL de cada lote
+    segundos = 0.0
+    filas = 0
+    sentencias = []
+    error = False
+    try:
+        while True:
+            anteriores = getattr(_local, 'sentencias', None)
+            _local.sentencias = sentencias
+            inicio = time.perf_counter()
+            try:
+                fila = next(generador)
+            except StopIteration:
+                return
+            finally:
+                segundos += time.perf_counter() - inicio
+                _local.sentencias = anteriores
+            filas += 1
+            yield fila
+    except GeneratorExit:
+        raise  # el consumidor dejó de iterar antes del final: no es un error
+    except BaseException:
+        error = True
+        raise
+    finally:
+        generador.close()
+        histograma.observar(segundos, filas, error=error)
+        if segundos * 1000 >= SLOW_QUERY_MS:
+            _registrar_lenta(nombre, segundos, filas, sentencias)
+
+
+def instrumentar_modulo(espacio, excluir=()):
+    """
+    Reemplaza en `espacio` (globals() de un módulo) cada función pública
+    definida en ese módulo por su versión instrumentada. Las llamadas internas
+    entre funciones del módulo pasan también por la versión instrumentada.
+    """
+    modulo = espacio['__name__']
+    for nombre, valor in list(espacio.items()):
+        if (nombre.startswith('_') or nombre in excluir or not isinstance(valor, types.FunctionType)
+                or valor.__module__ != modulo):
+            continue
+        espacio[nombre] = instrumentar(valor)
+    backends.observador_sql = _anotar_sql
+
+
+# --- REGISTRO DE CONSULTAS LENTAS ---
+
+def _registrar_lenta(funcion, segundos, filas, sentencias):
+    entrada = {
+        'ts': datetime.now().isoformat(timespec='seconds'),
+        'funcion': funcion,
+        'duracion_ms': round(segundos * 1000, 2),
+        'filas': filas,
+        'pagina': _pagina_actual(),
+        'sql': [' '.join(s.split()) for s in sentencias],
+    }
+    with _lock_log:
+        _lentas.append(entrada)
+        if SLOW_QUERY_LOG:
+            try:
+                with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(entrada, ensure_ascii=False) + '\n')
+            except OSError:
+                pass  # el registro nunca debe romper la operación medida
+
+
+def get_consultas_lentas(limit=50):
+    """Últimas llamadas lentas, de la más reciente a la más antigua."""
+    with _lock_log:
+        return list(reversed(_lentas))[:limit]
+
+
+def get_resumen_funciones():
+    """Llamadas, p50/p95 (límite de bucket, ms), media y filas por función, de la más costosa a la menos."""
+    resumen = []
+    for nombre, h in list(_histogramas.items()):
+        _, suma, total, filas, errores = h.copia()
+        if not total:
+            continue
+        resumen.append({
+            'funcion': nombre,
+            'llamadas': total,
+            'total_ms': round(suma * 1000, 1),
+            'media_ms': round(suma / total * 1000, 2),
+            'p50_ms': h.percentil(50) * 1000,
+            'p95_ms': h.percentil(95) * 1000,
+            'filas': filas,
+            'errores': errores,
+        })
+    return sorted(resumen, key=lambda r: r['total_ms'], reverse=True)
+
+
+def reset():
+    for h in list(_histogramas.values()):
+        with h._lock:
+            h.cuentas = [0] * (len(BUCKETS) + 1)
+            h.suma = 0.0
+            h.total = h.filas = h.errores = 0
+    with _lock_log:
+        _lentas.clear()
+
+
+# --- EXPORTACIÓN OPENMETRICS ---
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+def exportar_openmetrics():
+    """Texto en formato OpenMetrics con histogramas de latencia, filas y errores por función."""
+    lineas = [
+        '# TYPE clinica_db_call_duration_seconds histogram',
+        '# UNIT clinica_db_call_duration_seconds seconds',
+        '# HELP clinica_db_call_duration_seconds Duración de las llamadas a database.py.',
+    ]
+    filas_por_funcion = []
+    for nombre, h in sorted(_histogramas.items()):
+        cuentas, suma, total, filas, errores = h.copia()
+        if not total:
+            continue
+        etiqueta = f'funcion="{nombre}"'
+        acumulado = 0
+        for limite, n in zip(BUCKETS, cuentas):
+            acumulado += n
+            lineas.append(f'clinica_db_call_duration_seconds_bucket{{{etiqueta},le="{limite}"}} {acumulado}')
+        lineas.append(f'clinica_db_call_duration_seconds_bucket{{{etiqueta},le="+Inf"}} {total}')
+        lineas.append(f'clinica_db_call_duration_seconds_count{{{etiqueta}}} {total}')
+        lineas.append(f'clinica_db_call_duration_seconds_sum{{{etiqueta}}} {_numero(suma)}')
+        filas_por_funcion.append((etiqueta, filas, errores))
+
+    lineas += [
+        '# TYPE clinica_db_rows counter',
+        '# HELP clinica_db_rows Filas devueltas por las llamadas a database.py.',
+    ]
+    lineas += [f'clinica_db_rows_total{{{e}}} {filas}' for e, filas, _ in filas_por_funcion]
+    lineas += [
+        '# TYPE clinica_db_errors counter',
+        '# HELP clinica_db_errors Llamadas a database.py que terminaron en excepción.',
+    ]
+    lineas += [f'clinica_db_errors_total{{{e}}} {errores}' for e, _, errores in filas_por_funcion]
+    lineas.append('# EOF')
+    return '\n'.join(lineas) + '\n'
+
+
+def escribir_metricas(ruta):
+    """Escribe las métricas en `ruta` de forma atómica (archivo temporal + rename)."""
+    temporal = f"{ruta}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        f.write(exportar_openmetrics())
+    os.replace(temporal, ruta)
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        cuerpo = exportar_openmetrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+_exportadores = {}
+_lock_exportadores = threading.Lock()
+
+
+def iniciar_servidor(puerto=None, host='127.0.0.1'):
+    """Sirve /metrics en un hilo daemon. Devuelve el servidor (puerto 0 = uno libre)."""
+    servidor = ThreadingHTTPServer((host, METRICS_PORT if puerto is None else puerto), _ManejadorMetricas)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name='metricas-http', daemon=True).start()
+    return servidor
+
+
+def _escribir_periodicamente(ruta):
+    while True:
+        try:
+            escribir_metricas(ruta)
+        except OSError:
+            pass
+        time.sleep(METRICS_FILE_INTERVAL)
+
+
+def iniciar_exportacion():
+    """
+    Arranca, una sola vez por proceso, los exportadores configurados
+    (METRICS_PORT y/o METRICS_FILE). Streamlit reejecuta app.py en cada
+    interacción; las llamadas siguientes no hacen nada.
+    """
+    with _lock_exportadores:
+        if METRICS_PORT and 'http' not in _exportadores:
+            try:
+                _exportadores['http'] = iniciar_servidor()
+            except OSError:
+                # Otro proceso ya usa el puerto: la app sigue sin endpoint
+                _exportadores['http'] = None
+        if METRICS_FILE and 'archivo' not in _exportadores:
+            hilo = threading.Thread(target=_escribir_periodicamente, args=(METRICS_FILE,),
+                                    name='metricas-archivo', daemon=True)
+            hilo.start()
+            _exportadores['archivo'] = hilo
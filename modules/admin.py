@@ -1,11 +1,14 @@
 import streamlit as st
 import database as db
+import metricas
 import pandas as pd
 
+DIAS_SEMANA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
 def mostrar_gestion_medicos():
     st.title("👨‍⚕️ Gestión de Médicos")
     
-    tab1, tab2 = st.tabs(["Listado de Médicos", "Registrar Nuevo Médico"])
+    tab1, tab2, tab3 = st.tabs(["Listado de Médicos", "Registrar Nuevo Médico", "Horarios de Atención"])
     
     with tab1:
         st.subheader("Médicos Registrados")
@@ -23,6 +26,33 @@ def mostrar_gestion_medicos():
             st.dataframe(df[['ID', 'Nombre', 'Especialidad', 'Email']], use_container_width=True, hide_index=True)
         else:
             st.info("No hay médicos registrados aún.")
+        
+        with st.expander("Estado de la caché de datos de referencia"):
+            cache = db.get_cache_stats()
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Aciertos", cache['hits'])
+            col2.metric("Fallos", cache['misses'])
+            col3.metric("Tasa de aciertos", f"{cache['hit_rate']}%")
+            st.caption(f"Generación {cache['generacion']} · {cache['entradas']} entrada(s) · TTL {db.CACHE_TTL} s")
+        
+        cola = db.get_write_queue_stats()
+        if cola:
+            with st.expander("Estado de la cola de escritura"):
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Escrituras", cola['trabajos'])
+                col2.metric("Commits", cola['commits'])
+                col3.metric("Errores", cola['errores'])
+                st.caption(f"{cola['trabajos_por_commit']} escrituras por commit · {cola['pendientes']} pendiente(s)")
+        
+        with st.expander("Latencia de la base de datos"):
+            funciones = metricas.get_resumen_funciones()
+            if funciones:
+                st.dataframe(pd.DataFrame(funciones[:15]), use_container_width=True, hide_index=True)
+            lentas = metricas.get_consultas_lentas()
+            st.caption(f"Consultas lentas (≥ {metricas.SLOW_QUERY_MS:g} ms): {len(lentas)}")
+            if lentas:
+                st.dataframe(pd.DataFrame([{**l, 'sql': ' ; '.join(l['sql'])} for l in lentas]),
+                             use_container_width=True, hide_index=True)
             
     with tab2:
         st.subheader("Registrar Nuevo Médico")
@@ -49,3 +79,35 @@ def mostrar_gestion_medicos():
                         st.balloons()
                     else:
                         st.error("Error al registrar: El usuario ya existe o hubo un problema en la base de datos")
+
+    with tab3:
+        st.subheader("Horarios de Atención")
+        medicos = db.get_all_medicos()
+        if not medicos:
+            st.info("No hay médicos registrados aún.")
+            return
+        
+        medicos_dict = {f"{m['nombre']} - {m['especialidad']}": m['id'] for m in medicos}
+        medico_id = medicos_dict[st.selectbox("Médico", list(medicos_dict.keys()), key="horario_medico")]
+        if medico_id not in db.get_horarios_medicos():
+            st.caption("Sin horario cargado: se usa el horario por defecto (lunes a viernes, 08:00 a 18:00).")
+        
+        # Un bloque por fila; un día puede tener varios (turno cortado)
+        bloques = pd.DataFrame([{'Día': DIAS_SEMANA[dia], 'Desde': inicio, 'Hasta': fin}
+                                for dia, inicio, fin in db.get_horario_medico(medico_id)],
+                               columns=['Día', 'Desde', 'Hasta'])
+        editados = st.data_editor(
+            bloques, num_rows="dynamic", use_container_width=True, hide_index=True, key=f"horario_{medico_id}",
+            column_config={
+                'Día': st.column_config.SelectboxColumn("Día", options=DIAS_SEMANA, required=True),
+                'Desde': st.column_config.TextColumn("Desde (HH:MM)", required=True),
+                'Hasta': st.column_config.TextColumn("Hasta (HH:MM)", required=True),
+            })
+        
+        if st.button("Guardar horario", use_container_width=True):
+            try:
+                db.set_horario_medico(medico_id, [(DIAS_SEMANA.index(fila['Día']), fila['Desde'], fila['Hasta'])
+                                                  for fila in editados.dropna().to_dict('records')])
+                st.success("✅ Horario actualizado")
+            except ValueError as e:
+                st.error(f"⚠️ {e}")
@@ -6,6 +6,7 @@ Permite registrar, buscar y editar pacientes, así como realizar triaje.
 import streamlit as st
 from datetime import datetime, date
 import database as db
+from modules.componentes import selector_paciente
 
 
 def calcular_edad(fecha_nacimiento_str: str) -> int:
@@ -116,14 +117,18 @@ def show():
         with col2:
             buscar = st.button("Buscar", use_container_width=True)
         
-        # Mostrar todos los pacientes si no hay búsqueda
+        # Sin búsqueda se muestra solo la primera página del listado alfabético
         if query and buscar:
             pacientes = db.search_pacientes(query)
         else:
-            pacientes = db.get_all_pacientes()
+            pacientes = db.list_pacientes()
         
         if pacientes:
             st.write(f"**{len(pacientes)} paciente(s) encontrado(s)**")
+            if query and buscar and len(pacientes) >= db.SEARCH_LIMIT:
+                st.caption(f"Mostrando los {db.SEARCH_LIMIT} resultados más relevantes.")
+            elif not (query and buscar) and len(pacientes) >= db.PAGE_SIZE:
+                st.caption(f"Mostrando los primeros {db.PAGE_SIZE} pacientes en orden alfabético. Use la búsqueda para encontrar otros.")
             
             for paciente in pacientes:
                 edad = calcular_edad(paciente['fecha_nacimiento'])
@@ -157,17 +162,14 @@ def show():
         st.write("Registre las constantes vitales del paciente antes de la consulta")
         
         # Seleccionar paciente
-        pacientes = db.get_all_pacientes()
-        if not pacientes:
+        if not db.list_pacientes(limit=1):
             st.warning("No hay pacientes registrados. Por favor registre un paciente primero.")
             return
         
-        pacientes_dict = {f"{p['nombre']} (ID: {p['id']})": p['id'] for p in pacientes}
-        paciente_seleccionado = st.selectbox("Seleccionar Paciente", list(pacientes_dict.keys()))
+        paciente = selector_paciente("triaje_paciente")
         
-        if paciente_seleccionado:
-            paciente_id = pacientes_dict[paciente_seleccionado]
-            paciente = db.get_paciente(paciente_id)
+        if paciente:
+            paciente_id = paciente['id']
             
             # Mostrar información del paciente
             edad = calcular_edad(paciente['fecha_nacimiento'])
@@ -4,9 +4,14 @@ Permite crear, visualizar y gestionar citas para los 4 médicos.
 """
 
 import streamlit as st
+import calendar
 from datetime import datetime, date, timedelta
+from html import escape
 import database as db
+import disponibilidad
+import recurrencia
 import pandas as pd
+from modules.componentes import selector_paciente
 
 
 def get_color_estado(estado: str) -> str:
@@ -16,21 +21,247 @@ def get_color_estado(estado: str) -> str:
         'Llegó': '#4169E1',      # Azul
         'En Consulta': '#32CD32', # Verde
         'Completada': '#228B22',  # Verde oscuro
-        'No-show': '#DC143C'      # Rojo
+        'No-show': '#DC143C',     # Rojo
+        'Cancelada': '#A9A9A9'    # Gris claro
     }
     return colores.get(estado, '#808080')
 
 
+# ==================== VISTAS DE CALENDARIO ====================
+# Semana y mes se arman con una sola consulta por rango (db.get_citas_rango /
+# db.get_citas_por_dia) y se dibujan como una única tabla HTML: la cantidad de
+# elementos de Streamlit no crece con la cantidad de médicos mostrados.
+
+TODOS_LOS_MEDICOS = "Todos los médicos"
+DIAS_CORTOS = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
+MESES = ['Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio', 'Julio', 'Agosto', 'Septiembre',
+         'Octubre', 'Noviembre', 'Diciembre']
+MAX_CITAS_CELDA = 4  # el resto de la hora se resume como "+N más"
+
+_ESTILO_TABLA = "width:100%; border-collapse:collapse; table-layout:fixed; font-size:0.8em;"
+_ESTILO_CELDA = "border:1px solid #ddd; padding:3px; vertical-align:top;"
+
+
+def agrupar_por_hora(filas):
+    """{('YYYY-MM-DD', hora): [fila, ...]} con las filas de db.get_citas_rango, en su orden."""
+    celdas = {}
+    for fila in filas:
+        fecha_hora = fila[2]
+        celdas.setdefault((fecha_hora[:10], int(fecha_hora[11:13])), []).append(fila)
+    return celdas
+
+
+def html_semana(lunes, filas, nombres_medicos=None):
+    """
+    Grilla horas x días de la semana que empieza en lunes. Con nombres_medicos
+    ({id: nombre}) cada cita indica su médico (vista de todos los médicos).
+    """
+    dias = [lunes + timedelta(days=i) for i in range(7)]
+    celdas = agrupar_por_hora(filas)
+    horas = [hora for _, hora in celdas]
+    desde, hasta = min(horas + [8]), max(horas + [17])
+
+    encabezado = ''.join(
+        f"<th style='{_ESTILO_CELDA}{' background:#eef3ff;' if dia == date.today() else ''}'>"
+        f"{DIAS_CORTOS[dia.weekday()]} {dia.strftime('%d/%m')}</th>" for dia in dias)
+    cuerpo = []
+    for hora in range(desde, hasta + 1):
+        fila_html = [f"<td style='{_ESTILO_CELDA} width:3.5em;'><b>{hora:02d}:00</b></td>"]
+        for dia in dias:
+            citas = celdas.get((dia.isoformat(), hora), [])
+            entradas = []
+            for _, medico_id, fecha_hora, _, estado, paciente in citas[:MAX_CITAS_CELDA]:
+                medico = f" · {escape(nombres_medicos.get(medico_id, str(medico_id)))}" if nombres_medicos else ''
+                entradas.append(f"<div style='border-left:3px solid {get_color_estado(estado)}; padding-left:3px;'"
+                                f" title='{escape(estado)}'>{fecha_hora[11:16]} {escape(paciente or '')}{medico}</div>")
+            if len(citas) > MAX_CITAS_CELDA:
+                entradas.append(f"<div style='color:#808080;'>+{len(citas) - MAX_CITAS_CELDA} más</div>")
+            fila_html.append(f"<td style='{_ESTILO_CELDA}'>{''.join(entradas)}</td>")
+        cuerpo.append(f"<tr>{''.join(fila_html)}</tr>")
+    return (f"<table style='{_ESTILO_TABLA}'><tr><th style='{_ESTILO_CELDA} width:3.5em;'></th>{encabezado}</tr>"
+            f"{''.join(cuerpo)}</table>")
+
+
+def citas_vigentes(conteo):
+    """Total de un conteo {estado: n} sin las canceladas (como db.get_noshow_stats)."""
+    return sum(n for estado, n in conteo.items() if estado != 'Cancelada')
+
+
+def html_mes(anio, mes, por_dia):
+    """Calendario del mes con el total de citas, completadas, no-shows y canceladas de cada día."""
+    encabezado = ''.join(f"<th style='{_ESTILO_CELDA}'>{d}</th>" for d in DIAS_CORTOS)
+    semanas = []
+    for semana in calendar.Calendar().monthdatescalendar(anio, mes):
+        celdas = []
+        for dia in semana:
+            conteo = por_dia.get(dia.isoformat(), {})
+            total = citas_vigentes(conteo)
+            canceladas = conteo.get('Cancelada', 0)
+            estilo = _ESTILO_CELDA + ' height:4.5em;'
+            if dia.month != mes:
+                estilo += ' color:#bbb;'
+            if dia == date.today():
+                estilo += ' background:#eef3ff;'
+            detalle = ''
+            if total:
+                detalle = (f"<div><b>{total}</b> cita(s)</div><div>"
+                           f"<span style='color:{get_color_estado('Completada')};'>✔ {conteo.get('Completada', 0)}</span> "
+                           f"<span style='color:{get_color_estado('No-show')};'>✖ {conteo.get('No-show', 0)}</span>"
+                           f"</div>")
+            if canceladas:
+                detalle += (f"<div style='color:{get_color_estado('Cancelada')};'>"
+                            f"{canceladas} cancelada(s)</div>")
+            celdas.append(f"<td style='{estilo}'><div style='text-align:right;'>{dia.day}</div>{detalle}</td>")
+        semanas.append(f"<tr>{''.join(celdas)}</tr>")
+    return f"<table style='{_ESTILO_TABLA}'><tr>{encabezado}</tr>{''.join(semanas)}</table>"
+
+
+def mostrar_semana(medico_id, fecha, medicos):
+    """Vista de semana (lunes a domingo) de un médico o de todos (medico_id=None)."""
+    lunes = fecha - timedelta(days=fecha.weekday())
+    filas = db.get_citas_rango(lunes, lunes + timedelta(days=6), medico_id)
+    nombres = {m['id']: m['nombre'] for m in medicos} if medico_id is None else None
+    canceladas = sum(1 for fila in filas if fila[4] == 'Cancelada')
+    st.caption(f"Semana del {lunes.strftime('%d/%m/%Y')} · {len(filas) - canceladas} cita(s)"
+               + (f" · {canceladas} cancelada(s)" if canceladas else ''))
+    st.markdown(html_semana(lunes, filas, nombres), unsafe_allow_html=True)
+
+
+def mostrar_mes(medico_id, fecha):
+    """Vista de mes de un médico o de todos (medico_id=None)."""
+    ultimo = calendar.monthrange(fecha.year, fecha.month)[1]
+    por_dia = db.get_citas_por_dia(fecha.replace(day=1), fecha.replace(day=ultimo), medico_id)
+    total = sum(citas_vigentes(conteo) for conteo in por_dia.values())
+    canceladas = sum(conteo.get('Cancelada', 0) for conteo in por_dia.values())
+    st.caption(f"{MESES[fecha.month - 1]} {fecha.year} · {total} cita(s)"
+               + (f" · {canceladas} cancelada(s)" if canceladas else ''))
+    st.markdown(html_mes(fecha.year, fecha.month, por_dia), unsafe_allow_html=True)
+
+
+# ==================== SERIES DE CITAS ====================
+# Se revisa la serie completa (una consulta para todos los conflictos) antes
+# de agendarla; el plan queda en session_state hasta confirmar.
+
+FRECUENCIAS = {"Semanal": 'semanal', "Mensual": 'mensual', "Diaria": 'diaria'}
+ESTADOS_OCURRENCIA = {'libre': "✅ Libre", 'movida': "↪️ Movida", 'omitida': "⛔ Omitida"}
+
+
+def tabla_ocurrencias(plan):
+    return pd.DataFrame([{
+        'Original': o['original'][:16],
+        'Agendada': o['fecha_hora'][:16] if o['fecha_hora'] else '—',
+        'Estado': ESTADOS_OCURRENCIA[o['estado']],
+        'Motivo': o['motivo']
+    } for o in plan])
+
+
+def mostrar_series():
+    st.subheader("Agendar Serie de Citas")
+    paciente = selector_paciente("serie_paciente", "Paciente *")
+    medicos = db.get_all_medicos()
+    if not paciente or not medicos:
+        st.info("Seleccione un paciente registrado y un médico para agendar una serie.")
+        return
+
+    with st.form("nueva_serie"):
+        medicos_dict = {f"{m['nombre']} - {m['especialidad']}": m['id'] for m in medicos}
+        medico_seleccionado = st.selectbox("Médico *", list(medicos_dict.keys()), key="serie_medico")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            fecha_inicio = st.date_input("Primera cita *", min_value=date.today(), key="serie_fecha")
+        with col2:
+            hora = st.time_input("Hora *", value=datetime.strptime("09:00", "%H:%M").time(), key="serie_hora")
+        with col3:
+            duracion = st.selectbox("Duración (min)", db.DURACIONES, key="serie_duracion",
+                                    index=db.DURACIONES.index(db.DURACION_CITA))
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            frecuencia = st.selectbox("Frecuencia", list(FRECUENCIAS.keys()), key="serie_frecuencia")
+        with col2:
+            intervalo = st.number_input("Cada", min_value=1, max_value=12, value=1, key="serie_intervalo",
+                                        help="Cada cuántos días, semanas o meses")
+        with col3:
+            cantidad = st.number_input("Cantidad de citas", min_value=1, max_value=db.MAX_OCURRENCIAS, value=8,
+                                       key="serie_cantidad")
+        mover = st.checkbox(f"Mover las que choquen al primer horario libre (hasta {recurrencia.TOLERANCIA_DIAS} días después)",
+                            value=True, key="serie_mover")
+        revisar = st.form_submit_button("🔎 Revisar ocurrencias", use_container_width=True)
+
+    if revisar:
+        medico_id = medicos_dict[medico_seleccionado]
+        fechas = recurrencia.expandir(datetime.combine(fecha_inicio, hora).replace(second=0, microsecond=0),
+                                      FRECUENCIAS[frecuencia], int(intervalo), ocurrencias=int(cantidad))
+        st.session_state.serie_plan = {
+            'paciente_id': paciente['id'], 'medico_id': medico_id, 'duracion': duracion,
+            'frecuencia': FRECUENCIAS[frecuencia], 'intervalo': int(intervalo),
+            'plan': recurrencia.planificar_serie(medico_id, fechas, duracion, mover=mover)}
+
+    propuesta = st.session_state.get('serie_plan')
+    if propuesta and propuesta['paciente_id'] == paciente['id']:
+        plan = propuesta['plan']
+        agendables = sum(1 for o in plan if o['fecha_hora'])
+        st.dataframe(tabla_ocurrencias(plan), use_container_width=True, hide_index=True)
+        st.caption(f"{agendables} de {len(plan)} cita(s) se pueden agendar")
+        if st.button("📅 Agendar serie", disabled=not agendables, key="serie_agendar"):
+            serie_id, informe = recurrencia.agendar_serie(
+                propuesta['paciente_id'], propuesta['medico_id'], plan, propuesta['duracion'],
+                propuesta['frecuencia'], propuesta['intervalo'])
+            del st.session_state.serie_plan
+            agendadas = sum(1 for o in informe if o['fecha_hora'])
+            if serie_id is None:
+                st.error("⚠️ No se agendó la serie: todos los horarios se ocuparon mientras se agendaba")
+            else:
+                st.success(f"✅ Serie {serie_id} agendada: {agendadas} de {len(informe)} cita(s)")
+            if agendadas < len(informe) or any(o['estado'] == 'movida' for o in informe):
+                st.warning("Algunas ocurrencias se movieron u omitieron:")
+                st.dataframe(tabla_ocurrencias([o for o in informe if o['estado'] != 'libre']),
+                             use_container_width=True, hide_index=True)
+
+    st.divider()
+    st.subheader("Series del paciente")
+    series = db.get_series_paciente(paciente['id'])
+    if not series:
+        st.info("El paciente no tiene series de citas.")
+    for serie in series:
+        titulo = (f"Serie {serie['id']} · {serie['medico_nombre']} · {serie['frecuencia'] or '-'} "
+                  f"· {serie['pendientes'] or 0} pendiente(s) de {serie['total']}")
+        with st.expander(titulo):
+            citas = db.get_citas_serie(serie['id'])
+            st.dataframe(pd.DataFrame([{
+                'Fecha': c['fecha_hora'][:10],
+                'Hora': f"{c['fecha_hora'][11:16]} - {c['fecha_hora_fin'][11:16]}",
+                'Estado': c['estado']
+            } for c in citas]), use_container_width=True, hide_index=True)
+            if not serie['pendientes']:
+                continue
+            col1, col2, col3 = st.columns([1, 1, 1])
+            with col1:
+                nueva_hora = st.time_input("Nueva hora", value=datetime.strptime(citas[-1]['fecha_hora'][11:16], "%H:%M").time(),
+                                           key=f"serie_{serie['id']}_hora")
+            with col2:
+                if st.button("🕒 Cambiar hora de las pendientes", key=f"serie_{serie['id']}_editar"):
+                    resultado = recurrencia.editar_serie(serie['id'], hora=nueva_hora.strftime('%H:%M'))
+                    st.success(f"{resultado['actualizadas']} cita(s) actualizadas")
+                    for fecha_hora in resultado['en_conflicto']:
+                        st.caption(f"• {fecha_hora[:16]} no se cambió: se superpone con otra cita")
+                    for fecha_hora in resultado['fuera_de_horario']:
+                        st.caption(f"• {fecha_hora[:16]} no se cambió: fuera del horario de atención")
+            with col3:
+                if st.button("❌ Cancelar pendientes", key=f"serie_{serie['id']}_cancelar"):
+                    st.success(f"{db.cancelar_serie_citas(serie['id'])} cita(s) canceladas")
+
+
 def show():
     """Función principal del módulo de agenda."""
     st.title("📅 Agenda de Citas")
     
     # Tabs para diferentes funcionalidades
-    tab1, tab2, tab3 = st.tabs(["Ver Agenda", "Nueva Cita", "Estadísticas"])
+    tab1, tab2, tab3, tab4 = st.tabs(["Ver Agenda", "Nueva Cita", "Serie de Citas", "Estadísticas"])
     
     # ==================== TAB 1: Ver Agenda ====================
     with tab1:
-        st.subheader("Agenda del Día")
+        vista = st.radio("Vista", ["Día", "Semana", "Mes"], horizontal=True, key="agenda_vista")
+        st.subheader({"Día": "Agenda del Día", "Semana": "Agenda de la Semana", "Mes": "Agenda del Mes"}[vista])
         
         # Selectores
         col1, col2 = st.columns(2)
@@ -42,84 +273,125 @@ def show():
                 st.stop()
                 
             medicos_dict = {f"{m['nombre']} - {m['especialidad']}": m['id'] for m in medicos}
-            medico_seleccionado = st.selectbox("Seleccionar Médico", list(medicos_dict.keys()))
-            medico_id = medicos_dict[medico_seleccionado]
+            opciones = list(medicos_dict.keys())
+            # Semana y mes pueden mostrar a todos los médicos juntos
+            if vista != "Día":
+                opciones = [TODOS_LOS_MEDICOS] + opciones
+            medico_seleccionado = st.selectbox("Seleccionar Médico", opciones)
+            medico_id = medicos_dict.get(medico_seleccionado)
         
         with col2:
             fecha_seleccionada = st.date_input("Fecha", value=date.today())
         
-        # Obtener citas del día
-        citas = db.get_citas_by_medico_fecha(medico_id, fecha_seleccionada.strftime('%Y-%m-%d'))
+        if vista == "Semana":
+            mostrar_semana(medico_id, fecha_seleccionada, medicos)
+        elif vista == "Mes":
+            mostrar_mes(medico_id, fecha_seleccionada)
+        else:
+            # Obtener citas del día
+            citas = db.get_citas_by_medico_fecha(medico_id, fecha_seleccionada.strftime('%Y-%m-%d'))
         
-        if citas:
-            st.write(f"**{len(citas)} cita(s) programada(s)**")
+            if citas:
+                st.write(f"**{len(citas)} cita(s) programada(s)**")
             
-            # Crear DataFrame para mejor visualización
-            for cita in citas:
-                hora = datetime.fromisoformat(cita['fecha_hora']).strftime('%H:%M')
-                color = get_color_estado(cita['estado'])
+                # Crear DataFrame para mejor visualización
+                for cita in citas:
+                    hora = datetime.fromisoformat(cita['fecha_hora']).strftime('%H:%M')
+                    hora_fin = cita['fecha_hora_fin'][11:16] if cita['fecha_hora_fin'] else ''
+                    color = get_color_estado(cita['estado'])
                 
-                with st.container():
-                    col1, col2, col3, col4 = st.columns([1, 2, 2, 3])
+                    with st.container():
+                        col1, col2, col3, col4 = st.columns([1, 2, 2, 3])
                     
-                    with col1:
-                        st.markdown(f"### {hora}")
+                        with col1:
+                            st.markdown(f"### {hora}")
+                            if hora_fin:
+                                st.caption(f"hasta {hora_fin} ({cita['duracion_min']} min)")
                     
-                    with col2:
-                        st.write(f"**{cita['paciente_nombre']}**")
-                        st.caption(f"ID Paciente: {cita['paciente_id']}")
+                        with col2:
+                            st.write(f"**{cita['paciente_nombre']}**")
+                            st.caption(f"ID Paciente: {cita['paciente_id']}")
                     
-                    with col3:
-                        st.markdown(f"<span style='color:{color}; font-weight:bold;'>● {cita['estado']}</span>", 
-                                  unsafe_allow_html=True)
+                        with col3:
+                            st.markdown(f"<span style='color:{color}; font-weight:bold;'>● {cita['estado']}</span>", 
+                                      unsafe_allow_html=True)
                     
-                    with col4:
-                        # Botones de acción según el estado
-                        if cita['estado'] == 'Pendiente':
-                            if st.button("✅ Marcar Llegada", key=f"llegada_{cita['id']}"):
-                                db.update_estado_cita(cita['id'], 'Llegó')
-                                st.rerun()
+                        with col4:
+                            # Botones de acción según el estado
+                            if cita['estado'] == 'Pendiente':
+                                if st.button("✅ Marcar Llegada", key=f"llegada_{cita['id']}"):
+                                    db.update_estado_cita(cita['id'], 'Llegó')
+                                    st.rerun()
                         
-                        elif cita['estado'] == 'Llegó':
-                            if st.button("🩺 Iniciar Consulta", key=f"consulta_{cita['id']}"):
-                                db.update_estado_cita(cita['id'], 'En Consulta')
-                                st.rerun()
+                            elif cita['estado'] == 'Llegó':
+                                if st.button("🩺 Iniciar Consulta", key=f"consulta_{cita['id']}"):
+                                    db.update_estado_cita(cita['id'], 'En Consulta')
+                                    st.rerun()
                         
-                        elif cita['estado'] == 'En Consulta':
-                            if st.button("✔️ Finalizar", key=f"finalizar_{cita['id']}"):
-                                db.update_estado_cita(cita['id'], 'Completada')
-                                st.success("Cita completada")
-                                st.rerun()
+                            elif cita['estado'] == 'En Consulta':
+                                if st.button("✔️ Finalizar", key=f"finalizar_{cita['id']}"):
+                                    db.update_estado_cita(cita['id'], 'Completada')
+                                    st.success("Cita completada")
+                                    st.rerun()
                         
-                        # Opción de marcar No-show siempre disponible
-                        if cita['estado'] not in ['Completada', 'No-show']:
-                            if st.button("❌ No-show", key=f"noshow_{cita['id']}"):
-                                db.update_estado_cita(cita['id'], 'No-show')
-                                st.rerun()
+                            # Opción de marcar No-show mientras la cita siga vigente
+                            if cita['estado'] != 'Completada' and cita['estado'] not in db.ESTADOS_SIN_HORARIO:
+                                if st.button("❌ No-show", key=f"noshow_{cita['id']}"):
+                                    db.update_estado_cita(cita['id'], 'No-show')
+                                    st.rerun()
                     
-                    st.divider()
-        else:
-            st.info("No hay citas programadas para esta fecha")
-    
+                        st.divider()
+            else:
+                st.info("No hay citas programadas para esta fecha")
+
     # ==================== TAB 2: Nueva Cita ====================
     with tab2:
         st.subheader("Agendar Nueva Cita")
         
+        with st.expander("🔎 Buscar próximos horarios libres"):
+            medicos_busqueda = db.get_all_medicos()
+            nombres = {m['id']: m['nombre'] for m in medicos_busqueda}
+            opciones_busqueda = {"Cualquier médico": None}
+            opciones_busqueda.update({f"{m['nombre']} - {m['especialidad']}": m['id'] for m in medicos_busqueda})
+            col1, col2, col3 = st.columns([2, 1, 1])
+            with col1:
+                medico_busqueda = st.selectbox("Médico", list(opciones_busqueda.keys()), key="libres_medico")
+            with col2:
+                duracion_busqueda = st.selectbox("Duración (min)", db.DURACIONES, key="libres_duracion",
+                                                 index=db.DURACIONES.index(db.DURACION_CITA))
+            with col3:
+                cantidad = st.number_input("Cantidad", min_value=1, max_value=50, value=10, key="libres_cantidad")
+            
+            if st.button("Buscar horarios libres"):
+                turnos = disponibilidad.proximos_libres(int(cantidad), duracion_busqueda,
+                                                        medico_id=opciones_busqueda[medico_busqueda])
+                if turnos:
+                    st.dataframe(pd.DataFrame([{
+                        'Médico': nombres.get(t['medico_id'], t['medico_id']),
+                        'Fecha': t['fecha_hora'][:10],
+                        'Hora': f"{t['fecha_hora'][11:16]} - {t['fecha_hora_fin'][11:16]}"
+                    } for t in turnos]), use_container_width=True, hide_index=True)
+                else:
+                    st.info(f"No hay horarios libres en las próximas {disponibilidad.SEMANAS} semanas")
+        
         # Opciones para paciente
         tipo_paciente = st.radio("¿El paciente ya está en el sistema?", ["Paciente Existente", "Nuevo Paciente (Potencial)"], horizontal=True)
         
+        # El selector busca en el servidor a cada cambio, por eso va fuera del formulario
+        paciente_existente = None
+        if tipo_paciente == "Paciente Existente":
+            paciente_existente = selector_paciente("cita_paciente", "Paciente Existente *")
+        
         with st.form("nueva_cita"):
             paciente_id = None
             
             if tipo_paciente == "Paciente Existente":
-                pacientes = db.get_all_pacientes()
-                if not pacientes:
-                    st.warning("No hay pacientes registrados en el sistema.")
+                if not paciente_existente:
+                    st.warning("Seleccione un paciente registrado en el sistema.")
                     st.form_submit_button("Guardar (Deshabilitado)", disabled=True)
                 else:
-                    pacientes_dict = {f"{p['nombre']} (ID: {p['id']})": p['id'] for p in pacientes}
-                    paciente_seleccionado = st.selectbox("Paciente Existente *", list(pacientes_dict.keys()))
-                    paciente_id = pacientes_dict[paciente_seleccionado]
+                    st.write(f"**Paciente:** {paciente_existente['nombre']} (ID: {paciente_existente['id']})")
+                    paciente_id = paciente_existente['id']
             else:
                 st.info("Crear paciente rápido para agendar.")
                 nuevo_nombre = st.text_input("Nombre Completo *")
@@ -135,12 +407,15 @@ def show():
                 medico_seleccionado = st.selectbox("Médico *", list(medicos_dict.keys()))
                 medico_id = medicos_dict[medico_seleccionado]
                 
-                # Fecha y hora
-                col1, col2 = st.columns(2)
+                # Fecha, hora y duración
+                col1, col2, col3 = st.columns(3)
                 with col1:
                     fecha_cita = st.date_input("Fecha *", min_value=date.today())
                 with col2:
                     hora_cita = st.time_input("Hora *", value=datetime.now().time())
+                with col3:
+                    duracion = st.selectbox("Duración (min)", db.DURACIONES,
+                                            index=db.DURACIONES.index(db.DURACION_CITA))
                 
                 submitted = st.form_submit_button("📅 Agendar Cita", use_container_width=True)
                 
@@ -170,31 +445,30 @@ def show():
                         st.stop()
 
                     # Combinar fecha y hora
-                    fecha_hora = datetime.combine(fecha_cita, hora_cita).strftime('%Y-%m-%d %H:%M:%S')
-                    
-                    # Verificar si ya existe una cita en ese horario
-                    citas_existentes = db.get_citas_by_medico_fecha(medico_id, fecha_cita.strftime('%Y-%m-%d'))
-                    conflicto = False
+                    fecha_hora = datetime.combine(fecha_cita, hora_cita).replace(second=0, microsecond=0)
                     
-                    for cita in citas_existentes:
-                        if cita['fecha_hora'] == fecha_hora:
-                            conflicto = True
-                            break
-                    
-                    if conflicto:
-                        st.error("⚠️ Ya existe una cita para este médico en este horario")
+                    # La verificación de horario libre y la inserción son atómicas en la base
+                    try:
+                        cita_id = db.reservar_cita(paciente_id, medico_id, fecha_hora, duracion)
+                    except Exception as e:
+                        st.error(f"Error al agendar cita: {str(e)}")
                     else:
-                        try:
-                            cita_id = db.create_cita(paciente_id, medico_id, fecha_hora)
+                        if cita_id is None:
+                            st.error("⚠️ El horario se superpone con otra cita de este médico")
+                            for cita in db.get_citas_solapadas(medico_id, fecha_hora, duracion):
+                                st.caption(f"• {cita['fecha_hora'][11:16]}–{cita['fecha_hora_fin'][11:16]} ({cita['estado']})")
+                        else:
                             st.success(f"✅ Cita agendada exitosamente (ID: {cita_id})")
                             st.balloons()
                             if tipo_paciente == "Nuevo Paciente (Potencial)":
                                 st.info("Recuerde completar los datos médicos del paciente el día de la consulta.")
-                        except Exception as e:
-                            st.error(f"Error al agendar cita: {str(e)}")
     
-    # ==================== TAB 3: Estadísticas ====================
+    # ==================== TAB 3: Serie de Citas ====================
     with tab3:
+        mostrar_series()
+
+    # ==================== TAB 4: Estadísticas ====================
+    with tab4:
         st.subheader("📊 Estadísticas de No-shows")
         
         # Filtros
@@ -277,13 +551,16 @@ def show():
             st.markdown("---")
             st.subheader("Estadísticas por Médico")
             
+            # Una sola consulta agrupada para todos los médicos
+            stats_por_medico = db.get_citas_stats_por_medico(
+                fecha_inicio.strftime('%Y-%m-%d'),
+                fecha_fin.strftime('%Y-%m-%d'),
+                medico_ids=[m['id'] for m in medicos]
+            )
+            
             medicos_stats = []
             for medico in medicos:
-                stats_medico = db.get_noshow_stats(
-                    medico_id=medico['id'],
-                    fecha_inicio=fecha_inicio.strftime('%Y-%m-%d'),
-                    fecha_fin=fecha_fin.strftime('%Y-%m-%d')
-                )
+                stats_medico = stats_por_medico[medico['id']]
                 medicos_stats.append({
                     'Médico': medico['nombre'],
                     'Especialidad': medico['especialidad'],
@@ -1,16 +1,19 @@
 import streamlit as st
 import pandas as pd
-from database import search_pacientes, get_hce_by_paciente
+from datetime import datetime, date
+from database import search_pacientes, get_hce_by_paciente, search_hce, get_all_medicos, SEARCH_LIMIT
 
 def mostrar_buscador():
     st.header("🔍 Buscador de Pacientes e Historial")
-    query = st.text_input("Buscar por Nombre o DNI")
+    query = st.text_input("Buscar por Nombre, Teléfono o ID", help="No distingue acentos; admite palabras incompletas (ej: 'jua per')")
     
     if query:
         resultados = search_pacientes(query)
         if resultados:
             df_pacientes = pd.DataFrame(resultados)
             st.subheader("Pacientes Encontrados")
+            if len(resultados) >= SEARCH_LIMIT:
+                st.caption(f"Mostrando los {SEARCH_LIMIT} resultados más relevantes. Refine la búsqueda para acotar.")
             st.dataframe(df_pacientes, use_container_width=True)
             
             # Seleccionar paciente para ver historial
@@ -25,3 +28,44 @@ def mostrar_buscador():
                     st.warning("Este paciente aún no tiene consultas registradas.")
         else:
             st.error("No se encontraron resultados.")
+
+
+def mostrar_buscador_clinico():
+    st.header("🩺 Buscador Clínico")
+    st.caption("Busca en diagnósticos, motivos de consulta, examen físico, hallazgos de ECG/Eco y observaciones.")
+    
+    texto = st.text_input("Texto a buscar", placeholder="Ej: soplo sistólico, fibrilación auricular...")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        medicos = get_all_medicos()
+        medicos_dict = {"Todos": None}
+        medicos_dict.update({m['nombre']: m['id'] for m in medicos})
+        medico_filtro = st.selectbox("Médico", list(medicos_dict.keys()))
+    with col2:
+        # Sin fecha inicial se busca en toda la historia
+        fecha_inicio = st.date_input("Desde", value=None, help="Vacío: desde la primera consulta")
+    with col3:
+        fecha_fin = st.date_input("Hasta", value=date.today())
+    
+    if texto:
+        resultados = search_hce(
+            texto,
+            medico_id=medicos_dict[medico_filtro],
+            fecha_inicio=fecha_inicio,
+            fecha_fin=fecha_fin
+        )
+        if resultados:
+            st.write(f"**{len(resultados)} consulta(s) encontrada(s)**")
+            if len(resultados) >= SEARCH_LIMIT:
+                st.caption(f"Mostrando las {SEARCH_LIMIT} más relevantes. Refine la búsqueda para acotar.")
+            
+            for r in resultados:
+                fecha = datetime.fromisoformat(r['fecha_consulta']).strftime('%d/%m/%Y')
+                st.write(f"**{fecha}** - {r['paciente_nombre']} (ID: {r['paciente_id']}) - Dr. {r['medico_nombre']}")
+                if r['diagnostico']:
+                    st.caption(f"Diagnóstico: {r['diagnostico']}")
+                st.markdown(f"> {r['fragmento']}")
+                st.divider()
+        else:
+            st.warning("No se encontraron consultas con ese texto.")
@@ -0,0 +1,57 @@
+"""
+Componentes de interfaz reutilizables entre módulos.
+"""
+
+import streamlit as st
+import database as db
+
+
+def _etiqueta_paciente(paciente: dict) -> str:
+    return f"{paciente['nombre']} (ID: {paciente['id']})"
+
+
+def selector_paciente(key: str, label: str = "Seleccionar Paciente"):
+    """
+    Selector de pacientes con búsqueda del lado del servidor.
+    Solo se consulta la página visible: los resultados de la búsqueda o, sin
+    texto, la página actual del listado alfabético (paginación por keyset).
+    Retorna el dict del paciente seleccionado o None.
+    """
+    # Pila con el inicio (nombre, id) de cada página visitada; None = primera página
+    cursores = st.session_state.setdefault(f"{key}_cursores", [None])
+    
+    query = st.text_input("🔍 Buscar paciente (nombre, teléfono o ID)", key=f"{key}_busqueda")
+    
+    if query:
+        pacientes = db.search_pacientes(query, limit=db.PAGE_SIZE)
+    else:
+        after_nombre, after_id = cursores[-1] or (None, None)
+        pacientes = db.list_pacientes(after_nombre, after_id, limit=db.PAGE_SIZE)
+    
+    if not pacientes:
+        st.info("No se encontraron pacientes")
+        return None
+    
+    por_id = {p['id']: p for p in pacientes}
+    paciente_id = st.selectbox(
+        label,
+        list(por_id.keys()),
+        format_func=lambda pid: _etiqueta_paciente(por_id[pid]),
+        key=f"{key}_select"
+    )
+    
+    if not query:
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            if st.button("◀ Anterior", key=f"{key}_anterior", disabled=len(cursores) == 1, use_container_width=True):
+                cursores.pop()
+                st.rerun()
+        with col2:
+            if st.button("Siguiente ▶", key=f"{key}_siguiente", disabled=len(pacientes) < db.PAGE_SIZE, use_container_width=True):
+                ultimo = pacientes[-1]
+                cursores.append((ultimo['nombre'], ultimo['id']))
+                st.rerun()
+        with col3:
+            st.caption(f"Página {len(cursores)} · escriba para buscar entre todos los pacientes")
+    
+    return por_id.get(paciente_id)
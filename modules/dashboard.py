@@ -23,6 +23,24 @@ def show():
         mostrar_dashboard_general()
 
 
+def mostrar_antiguedad_snapshot(key: str):
+    """Indica la antigüedad de los datos de reportes y permite refrescarlos."""
+    info = db.get_snapshot_info()
+    if not info['activo'] or info['tomado_en'] is None:
+        return
+    
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        antiguedad = int(info['antiguedad_s'])
+        icono = "🟢" if antiguedad < info['intervalo'] else "🟠"
+        st.caption(f"{icono} Estadísticas al {info['tomado_en'].strftime('%H:%M:%S')} "
+                   f"(hace {antiguedad} s, se actualizan cada {info['intervalo']} s)")
+    with col2:
+        if st.button("🔄 Actualizar", key=key):
+            db.refresh_snapshot()
+            st.rerun()
+
+
 def mostrar_dashboard_medico(medico_id: int):
     """Dashboard personalizado para médicos."""
     medico = db.get_medico(medico_id)
@@ -43,7 +61,7 @@ def mostrar_dashboard_medico(medico_id: int):
         # Resumen rápido
         col1, col2, col3, col4 = st.columns(4)
         
-        total = len(citas_hoy)
+        total = sum(1 for c in citas_hoy if c['estado'] != 'Cancelada')
         pendientes = sum(1 for c in citas_hoy if c['estado'] == 'Pendiente')
         en_consulta = sum(1 for c in citas_hoy if c['estado'] == 'En Consulta')
         completadas = sum(1 for c in citas_hoy if c['estado'] == 'Completada')
@@ -67,7 +85,8 @@ def mostrar_dashboard_medico(medico_id: int):
                 'Llegó': '🔵',
                 'En Consulta': '🟢',
                 'Completada': '✅',
-                'No-show': '🔴'
+                'No-show': '🔴',
+                'Cancelada': '⚫'
             }
             
             col1, col2, col3 = st.columns([1, 3, 2])
@@ -90,6 +109,7 @@ def mostrar_dashboard_medico(medico_id: int):
         fecha_inicio=primer_dia_mes,
         fecha_fin=date.today().strftime('%Y-%m-%d')
     )
+    mostrar_antiguedad_snapshot("dashboard_medico_snapshot")
     
     col1, col2, col3, col4 = st.columns(4)
     with col1:
@@ -170,36 +190,31 @@ def mostrar_dashboard_general():
     """Dashboard general para admin y recepción."""
     st.subheader("Vista General del Sistema")
     
-    # Estadísticas generales
-    pacientes = db.get_all_pacientes()
+    # Estadísticas generales (conteos calculados en SQL sobre el snapshot de reportes)
+    resumen = db.get_resumen_clinica()
     medicos = db.get_all_medicos()
+    mostrar_antiguedad_snapshot("dashboard_general_snapshot")
     
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        st.metric("Total Pacientes", len(pacientes))
-        pediatricos = sum(1 for p in pacientes if p['es_pediatrico'])
-        st.caption(f"👶 {pediatricos} pediátricos | 👤 {len(pacientes) - pediatricos} adultos")
+        st.metric("Total Pacientes", resumen['total_pacientes'])
+        st.caption(f"👶 {resumen['pediatricos']} pediátricos | 👤 {resumen['adultos']} adultos")
     
     with col2:
-        st.metric("Médicos Activos", len(medicos))
+        st.metric("Médicos Activos", resumen['medicos_activos'])
     
     with col3:
         # Citas de hoy (todos los médicos)
-        hoy = datetime.now().strftime('%Y-%m-%d')
-        total_citas_hoy = 0
-        for medico in medicos:
-            citas = db.get_citas_by_medico_fecha(medico['id'], hoy)
-            total_citas_hoy += len(citas)
-        st.metric("Citas Hoy", total_citas_hoy)
+        st.metric("Citas Hoy", resumen['citas_hoy'])
     
     # Distribución de pacientes
     st.markdown("---")
     st.subheader("📊 Distribución de Pacientes")
     
-    if pacientes:
-        pediatricos = sum(1 for p in pacientes if p['es_pediatrico'])
-        adultos = len(pacientes) - pediatricos
+    if resumen['total_pacientes']:
+        pediatricos = resumen['pediatricos']
+        adultos = resumen['adultos']
         
         fig = go.Figure(data=[go.Pie(
             labels=['Pediátricos', 'Adultos'],
@@ -222,13 +237,16 @@ def mostrar_dashboard_general():
     
     primer_dia_mes = date.today().replace(day=1).strftime('%Y-%m-%d')
     
+    # Una sola consulta agrupada para todos los médicos
+    stats_por_medico = db.get_citas_stats_por_medico(
+        primer_dia_mes,
+        date.today().strftime('%Y-%m-%d'),
+        medico_ids=[m['id'] for m in medicos]
+    )
+    
     medicos_data = []
     for medico in medicos:
-        stats = db.get_noshow_stats(
-            medico_id=medico['id'],
-            fecha_inicio=primer_dia_mes,
-            fecha_fin=date.today().strftime('%Y-%m-%d')
-        )
+        stats = stats_por_medico[medico['id']]
         medicos_data.append({
             'Médico': medico['nombre'],
             'Especialidad': medico['especialidad'],
@@ -257,3 +275,73 @@ def mostrar_dashboard_general():
         
         fig.update_layout(height=400)
         st.plotly_chart(fig, use_container_width=True)
+    
+    mostrar_tendencias()
+
+
+def mostrar_tendencias():
+    """Tendencias históricas calculadas sobre el snapshot Parquet (no toca la base transaccional)."""
+    import analitica
+    import pandas as pd
+    
+    st.markdown("---")
+    st.subheader("📉 Tendencias Históricas")
+    
+    snapshot = analitica.fecha_snapshot()
+    
+    if st.session_state.user['rol'] == 'admin':
+        # La exportación corre en segundo plano; mientras tanto se muestra el snapshot anterior
+        if st.button("🔄 Actualizar snapshot analítico", key="dashboard_exportar_parquet",
+                     disabled=analitica.estado_exportacion()['en_curso']):
+            analitica.exportar_en_segundo_plano()
+        estado = analitica.estado_exportacion()
+        if estado['en_curso']:
+            st.info("Exportando datos a Parquet en segundo plano; recargue la página para ver el resultado.")
+        elif estado['error']:
+            st.error(f"La última exportación falló ({estado['terminado_en']:%H:%M}): {estado['error']}")
+        elif estado['resumen']:
+            st.success(f"Snapshot actualizado a las {estado['terminado_en']:%H:%M}: "
+                       + ", ".join(f"{k}: {v}" for k, v in estado['resumen'].items()))
+    
+    if snapshot is None:
+        st.info("Aún no hay snapshot analítico. Ejecute `python analitica.py exportar` o pulse el botón de actualización (admin).")
+        return
+    
+    st.caption(f"Datos del snapshot exportado el {snapshot}")
+    
+    tendencia = analitica.tendencia_mensual_citas()
+    if tendencia:
+        fig = px.bar(
+            pd.DataFrame(tendencia), x='mes', y='total', color='estado',
+            title='Citas por Mes y Estado', labels={'mes': 'Mes', 'total': 'Citas'}
+        )
+        fig.update_layout(height=350)
+        st.plotly_chart(fig, use_container_width=True)
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        por_dia = analitica.noshows_por_dia_semana()
+        if por_dia:
+            fig = px.bar(
+                pd.DataFrame(por_dia), x='dia', y='tasa_noshow',
+                title='Tasa de No-show por Día de la Semana (%)',
+                labels={'dia': 'Día', 'tasa_noshow': 'No-show (%)'}
+            )
+            fig.update_layout(height=350)
+            st.plotly_chart(fig, use_container_width=True)
+    
+    with col2:
+        riesgo = analitica.distribucion_riesgo()
+        if riesgo:
+            fig = px.pie(
+                pd.DataFrame(riesgo), names='clasificacion_riesgo', values='total',
+                title='Distribución de Riesgo Cardiovascular (Adultos)'
+            )
+            fig.update_layout(height=350)
+            st.plotly_chart(fig, use_container_width=True)
+    
+    vitales = analitica.signos_vitales_por_edad()
+    if vitales:
+        st.markdown("**Signos vitales medios por banda de edad**")
+        st.dataframe(pd.DataFrame(vitales), use_container_width=True, hide_index=True)
@@ -6,6 +6,7 @@ Formularios diferenciados para pacientes pediátricos y adultos con cálculos m
 import streamlit as st
 from datetime import datetime, date
 import database as db
+from modules.componentes import selector_paciente
 import math
 import traceback
 
@@ -177,8 +178,8 @@ def show():
     st.title("📝 Historia Clínica Electrónica")
     
     # Seleccionar paciente
-    pacientes = db.get_all_pacientes()
-    if not pacientes:
+    hay_pacientes = bool(db.list_pacientes(limit=1))
+    if not hay_pacientes:
         st.warning("No hay pacientes registrados. Por favor registre su primer paciente.")
         with st.form("registro_primer_paciente"):
             st.subheader("Registrar Nuevo Paciente")
@@ -197,9 +198,8 @@ def show():
                 elif es_pediatrico and not tutor_legal:
                     st.error("El tutor legal es requerido para pacientes pediátricos.")
                 else:
-                    db.create_paciente(nombre, fecha_nacimiento.strftime('%Y-%m-%d'), es_pediatrico, contacto, tutor_legal)
+                    nuevo_id = db.create_paciente(nombre, fecha_nacimiento.strftime('%Y-%m-%d'), es_pediatrico, contacto, tutor_legal)
                     # Actualizar sexo directamente en la base de datos para este primer paciente
-                    nuevo_id = db.get_all_pacientes()[-1]['id']
                     db.update_paciente_sexo(nuevo_id, sexo)
                     st.success("Paciente registrado exitosamente. Recargando la página...")
                     st.rerun()
@@ -213,14 +213,11 @@ def show():
         st.info(f"💡 **Pacientes en Sala de Espera ({len(pacientes_esperando)}):** " + 
                 ", ".join([f"{c['paciente_nombre']}" for c in pacientes_esperando]))
     
-    pacientes_dict = {f"{p['nombre']} (ID: {p['id']})": p for p in pacientes}
-    paciente_seleccionado = st.selectbox("Seleccionar Paciente", list(pacientes_dict.keys()))
+    paciente = selector_paciente("hce_paciente")
     
-    if not paciente_seleccionado:
+    if not paciente:
         return
     
-    paciente = pacientes_dict[paciente_seleccionado]
-    
     # Calcular edad
     fecha_nac = datetime.strptime(paciente['fecha_nacimiento'], '%Y-%m-%d').date()
     edad = (date.today() - fecha_nac).days // 365
@@ -238,13 +235,27 @@ def show():
     
     # Mostrar historial previo
     with st.expander("📋 Ver Historial de Consultas"):
-        historial = db.get_hce_by_paciente(paciente['id'])
+        # Consultas, detalle, exámenes y recetas en un número fijo de consultas SQL
+        historial = db.get_historia_completa(paciente['id'])
         if historial:
             for registro in historial:
                 fecha = datetime.fromisoformat(registro['fecha_consulta']).strftime('%d/%m/%Y %H:%M')
                 st.write(f"**{fecha}** - Dr. {registro['medico_nombre']}")
                 st.write(f"Motivo: {registro['motivo_consulta']}")
+                if registro['diagnostico']:
+                    st.write(f"Diagnóstico: {registro['diagnostico']}")
                 st.write(f"FC: {registro['fc']} | TA: {registro['ta_sistolica']}/{registro['ta_diastolica']} | SatO2: {registro['sato2']}%")
+                if registro['detalle_adulto']:
+                    st.caption(f"Riesgo CV: {registro['detalle_adulto']['clasificacion_riesgo']} "
+                               f"(SCORE {registro['detalle_adulto']['riesgo_cardiovascular_score']}%)")
+                if registro['detalle_infantil']:
+                    st.caption(f"Peso: {registro['detalle_infantil']['peso_kg']} kg | "
+                               f"Talla: {registro['detalle_infantil']['talla_cm']} cm | "
+                               f"Ductus: {registro['detalle_infantil']['ductus_estado']}")
+                if registro['indicaciones']:
+                    st.caption("Exámenes: " + ", ".join(ex['tipo_examen'] for ex in registro['indicaciones']))
+                if registro['recetas']:
+                    st.caption("Récipes: " + ", ".join(f"{rx['medicamento']} {rx['dosis']}" for rx in registro['recetas']))
                 st.divider()
         else:
             st.info("No hay consultas previas registradas")
@@ -497,29 +508,28 @@ def show():
                 
                 fecha_actual = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-                # 1. Guardar HCE común
-                hce_comun_id = db.create_hce_comun(
-                    paciente_id=paciente['id'],
-                    medico_id=medico_id,
-                    fecha_consulta=fecha_actual,
-                    motivo_consulta=motivo_consulta,
-                    diagnostico=diagnostico,
-                    fc=fc,
-                    ta_sistolica=ta_sistolica,
-                    ta_diastolica=ta_diastolica,
-                    sato2=sato2,
-                    ef_general=ef_general,
-                    ef_cardio=ef_cardio,
-                    ef_respiratorio=ef_respiratorio,
-                    ef_otros=ef_otros,
-                    ecg_hallazgos=ecg_hallazgos,
-                    echo_hallazgos=echo_hallazgos,
-                    observaciones=observaciones
-                )
+                # 1. Datos comunes de la consulta
+                consulta_hce = {
+                    'fecha_consulta': fecha_actual,
+                    'motivo_consulta': motivo_consulta,
+                    'diagnostico': diagnostico,
+                    'fc': fc,
+                    'ta_sistolica': ta_sistolica,
+                    'ta_diastolica': ta_diastolica,
+                    'sato2': sato2,
+                    'ef_general': ef_general,
+                    'ef_cardio': ef_cardio,
+                    'ef_respiratorio': ef_respiratorio,
+                    'ef_otros': ef_otros,
+                    'ecg_hallazgos': ecg_hallazgos,
+                    'echo_hallazgos': echo_hallazgos,
+                    'observaciones': observaciones
+                }
                 
-                # 2. Guardar datos específicos
+                # 2. Datos específicos
                 hce_detalle = {}
                 hce_tipo = ''
+                sexo_actualizado = None
                 
                 if paciente['es_pediatrico']:
                     hce_tipo = 'infantil'
@@ -530,7 +540,6 @@ def show():
                         'zscore_mitral': zscore_mitral, 'zscore_tricuspide': zscore_tricuspide,
                         'ductus_estado': ductus_estado, 'ductus_tamaño_mm': ductus_tamaño_mm
                     }
-                    db.create_hce_infantil(hce_comun_id=hce_comun_id, **hce_detalle)
                 else:
                     hce_tipo = 'adulto'
                     hce_detalle = {
@@ -539,21 +548,24 @@ def show():
                         'colesterol_hdl': colesterol_hdl, 'riesgo_cardiovascular_score': riesgo_score,
                         'riesgo_cardiovascular_framingham': riesgo_framingham, 'clasificacion_riesgo': clasificacion
                     }
-                    db.create_hce_adulto(hce_comun_id=hce_comun_id, **hce_detalle)
                     # Actualizar sexo del paciente en la tabla principal si cambió o no existía
-                    db.update_paciente_sexo(paciente['id'], sexo)
+                    sexo_actualizado = sexo
                 
-                # 3. Guardar Exámenes
-                for ex in examenes_data:
-                    db.create_indicacion_examen(hce_comun_id, ex['tipo_examen'], ex['indicacion'])
-                    
-                # 4. Guardar Recetas
-                for rx in recetas_data:
-                    db.create_receta(hce_comun_id, rx['medicamento'], rx['dosis'], rx['frecuencia'], rx['duracion'], rx['indicaciones_adicionales'])
+                # 3. Guardar todo (HCE, detalle, exámenes y recetas) en una sola transacción
+                db.save_consulta(
+                    paciente_id=paciente['id'],
+                    medico_id=medico_id,
+                    consulta=consulta_hce,
+                    hce_tipo=hce_tipo,
+                    hce_detalle=hce_detalle,
+                    examenes=examenes_data,
+                    recetas=recetas_data,
+                    sexo=sexo_actualizado
+                )
                 
                 st.success("✅ Consulta guardada exitosamente")
                 
-                # 5. Generar PDF
+                # 4. Generar PDF
                 from modules.reportes import generar_pdf_consulta
                 
                 # Recuperar datos completos del médico para el reporte
@@ -561,20 +573,10 @@ def show():
                 if not medico_data:
                     medico_data = {'nombre': 'Médico General', 'especialidad': 'Cardiología', 'email': ''}
                     
-                consulta_data = {
-                    'fecha_consulta': fecha_actual,
-                    'motivo_consulta': motivo_consulta,
-                    'diagnostico': diagnostico,
-                    'fc': fc, 'ta_sistolica': ta_sistolica, 'ta_diastolica': ta_diastolica, 'sato2': sato2,
-                    'ef_general': ef_general, 'ef_cardio': ef_cardio, 'ef_respiratorio': ef_respiratorio, 'ef_otros': ef_otros,
-                    'ecg_hallazgos': ecg_hallazgos, 'echo_hallazgos': echo_hallazgos,
-                    'observaciones': observaciones
-                }
-                
                 pdf_file = generar_pdf_consulta(
                     paciente=paciente,
                     medico=medico_data,
-                    consulta=consulta_data,
+                    consulta=consulta_hce,
                     hce_detalle=hce_detalle,
                     hce_tipo=hce_tipo,
                     indicaciones=examenes_data,
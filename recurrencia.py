@@ -0,0 +1,145 @@
+"""
+Series de citas recurrentes: controles cada 3 meses, sesiones semanales de
+rehabilitación, etc.
+
+expandir() convierte la regla (frecuencia, intervalo, cantidad o fecha
+límite) en las fechas de cada ocurrencia. planificar_serie() verifica todas
+las ocurrencias contra la agenda del médico con una sola consulta
+(db.get_conflictos_ocurrencias) y contra su horario de atención; las que no
+entran se mueven al primer turno libre cercano o se omiten. agendar_serie()
+inserta la serie entera en una transacción y devuelve el informe de qué
+ocurrencias quedaron, cuáles se movieron y cuáles se omitieron.
+editar_serie() cambia hora, duración o médico de las pendientes con las
+mismas verificaciones.
+"""
+
+import calendar
+from datetime import datetime, time, timedelta
+
+import database as db
+import disponibilidad
+
+FRECUENCIAS = ('diaria', 'semanal', 'mensual')
+TOLERANCIA_DIAS = 7
+
+
+def _sumar_meses(fecha, meses):
+    """Misma fecha `meses` después; si el día no existe (31 de abril) queda el último del mes."""
+    mes = fecha.month - 1 + meses
+    anio, mes = fecha.year + mes // 12, mes % 12 + 1
+    return fecha.replace(year=anio, month=mes, day=min(fecha.day, calendar.monthrange(anio, mes)[1]))
+
+
+def expandir(inicio, frecuencia, intervalo=1, ocurrencias=None, hasta=None):
+    """
+    Fechas (datetime) de la serie que empieza en `inicio`: cada `intervalo`
+    días, semanas o meses, hasta completar `ocurrencias` o pasar `hasta`
+    (date o datetime, inclusive). Los meses se cuentan siempre desde la fecha
+    inicial, así una serie del 31 de enero sigue el 29 de febrero y el 31 de marzo.
+    """
+    if frecuencia not in FRECUENCIAS:
+        raise ValueError(f"Frecuencia desconocida: {frecuencia}")
+    if intervalo < 1:
+        raise ValueError("El intervalo debe ser al menos 1")
+    if ocurrencias is None and hasta is None:
+        raise ValueError("Indique la cantidad de citas o la fecha límite de la serie")
+    if ocurrencias is not None and not 1 <= ocurrencias <= db.MAX_OCURRENCIAS:
+        raise ValueError(f"Una serie admite entre 1 y {db.MAX_OCURRENCIAS} citas")
+    if hasta is not None and not isinstance(hasta, datetime):
+        hasta = datetime.combine(hasta, time.max)
+
+    fechas = []
+    for n in range(db.MAX_OCURRENCIAS):
+        if frecuencia == 'mensual':
+            fecha = _sumar_meses(inicio, n * intervalo)
+        else:
+            fecha = inicio + timedelta(days=n * intervalo * (7 if frecuencia == 'semanal' else 1))
+        if (hasta is not None and fecha > hasta) or (ocurrencias is not None and n >= ocurrencias):
+            break
+        fechas.append(fecha)
+    return fechas
+
+
+def _choca_con(fecha_hora, tomadas, duracion_min):
+    """Si el turno se superpone con otra ocurrencia de la misma serie (aún no agendada)."""
+    inicio = datetime.fromisoformat(fecha_hora)
+    duracion = timedelta(minutes=duracion_min)
+    return any(inicio < otra + duracion and otra < inicio + duracion
+               for otra in map(datetime.fromisoformat, tomadas))
+
+
+def planificar_serie(medico_id, fechas, duracion_min=db.DURACION_CITA, mover=True,
+                     tolerancia_dias=TOLERANCIA_DIAS):
+    """
+    Revisa las ocurrencias antes de agendarlas. Retorna una lista de dicts
+    {'original', 'fecha_hora', 'estado', 'motivo'} en el orden de `fechas`:
+    estado 'libre' (se agenda tal cual), 'movida' (fecha_hora es el primer
+    turno libre del médico dentro de tolerancia_dias) u 'omitida'
+    (fecha_hora None). Con mover=False las ocurrencias en conflicto se omiten.
+    """
+    originales = [f.strftime('%Y-%m-%d %H:%M:%S') for f in fechas]
+    conflictos = db.get_conflictos_ocurrencias(medico_id, originales, duracion_min)
+    horario = db.get_horario_medico(medico_id)
+
+    plan = []
+    for n, (fecha, original) in enumerate(zip(fechas, originales)):
+        if n in conflictos:
+            motivo = "se superpone con otra cita"
+        elif not disponibilidad.dentro_de_horario(horario, fecha, duracion_min):
+            motivo = "fuera del horario de atención"
+        else:
+            motivo = ''
+        plan.append({'original': original, 'fecha_hora': None if motivo else original,
+                     'estado': 'omitida' if motivo else 'libre', 'motivo': motivo})
+    if not mover:
+        return plan
+
+    # Las reubicadas no pueden pisar a las demás ocurrencias de la serie
+    tomadas = [o['fecha_hora'] for o in plan if o['fecha_hora']]
+    for fecha, ocurrencia in zip(fechas, plan):
+        if ocurrencia['estado'] == 'libre':
+            continue
+        # Pocas ocurrencias chocan; cada reubicación lee solo las semanas de tolerancia
+        turnos = disponibilidad.proximos_libres(len(fechas) + 1, duracion_min, medico_id=medico_id,
+                                                desde=fecha, semanas=max(1, -(-tolerancia_dias // 7)))
+        limite = (fecha + timedelta(days=tolerancia_dias)).strftime('%Y-%m-%d %H:%M:%S')
+        nueva = next((t['fecha_hora'] for t in turnos
+                      if t['fecha_hora'] <= limite and not _choca_con(t['fecha_hora'], tomadas, duracion_min)), None)
+        if nueva:
+            ocurrencia.update(fecha_hora=nueva, estado='movida')
+            tomadas.append(nueva)
+    return plan
+
+
+def editar_serie(serie_id, hora=None, duracion_min=None, medico_id=None, desde=None):
+    """
+    db.update_serie_citas con la misma verificación de horario de atención
+    que planificar_serie: las ocurrencias que quedarían fuera del horario del
+    médico no se mueven y se informan en 'fuera_de_horario'.
+    """
+    horarios = db.get_horarios_medicos()
+
+    def en_horario(medico, fecha_hora, duracion):
+        return disponibilidad.dentro_de_horario(horarios.get(medico, db.HORARIO_POR_DEFECTO), fecha_hora, duracion)
+    return db.update_serie_citas(serie_id, hora, duracion_min, medico_id, desde, en_horario=en_horario)
+
+
+def agendar_serie(paciente_id, medico_id, plan, duracion_min=db.DURACION_CITA, frecuencia=None, intervalo=None):
+    """
+    Inserta las ocurrencias libres y movidas del plan como una serie (una
+    transacción, un executemany). Si otra recepcionista ocupó algún horario
+    entre la planificación y la inserción, esa ocurrencia pasa a 'omitida'.
+    Retorna (serie_id, plan actualizado); serie_id es None si no se agendó ninguna.
+    """
+    fechas = [o['fecha_hora'] for o in plan if o['fecha_hora']]
+    if not fechas:
+        return None, plan
+    serie_id, agendadas = db.create_serie_citas(paciente_id, medico_id, fechas, duracion_min, frecuencia, intervalo)
+    agendadas = set(agendadas)
+    informe = []
+    for ocurrencia in plan:
+        if ocurrencia['fecha_hora'] and ocurrencia['fecha_hora'] not in agendadas:
+            ocurrencia = dict(ocurrencia, fecha_hora=None, estado='omitida',
+                              motivo="el horario se ocupó mientras se agendaba")
+        informe.append(ocurrencia)
+    return serie_id, informe
@@ -0,0 +1,73 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+# Permite importar database y modules desde la raíz del proyecto
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database as db
+import metricas
+
+# Los tests no dejan un registro de consultas lentas en el directorio actual
+metricas.SLOW_QUERY_LOG = ''
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "solo_sqlite: prueba específica del backend SQLite")
+
+
+@pytest.fixture(scope='session')
+def servidor_postgres(tmp_path_factory):
+    """
+    DSN de un PostgreSQL para pruebas: CLINICA_TEST_PG_DSN si está definida o,
+    si no, un servidor local temporal con pgserver. Sin ninguno se omiten las
+    pruebas del backend postgres.
+    """
+    pytest.importorskip('psycopg')
+    pytest.importorskip('psycopg_pool')
+    dsn = os.environ.get('CLINICA_TEST_PG_DSN')
+    if dsn:
+        yield dsn
+        return
+    pgserver = pytest.importorskip('pgserver')
+    servidor = pgserver.get_server(str(tmp_path_factory.mktemp('pgdata')), cleanup_mode='stop')
+    yield servidor.get_uri()
+    servidor.cleanup()
+
+
+@pytest.fixture
+def base_postgres(servidor_postgres):
+    """Base PostgreSQL vacía y exclusiva para un test; se elimina al terminar."""
+    import psycopg
+    from psycopg.conninfo import make_conninfo
+
+    nombre = f"test_{uuid.uuid4().hex[:12]}"
+    with psycopg.connect(servidor_postgres, autocommit=True) as conn:
+        conn.execute(f"CREATE DATABASE {nombre}")
+    yield make_conninfo(servidor_postgres, dbname=nombre)
+    with psycopg.connect(servidor_postgres, autocommit=True) as conn:
+        conn.execute(f"DROP DATABASE IF EXISTS {nombre} WITH (FORCE)")
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def temp_db(request, tmp_path, monkeypatch):
+    """
+    Base de datos temporal e inicializada para cada test, en cada backend.
+    Los reportes leen directo de la base (sin snapshot) para ver las
+    escrituras del propio test; el snapshot se prueba aparte.
+    """
+    if request.param == 'postgres':
+        if request.node.get_closest_marker('solo_sqlite'):
+            pytest.skip("prueba específica de SQLite")
+        monkeypatch.setattr(db, 'DB_BACKEND', 'postgres')
+        monkeypatch.setattr(db, 'DB_DSN', request.getfixturevalue('base_postgres'))
+    else:
+        monkeypatch.setattr(db, 'DB_BACKEND', 'sqlite')
+    monkeypatch.setattr(db, 'DB_NAME', str(tmp_path / 'test_clinica.db'))
+    monkeypatch.setattr(db, 'SNAPSHOT_INTERVAL', 0)
+    db.init_db()
+    yield db
+    db.close_snapshot()
+    db.close_pool()
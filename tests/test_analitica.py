@@ -0,0 +1,108 @@
+import os
+import time
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+import analitica
+
+
+def _poblar(db):
+    adulto = db.create_paciente('Ana Pérez', '1960-06-01', False, '555', '')
+    nino = db.create_paciente('Leo Pérez', '2020-01-01', True, '555', 'Ana Pérez')
+    # 2024-03-04 es lunes, 2024-03-05 martes
+    for fecha_hora, estado in [('2024-03-04 09:00:00', 'No-show'), ('2024-03-04 10:00:00', 'Completada'),
+                               ('2024-03-05 09:00:00', 'Completada'), ('2024-04-02 09:00:00', 'No-show'),
+                               ('2024-03-04 11:00:00', 'Cancelada')]:
+        cita_id = db.create_cita(adulto, 1, fecha_hora)
+        db.update_estado_cita(cita_id, estado)
+
+    consulta = {'fecha_consulta': '2024-03-04 10:00:00', 'motivo_consulta': 'Control', 'fc': 70,
+                'ta_sistolica': 140, 'ta_diastolica': 90, 'sato2': 97.0, 'observaciones': ''}
+    detalle = {'tiene_hta': True, 'tiene_diabetes': False, 'tabaquismo': 'No', 'colesterol_total': 220.0,
+               'colesterol_hdl': 40.0, 'riesgo_cardiovascular_score': 12.0,
+               'riesgo_cardiovascular_framingham': 12.0, 'clasificacion_riesgo': 'Alto'}
+    db.save_consulta(adulto, 1, consulta, 'adulto', detalle)
+    db.create_hce_comun(nino, 1, '2024-04-10 10:00:00', 'Soplo', 110, 95, 60, 99.0, '')
+
+
+def test_exportar_y_consultar_parquet(temp_db, tmp_path):
+    _poblar(temp_db)
+    destino = str(tmp_path / 'analytics')
+
+    resumen = analitica.exportar_parquet(destino)
+    assert resumen == {'pacientes': 2, 'citas': 5, 'hce_comun': 2, 'hce_adulto': 1}
+    assert sorted(os.listdir(os.path.join(destino, 'citas'))) == ['mes=2024-03', 'mes=2024-04']
+    assert analitica.fecha_snapshot(destino) is not None
+
+    tendencia = analitica.tendencia_mensual_citas(destino=destino)
+    assert {'mes': '2024-04', 'estado': 'No-show', 'total': 1} in tendencia
+    assert all(f['estado'] != 'Cancelada' for f in tendencia)
+    assert analitica.tendencia_mensual_citas(desde='2024-04-01', destino=destino) == [
+        {'mes': '2024-04', 'estado': 'No-show', 'total': 1}]
+
+    por_dia = {f['dia']: f for f in analitica.noshows_por_dia_semana(destino=destino)}
+    # La cancelada del lunes no cuenta
+    assert por_dia['Lunes']['total_citas'] == 2 and por_dia['Lunes']['tasa_noshow'] == 50.0
+    assert por_dia['Martes']['noshows'] == 1  # 2024-04-02 también es martes
+
+    assert analitica.distribucion_riesgo(destino=destino) == [
+        {'clasificacion_riesgo': 'Alto', 'total': 1, 'score_medio': 12.0}]
+
+    vitales = {f['banda_edad']: f for f in analitica.signos_vitales_por_edad(destino=destino)}
+    assert vitales['60-74']['ta_sistolica'] == 140.0
+    assert vitales['1-4']['fc'] == 110.0
+
+
+def test_exportacion_incremental_reemplaza_solo_meses_nuevos(temp_db, tmp_path):
+    _poblar(temp_db)
+    destino = str(tmp_path / 'analytics')
+    analitica.exportar_parquet(destino)
+
+    paciente_id = temp_db.create_paciente('Nuevo', '1990-01-01', False, '555', '')
+    temp_db.create_cita(paciente_id, 1, '2024-04-20 09:00:00')
+    resumen = analitica.exportar_parquet(destino, desde='2024-04-15')
+
+    assert resumen['citas'] == 2  # todo abril, no solo desde el 15
+    totales = {(f['mes'], f['estado']): f['total'] for f in analitica.tendencia_mensual_citas(destino=destino)}
+    assert totales[('2024-03', 'Completada')] == 2
+    assert totales[('2024-04', 'Pendiente')] == 1
+
+
+def test_snapshot_sin_datos(temp_db, tmp_path):
+    destino = str(tmp_path / 'analytics')
+    assert analitica.fecha_snapshot(destino) is None
+
+    analitica.exportar_parquet(destino)
+    assert analitica.tendencia_mensual_citas(destino=destino) == []
+    assert analitica.distribucion_riesgo(destino=destino) == []
+
+
+def test_exportacion_fallida_conserva_el_snapshot_anterior(temp_db, tmp_path, monkeypatch):
+    _poblar(temp_db)
+    destino = str(tmp_path / 'export' / 'analytics')
+    analitica.exportar_parquet(destino)
+    anterior = analitica.fecha_snapshot(destino)
+
+    iter_hce = temp_db.iter_hce
+
+    def falla(*args, **kwargs):
+        raise RuntimeError("disco lleno")
+        yield
+    monkeypatch.setattr(temp_db, 'iter_hce', falla)
+    with pytest.raises(RuntimeError):
+        analitica.exportar_parquet(destino)
+    assert analitica.fecha_snapshot(destino) == anterior
+    assert {'mes': '2024-04', 'estado': 'No-show', 'total': 1} in analitica.tendencia_mensual_citas(destino=destino)
+    assert os.listdir(tmp_path / 'export') == ['analytics']  # sin directorios temporales
+
+    # Desde la interfaz corre en segundo plano y deja el resultado en estado_exportacion
+    monkeypatch.setattr(temp_db, 'iter_hce', iter_hce)
+    assert analitica.exportar_en_segundo_plano(destino)
+    limite = time.monotonic() + 30
+    while analitica.estado_exportacion()['en_curso'] and time.monotonic() < limite:
+        time.sleep(0.05)
+    estado = analitica.estado_exportacion()
+    assert not estado['en_curso'] and estado['error'] is None and estado['resumen']['citas'] == 5
+    assert sorted(os.listdir(tmp_path / 'export')) == ['analytics']
@@ -0,0 +1,40 @@
+import os
+import re
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Presupuesto de tiempo de import de la pantalla de login (arranque en frío).
+# Streamlit solo ya se lleva ~0.5 s; se puede ajustar para máquinas lentas.
+PRESUPUESTO_TOTAL_MS = float(os.environ.get('CLINICA_IMPORT_BUDGET_MS', 1500))
+# Lo que importa el propio proyecto (database, backends, metricas) sobre Streamlit
+PRESUPUESTO_PROPIO_MS = 150
+
+# Dependencias de las páginas que el login no debe cargar
+PESADOS = ('pandas', 'plotly.express', 'reportlab', 'psycopg', 'pyarrow', 'modules')
+
+
+def test_arranque_en_frio_del_login(tmp_path):
+    # app.py en modo "bare" (sin servidor): renderiza el login y termina
+    resultado = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(RAIZ, 'app.py')],
+                               cwd=tmp_path, capture_output=True, text=True, timeout=120,
+                               env={**os.environ, 'PYTHONPATH': RAIZ})
+    assert resultado.returncode == 0, resultado.stderr[-2000:]
+
+    propios = ('database', 'backends', 'metricas')
+    total_us = propio_us = 0
+    importados = set()
+    for linea in resultado.stderr.splitlines():
+        m = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|\s*(\S+)', linea)
+        if not m:
+            continue
+        total_us += int(m.group(1))
+        importados.add(m.group(3))
+        if m.group(3) in propios:
+            propio_us += int(m.group(1))
+
+    cargados = sorted(mod for mod in importados if mod.split('.')[0] in PESADOS or mod in PESADOS)
+    assert not cargados, f"El login importa dependencias de otras páginas: {cargados[:10]}"
+    assert propio_us / 1000 <= PRESUPUESTO_PROPIO_MS
+    assert total_us / 1000 <= PRESUPUESTO_TOTAL_MS, f"Arranque del login: {total_us / 1000:.0f} ms"
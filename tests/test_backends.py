@@ -0,0 +1,28 @@
+import backends
+import database as db
+
+
+def test_traduce_placeholders_fuera_de_literales():
+    sql = "SELECT * FROM citas WHERE estado = 'En ?' AND medico_id = ? AND nota LIKE '10%'"
+    assert backends._traducir(sql) == \
+        "SELECT * FROM citas WHERE estado = 'En ?' AND medico_id = %s AND nota LIKE '10%%'"
+
+
+def test_fila_por_indice_y_nombre():
+    fila = backends.Fila((3, 'Completada'), {'total': 0, 'estado': 1})
+    total, estado = fila
+    assert (total, estado) == (3, 'Completada')
+    assert fila['estado'] == 'Completada' and fila[0] == 3
+    assert dict(fila) == {'total': 3, 'estado': 'Completada'}
+
+
+def test_configurar_backend_desde_secrets(monkeypatch):
+    monkeypatch.setattr(db, 'DB_BACKEND', 'sqlite')
+    monkeypatch.setattr(db, 'DB_DSN', None)
+    db.configurar_backend(backend='postgres', host='db.local', port='5432', database='clinica',
+                          user='app', password='secreto')
+    assert db.DB_BACKEND == 'postgres'
+    assert db.DB_DSN == 'host=db.local port=5432 dbname=clinica user=app password=secreto'
+
+    db.configurar_backend(backend='postgres', dsn='postgresql://app@db.local/clinica')
+    assert db.DB_DSN == 'postgresql://app@db.local/clinica'
@@ -0,0 +1,663 @@
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import pytest
+
+
+@pytest.mark.solo_sqlite
+def test_pool_reutiliza_conexiones(temp_db):
+    with temp_db.db_connection() as conn1:
+        pass
+    with temp_db.db_connection() as conn2:
+        pass
+    assert conn1 is conn2
+
+
+@pytest.mark.solo_sqlite
+def test_pragmas_aplicados(temp_db):
+    with temp_db.db_connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+        # NORMAL = 1
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+
+
+def test_rollback_en_error(temp_db):
+    try:
+        with temp_db.db_connection() as conn:
+            conn.execute("INSERT INTO medicos (nombre) VALUES ('Dr. Rollback')")
+            raise RuntimeError("fallo simulado")
+    except RuntimeError:
+        pass
+    assert temp_db.get_all_medicos() == []
+
+
+@pytest.mark.solo_sqlite
+def test_pool_acotado_con_hilos(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    errores = []
+
+    def trabajo():
+        try:
+            for _ in range(20):
+                assert temp_db.get_paciente(paciente_id)['nombre'] == 'Ana Pérez'
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=trabajo) for _ in range(16)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert not errores
+    assert temp_db._get_pool()._idle.qsize() <= temp_db.POOL_SIZE
+
+
+def test_crud_basico(temp_db):
+    assert temp_db.create_medico_con_usuario('Dr. House', 'Cardiología', 'h@x.com', 'house', 'pw')
+    # Usuario duplicado
+    assert not temp_db.create_medico_con_usuario('Dr. House', 'Cardiología', 'h@x.com', 'house', 'pw')
+    login = temp_db.verify_login('house', 'pw')
+    assert login['rol'] == 'medico' and login['medico_id']
+
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    temp_db.create_cita(paciente_id, login['medico_id'], '2024-03-05 10:00:00')
+    citas = temp_db.get_citas_by_medico_fecha(login['medico_id'], '2024-03-05')
+    assert [c['paciente_nombre'] for c in citas] == ['Ana Pérez']
+
+
+@pytest.mark.solo_sqlite
+def test_migraciones_fijan_version(temp_db):
+    assert temp_db.get_schema_version() == temp_db.SCHEMA_VERSION
+    with temp_db.db_connection() as conn:
+        indices = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert {'idx_citas_medico_fecha', 'idx_hce_comun_paciente_fecha',
+            'idx_indicaciones_hce', 'idx_recetas_hce'} <= indices
+
+
+def test_init_db_no_consulta_tras_primera_vez(temp_db, monkeypatch):
+    def falla():
+        raise AssertionError("init_db no debería abrir conexiones")
+    monkeypatch.setattr(temp_db, 'db_connection', falla)
+    temp_db.init_db()
+
+
+def test_migra_db_antigua(tmp_path, monkeypatch):
+    import database as db
+
+    ruta = str(tmp_path / 'antigua.db')
+    conn = sqlite3.connect(ruta)
+    # Esquema previo a las columnas de examen físico, sin user_version
+    conn.execute("CREATE TABLE hce_comun (id INTEGER PRIMARY KEY AUTOINCREMENT, paciente_id INTEGER, "
+                 "medico_id INTEGER, cita_id INTEGER, fecha_consulta TEXT, motivo_consulta TEXT, "
+                 "fc INTEGER, ta_sistolica INTEGER, ta_diastolica INTEGER, sato2 REAL, observaciones TEXT)")
+    conn.execute("INSERT INTO hce_comun (paciente_id, motivo_consulta) VALUES (1, 'Control')")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, 'DB_NAME', ruta)
+    db.init_db()
+    try:
+        assert db.get_schema_version() == db.SCHEMA_VERSION
+        historial = db.get_hce_by_paciente(1)
+        assert historial[0]['motivo_consulta'] == 'Control'
+        assert 'ecg_hallazgos' in historial[0]
+    finally:
+        db.close_pool()
+
+
+def _planes_de_consultas(db, funcion, *args, **kwargs):
+    """Ejecuta la función capturando su SQL y retorna el EXPLAIN QUERY PLAN de cada SELECT."""
+    sentencias = []
+    with db.db_connection() as conn:
+        conn.set_trace_callback(sentencias.append)
+    try:
+        funcion(*args, **kwargs)
+    finally:
+        with db.db_connection() as conn:
+            conn.set_trace_callback(None)
+    planes = []
+    with db.db_connection() as conn:
+        for sql in sentencias:
+            if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                filas = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+                planes.append(' | '.join(fila[3] for fila in filas))
+    assert planes, "la función no ejecutó ningún SELECT"
+    return planes
+
+
+@pytest.mark.solo_sqlite
+def test_citas_por_dia_usan_indice(temp_db):
+    for plan in _planes_de_consultas(temp_db, temp_db.get_citas_by_medico_fecha, 1, '2024-03-05'):
+        assert 'USING INDEX idx_citas_medico_fecha' in plan, plan
+        assert 'SCAN c' not in plan, plan
+
+
+@pytest.mark.solo_sqlite
+def test_noshow_stats_usan_indice(temp_db):
+    # Las estadísticas leen el resumen diario, nunca escanean citas
+    for plan in _planes_de_consultas(temp_db, temp_db.get_noshow_stats, 1, '2024-03-01', '2024-03-31'):
+        assert 'SEARCH citas_resumen_diario USING PRIMARY KEY' in plan, plan
+    for plan in _planes_de_consultas(temp_db, temp_db.get_noshow_stats, None, '2024-03-01', '2024-03-31'):
+        assert 'USING INDEX idx_resumen_dia' in plan, plan
+        assert 'citas ' not in plan + ' ', plan
+
+
+def test_rango_de_fechas_inclusivo(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    for fecha_hora in ['2024-02-29 23:59:59', '2024-03-01 00:00:00', '2024-03-31 23:30:00', '2024-04-01 00:00:00']:
+        temp_db.create_cita(paciente_id, 1, fecha_hora)
+    assert temp_db.get_noshow_stats(1, '2024-03-01', '2024-03-31')['total_citas'] == 2
+    assert len(temp_db.get_citas_by_medico_fecha(1, '2024-03-31')) == 1
+
+
+def _consulta_ejemplo():
+    return {
+        'fecha_consulta': '2024-03-05 10:00:00', 'motivo_consulta': 'Control',
+        'diagnostico': 'HTA grado I', 'fc': 80, 'ta_sistolica': 140, 'ta_diastolica': 90,
+        'sato2': 98.0, 'observaciones': ''
+    }
+
+
+def _detalle_adulto():
+    return {
+        'tiene_hta': True, 'tiene_diabetes': False, 'tabaquismo': 'No',
+        'colesterol_total': 200.0, 'colesterol_hdl': 50.0, 'riesgo_cardiovascular_score': 4.2,
+        'riesgo_cardiovascular_framingham': 4.2, 'clasificacion_riesgo': 'Bajo'
+    }
+
+
+def test_save_consulta_completa(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    recetas = [{'medicamento': f'Med {i}', 'dosis': '1 tab', 'frecuencia': 'Diaria',
+                'duracion': '30 días', 'indicaciones_adicionales': ''} for i in range(12)]
+    examenes = [{'tipo_examen': 'Perfil Lipídico', 'indicacion': 'Ayunas'}]
+
+    ids = temp_db.save_consulta(paciente_id, 1, _consulta_ejemplo(), 'adulto', _detalle_adulto(),
+                                examenes, recetas, sexo='Femenino')
+
+    assert len(ids['recetas_ids']) == 12 and len(ids['examenes_ids']) == 1
+    assert ids['hce_detalle_id']
+    assert [r['id'] for r in temp_db.get_recetas_by_hce(ids['hce_comun_id'])] == ids['recetas_ids']
+    assert temp_db.get_paciente(paciente_id)['sexo'] == 'Femenino'
+
+
+def test_save_consulta_es_atomica(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    recetas = [{'medicamento': 'Med', 'dosis': '1 tab'}]  # faltan claves: falla a mitad
+
+    try:
+        temp_db.save_consulta(paciente_id, 1, _consulta_ejemplo(), 'adulto', _detalle_adulto(), [], recetas)
+    except KeyError:
+        pass
+
+    assert temp_db.get_hce_by_paciente(paciente_id) == []
+    with temp_db.db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM hce_adulto").fetchone()[0] == 0
+
+
+def test_stats_por_medico_en_una_consulta(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    for medico_id in (1, 2, 3):
+        for hora in ('09:00', '10:00'):
+            temp_db.create_cita(paciente_id, medico_id, f'2024-03-05 {hora}:00')
+    cita_id = temp_db.create_cita(paciente_id, 2, '2024-03-06 09:00:00')
+    temp_db.update_estado_cita(cita_id, 'No-show')
+
+    if temp_db.DB_BACKEND == 'sqlite':
+        planes = _planes_de_consultas(temp_db, temp_db.get_citas_stats_por_medico,
+                                      '2024-03-01', '2024-03-31', medico_ids=[1, 2, 3, 4])
+        assert len(planes) == 1
+
+    stats = temp_db.get_citas_stats_por_medico('2024-03-01', '2024-03-31', medico_ids=[1, 2, 3, 4])
+    for medico_id in (1, 2, 3):
+        esperado = temp_db.get_noshow_stats(medico_id, '2024-03-01', '2024-03-31')
+        assert stats[medico_id] == esperado
+    assert stats[2]['total_noshows'] == 1
+    assert stats[4]['total_citas'] == 0
+
+
+def test_resumen_diario_sigue_a_las_citas(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    c1 = temp_db.create_cita(paciente_id, 1, '2024-03-05 09:00:00')
+    c2 = temp_db.create_cita(paciente_id, 1, '2024-03-05 10:00:00')
+    temp_db.update_estado_cita(c1, 'Completada')
+    temp_db.update_estado_cita(c2, 'No-show')
+    with temp_db.db_connection() as conn:
+        conn.execute("UPDATE citas SET fecha_hora = '2024-03-07 10:00:00' WHERE id = ?", (c2,))
+        conn.execute("DELETE FROM citas WHERE id = ?", (c1,))
+
+    assert temp_db.verificar_resumen_diario() == []
+    assert temp_db.get_noshow_stats(1, '2024-03-05', '2024-03-05')['total_citas'] == 0
+    assert temp_db.get_noshow_stats(1, '2024-03-01', '2024-03-31')['total_noshows'] == 1
+
+
+def test_verificar_resumen_detecta_y_repara(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    temp_db.create_cita(paciente_id, 1, '2024-03-05 09:00:00')
+    with temp_db.db_connection() as conn:
+        conn.execute("UPDATE citas_resumen_diario SET total = 7")
+
+    diferencias = temp_db.verificar_resumen_diario(reparar=True)
+    assert diferencias == [{'medico_id': 1, 'dia': '2024-03-05', 'estado': 'Pendiente', 'esperado': 1, 'actual': 7}]
+    assert temp_db.verificar_resumen_diario() == []
+
+
+def test_busqueda_pacientes_sin_acentos_y_prefijo(temp_db):
+    perez = temp_db.create_paciente('Juan Pérez García', '1980-01-01', False, '555-1234', '')
+    temp_db.create_paciente('María Núñez', '2015-05-01', True, '555-9876', 'Pedro Núñez')
+    temp_db.create_paciente('Pedro Gómez', '1975-01-01', False, '555-0000', '')
+
+    assert [p['id'] for p in temp_db.search_pacientes('perez')] == [perez]
+    assert [p['nombre'] for p in temp_db.search_pacientes('jua garc')] == ['Juan Pérez García']
+    assert [p['nombre'] for p in temp_db.search_pacientes('nunez')] == ['María Núñez']
+    # El nombre pesa más que el tutor legal
+    assert [p['nombre'] for p in temp_db.search_pacientes('pedro')] == ['Pedro Gómez', 'María Núñez']
+    assert temp_db.search_pacientes('"') == []
+
+
+def test_busqueda_pacientes_id_exacto_y_limite(temp_db):
+    ids = [temp_db.create_paciente(f'Paciente {i}', '1980-01-01', False, '555', '') for i in range(1, 13)]
+    assert temp_db.search_pacientes(str(ids[2]))[0]['id'] == ids[2]
+    assert len(temp_db.search_pacientes('paciente', limit=5)) == 5
+
+
+def test_busqueda_sigue_ediciones(temp_db):
+    paciente_id = temp_db.create_paciente('Potencial', '1900-01-01', False, '555', '')
+    with temp_db.db_connection() as conn:
+        conn.execute("UPDATE pacientes SET nombre = 'Lucía Fernández' WHERE id = ?", (paciente_id,))
+    assert temp_db.search_pacientes('potencial') == []
+    assert temp_db.search_pacientes('lucia')[0]['id'] == paciente_id
+
+
+def test_busqueda_clinica_con_fragmento_y_filtros(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    h1 = temp_db.create_hce_comun(paciente_id, 1, '2024-01-10 10:00:00', 'Palpitaciones', 90, 130, 85, 97.0,
+                                  'Refiere episodios nocturnos', diagnostico='Fibrilación auricular paroxística')
+    h2 = temp_db.create_hce_comun(paciente_id, 2, '2024-03-05 10:00:00', 'Control', 70, 120, 80, 98.0, '',
+                                  ef_cardio='Soplo sistólico II/VI en foco mitral')
+
+    resultados = temp_db.search_hce('fibrilacion auricular')
+    assert [r['id'] for r in resultados] == [h1]
+    assert '**Fibrilación**' in resultados[0]['fragmento']
+    assert resultados[0]['paciente_nombre'] == 'Ana Pérez'
+
+    assert [r['id'] for r in temp_db.search_hce('soplo sist')] == [h2]
+    assert temp_db.search_hce('soplo', medico_id=1) == []
+    assert temp_db.search_hce('soplo', fecha_fin='2024-03-04') == []
+    assert [r['id'] for r in temp_db.search_hce('soplo', fecha_inicio='2024-03-05', fecha_fin='2024-03-05')] == [h2]
+
+
+def test_list_pacientes_keyset(temp_db):
+    nombres = ['Ana', 'Ana', 'Beatriz', 'Carlos', 'Daniel', 'Elena', 'Fabián']
+    for nombre in nombres:
+        temp_db.create_paciente(nombre, '1980-01-01', False, '555', '')
+
+    vistos = []
+    pagina = temp_db.list_pacientes(limit=3)
+    while pagina:
+        vistos.extend(pagina)
+        ultimo = pagina[-1]
+        pagina = temp_db.list_pacientes(ultimo['nombre'], ultimo['id'], limit=3)
+
+    assert [p['nombre'] for p in vistos] == sorted(nombres)
+    assert len({p['id'] for p in vistos}) == len(nombres)
+
+    if temp_db.DB_BACKEND != 'sqlite':
+        return
+    for plan in _planes_de_consultas(temp_db, temp_db.list_pacientes, 'Ana', 2, 3):
+        assert 'SEARCH pacientes USING INDEX idx_pacientes_nombre' in plan and 'TEMP B-TREE' not in plan, plan
+
+
+def test_resumen_clinica(temp_db):
+    from datetime import datetime
+
+    temp_db.create_medico_con_usuario('Dr. House', 'Cardiología', 'h@x.com', 'house', 'pw')
+    adulto = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    temp_db.create_paciente('Leo Pérez', '2018-01-01', True, '555', 'Ana Pérez')
+    temp_db.create_cita(adulto, 1, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    temp_db.create_cita(adulto, 1, '2000-01-01 10:00:00')
+
+    assert temp_db.get_resumen_clinica() == {
+        'total_pacientes': 2, 'pediatricos': 1, 'adultos': 1, 'medicos_activos': 1, 'citas_hoy': 1
+    }
+    if temp_db.DB_BACKEND == 'sqlite':
+        assert len(_planes_de_consultas(temp_db, temp_db.get_resumen_clinica)) == 1
+
+
+def test_cache_de_medicos_e_invalidacion(temp_db):
+    temp_db.create_medico_con_usuario('Dr. House', 'Cardiología', 'h@x.com', 'house', 'pw')
+    inicial = temp_db.get_cache_stats()
+
+    primera = temp_db.get_all_medicos()
+    primera[0]['nombre'] = 'modificado por la página'
+    segunda = temp_db.get_all_medicos()
+    stats = temp_db.get_cache_stats()
+    assert segunda[0]['nombre'] == 'Dr. House'
+    assert stats['hits'] == inicial['hits'] + 1 and stats['misses'] == inicial['misses'] + 1
+
+    # La escritura invalida la caché sin esperar al TTL
+    temp_db.create_medico_con_usuario('Dra. Quinn', 'Pediatría', 'q@x.com', 'quinn', 'pw')
+    assert [m['nombre'] for m in temp_db.get_all_medicos()] == ['Dr. House', 'Dra. Quinn']
+    assert temp_db.verify_login('quinn', 'pw')['medico_id'] == 2
+
+
+def test_cache_expira_por_ttl(temp_db, monkeypatch):
+    temp_db.create_medico_con_usuario('Dr. House', 'Cardiología', 'h@x.com', 'house', 'pw')
+    temp_db.get_medico(1)
+    with temp_db.db_connection() as conn:
+        conn.execute("UPDATE medicos SET nombre = 'Dr. Gregory House' WHERE id = 1")
+    assert temp_db.get_medico(1)['nombre'] == 'Dr. House'
+
+    ahora = temp_db.time.monotonic()
+    monkeypatch.setattr(temp_db.time, 'monotonic', lambda: ahora + temp_db.CACHE_TTL + 1)
+    assert temp_db.get_medico(1)['nombre'] == 'Dr. Gregory House'
+
+
+def test_historia_completa_consultas_fijas(temp_db):
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    receta = {'medicamento': 'Losartán', 'dosis': '50mg', 'frecuencia': 'Diaria', 'duracion': '30 días',
+              'indicaciones_adicionales': ''}
+    for dia in range(1, 6):
+        consulta = dict(_consulta_ejemplo(), fecha_consulta=f'2024-03-0{dia} 10:00:00')
+        temp_db.save_consulta(paciente_id, 1, consulta, 'adulto', _detalle_adulto(),
+                              [{'tipo_examen': 'ECG', 'indicacion': ''}], [receta] * dia)
+    # Consulta de triaje sin detalle ni recetas
+    temp_db.create_hce_comun(paciente_id, 1, '2024-03-09 10:00:00', 'Triaje', 80, 120, 80, 98.0, '')
+
+    historia = temp_db.get_historia_completa(paciente_id)
+    assert [h['fecha_consulta'][:10] for h in historia][:2] == ['2024-03-09', '2024-03-05']
+    assert historia[0]['detalle_adulto'] is None and historia[0]['recetas'] == []
+    assert historia[1]['detalle_adulto']['clasificacion_riesgo'] == 'Bajo'
+    assert len(historia[1]['recetas']) == 5 and len(historia[1]['indicaciones']) == 1
+
+    if temp_db.DB_BACKEND == 'sqlite':
+        assert len(_planes_de_consultas(temp_db, temp_db.get_historia_completa, paciente_id)) == 5
+
+
+def test_iteradores_en_lotes_y_csv(temp_db):
+    import csv
+    import io
+
+    paciente_id = temp_db.create_paciente('Ana Pérez', '1980-01-01', False, '555', '')
+    for dia in range(1, 11):
+        temp_db.create_cita(paciente_id, 1, f'2024-03-{dia:02d} 10:00:00')
+
+    citas = list(temp_db.iter_citas('2024-03-03', '2024-03-07', batch_size=2))
+    assert [c['fecha_hora'][:10] for c in citas] == [f'2024-03-{d:02d}' for d in range(3, 8)]
+    assert len(list(temp_db.iter_citas(batch_size=3))) == 10
+
+    # Cortar la iteración devuelve la conexión al pool
+    generador = temp_db.iter_pacientes(batch_size=1)
+    next(generador)
+    generador.close()
+    if temp_db.DB_BACKEND == 'sqlite':
+        assert temp_db._get_pool()._idle.qsize() == 1
+
+    salida = io.StringIO()
+    assert temp_db.exportar_csv(temp_db.iter_citas(), salida) == 10
+    filas = list(csv.DictReader(io.StringIO(salida.getvalue())))
+    assert filas[0]['fecha_hora'] == '2024-03-01 10:00:00'
+
+
+@pytest.mark.solo_sqlite
+def test_snapshot_de_reportes(temp_db, monkeypatch):
+    monkeypatch.setattr(temp_db, 'SNAPSHOT_INTERVAL', 60)
+    reloj = [1000.0]
+    monkeypatch.setattr(temp_db.time, 'monotonic', lambda: reloj[0])
+    paciente_id = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    hoy = date.today().strftime('%Y-%m-%d')
+    temp_db.create_cita(paciente_id, 1, f'{hoy} 09:00:00')
+
+    assert temp_db.get_resumen_clinica()['citas_hoy'] == 1
+    assert temp_db.get_snapshot_info()['antiguedad_s'] == 0
+
+    # Las escrituras nuevas no se ven hasta que vence el intervalo
+    temp_db.create_cita(paciente_id, 1, f'{hoy} 10:00:00')
+    reloj[0] += 30
+    assert temp_db.get_resumen_clinica()['citas_hoy'] == 1
+    assert temp_db.get_snapshot_info()['antiguedad_s'] == 30
+
+    reloj[0] += 30
+    assert temp_db.get_noshow_stats(1, hoy, hoy)['total_citas'] == 2
+
+    # El snapshot es de solo lectura
+    with temp_db.snapshot_connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM citas")
+
+
+@pytest.mark.solo_sqlite
+def test_snapshot_no_bloquea_escrituras(temp_db, monkeypatch):
+    monkeypatch.setattr(temp_db, 'SNAPSHOT_INTERVAL', 60)
+    paciente_id = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    # Mientras un reporte tiene el snapshot abierto, las escrituras siguen sin esperar
+    with temp_db.snapshot_connection() as conn:
+        conn.execute("SELECT COUNT(*) FROM citas").fetchone()
+        inicio = time.perf_counter()
+        temp_db.create_cita(paciente_id, 1, '2024-01-01 09:00:00')
+        assert time.perf_counter() - inicio < 1
+
+
+@pytest.mark.solo_sqlite
+def test_snapshot_con_lectores_concurrentes(temp_db, monkeypatch):
+    monkeypatch.setattr(temp_db, 'SNAPSHOT_INTERVAL', 60)
+    snapshot = temp_db._get_snapshot()
+    copiar = snapshot._copiar
+    copiando = threading.Event()
+
+    def copiar_lento():
+        copiando.set()
+        time.sleep(0.2)
+        copiar()
+    monkeypatch.setattr(snapshot, '_copiar', copiar_lento)
+
+    # Primer acceso: quien llega mientras otro hilo copia espera la copia, no recibe None
+    leidos, errores = [], []
+    def leer():
+        try:
+            with temp_db.snapshot_connection() as conn:
+                leidos.append(conn.execute("SELECT count(*) FROM citas").fetchone()[0])
+        except Exception as e:
+            errores.append(e)
+    primero = threading.Thread(target=leer)
+    primero.start()
+    copiando.wait()
+    segundo = threading.Thread(target=leer)
+    segundo.start()
+    primero.join(), segundo.join()
+    assert (leidos, errores) == ([0, 0], [])
+
+    # Dos lectores a la vez; un refresco no cierra la copia que todavía se usa
+    barrera = threading.Barrier(2, timeout=5)
+    def leer_a_la_vez():
+        with temp_db.snapshot_connection() as conn:
+            barrera.wait()
+            conn.execute("SELECT 1").fetchone()
+    otro = threading.Thread(target=leer_a_la_vez)
+    otro.start()
+    with temp_db.snapshot_connection() as conn:
+        barrera.wait()
+        temp_db.refresh_snapshot()
+        assert conn.execute("SELECT count(*) FROM citas").fetchone()[0] == 0
+    otro.join()
+    assert not snapshot._lectores
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute("SELECT 1")
+
+
+def test_cola_escritura_agrupa_commits_y_aisla_errores(temp_db, monkeypatch):
+    monkeypatch.setattr(temp_db, 'WRITE_QUEUE_ENABLED', True)
+    paciente_id = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    cola = temp_db._get_write_queue()
+    commits_previos = cola.commits
+
+    # Un trabajo lento retiene al escritor mientras se encolan los demás
+    empezo, seguir = threading.Event(), threading.Event()
+    lento = cola.submit(lambda cursor: (empezo.set(), seguir.wait(5)))
+    assert empezo.wait(5)
+
+    def insertar(hora):
+        def trabajo(cursor):
+            cursor.execute("INSERT INTO citas (paciente_id, medico_id, fecha_hora) VALUES (?, 1, ?)",
+                           (paciente_id, f'2024-03-05 {hora}:00:00'))
+            return cursor.lastrowid
+        return trabajo
+
+    def falla(cursor):
+        cursor.execute("INSERT INTO citas (paciente_id, medico_id, fecha_hora) VALUES (?, 1, '2024-03-05 15:00:00')",
+                       (paciente_id,))
+        raise ValueError("trabajo inválido")
+
+    futuros = [cola.submit(insertar(h)) for h in (10, 11, 12)]
+    fallido = cola.submit(falla)
+    futuros.append(cola.submit(insertar(13)))
+    seguir.set()
+
+    lento.result(5)
+    ids = [f.result(5) for f in futuros]
+    with pytest.raises(ValueError):
+        fallido.result(5)
+
+    assert len(set(ids)) == 4
+    # El trabajo fallido se deshizo sin afectar a los demás del mismo commit
+    horas = [c['fecha_hora'][11:13] for c in temp_db.get_citas_by_medico_fecha(1, '2024-03-05')]
+    assert horas == ['10', '11', '12', '13']
+    assert cola.commits - commits_previos == 2
+
+
+def test_cola_escritura_50_escritores_concurrentes(temp_db, monkeypatch):
+    monkeypatch.setattr(temp_db, 'WRITE_QUEUE_ENABLED', True)
+    paciente_id = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    errores = []
+
+    def escritor(medico_id):
+        try:
+            for minuto in range(10):
+                cita_id = temp_db.create_cita(paciente_id, medico_id, f'2024-03-05 09:{minuto:02d}:00')
+                temp_db.update_estado_cita(cita_id, 'Llegó')
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=escritor, args=(medico_id,)) for medico_id in range(1, 51)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert not errores
+    stats = temp_db.get_citas_stats_por_medico('2024-03-05', '2024-03-05')
+    assert len(stats) == 50
+    assert all(s['por_estado'] == {'Llegó': 10} for s in stats.values())
+    assert temp_db.get_write_queue_stats()['errores'] == 0
+
+
+def test_reservar_cita_detecta_solapamientos(temp_db):
+    paciente_id = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    cita_id = temp_db.reservar_cita(paciente_id, 1, '2024-03-05 10:00:00', 20)
+    assert cita_id is not None
+    # 10:05 pisa la cita de 10:00 aunque no coincida la hora exacta
+    assert temp_db.reservar_cita(paciente_id, 1, '2024-03-05 10:05:00', 20) is None
+    assert temp_db.reservar_cita(paciente_id, 1, '2024-03-05 09:45:00', 30) is None
+    assert [c['id'] for c in temp_db.get_citas_solapadas(1, '2024-03-05 09:50:00', 60)] == [cita_id]
+    # Intervalos semiabiertos: terminar o empezar justo en el borde no es conflicto
+    assert temp_db.reservar_cita(paciente_id, 1, '2024-03-05 10:20:00', 15) is not None
+    assert temp_db.reservar_cita(paciente_id, 1, '2024-03-05 09:40:00', 20) is not None
+    assert temp_db.reservar_cita(paciente_id, 2, '2024-03-05 10:05:00', 20) is not None
+    # Una cita en No-show libera el horario
+    temp_db.update_estado_cita(cita_id, 'No-show')
+    assert temp_db.reservar_cita(paciente_id, 1, '2024-03-05 10:00:00', 20) is not None
+
+    cita = temp_db.get_citas_by_medico_fecha(2, '2024-03-05')[0]
+    assert (cita['duracion_min'], cita['fecha_hora_fin']) == (20, '2024-03-05 10:25:00')
+    with pytest.raises(ValueError):
+        temp_db.reservar_cita(paciente_id, 1, '2024-03-06 10:00:00', temp_db.DURACION_MAXIMA + 1)
+
+
+@pytest.mark.solo_sqlite
+def test_solapamiento_usa_indice(temp_db):
+    for plan in _planes_de_consultas(temp_db, temp_db.get_citas_solapadas, 1, '2024-03-05 10:00:00', 30):
+        assert 'USING INDEX idx_citas_medico_fecha (medico_id=? AND fecha_hora>? AND fecha_hora<?)' in plan, plan
+
+
+@pytest.mark.solo_sqlite
+def test_ocupacion_en_indice_cubriente(temp_db):
+    for plan in _planes_de_consultas(temp_db, temp_db.get_citas_ocupadas, [1, 2], '2024-03-04', '2024-03-10'):
+        assert 'USING COVERING INDEX idx_citas_medico_fecha' in plan, plan
+
+
+@pytest.mark.solo_sqlite
+def test_conflictos_de_serie_en_una_consulta(temp_db):
+    fechas = [f'2024-{mes:02d}-04 09:00:00' for mes in range(1, 13)]
+    plan, = _planes_de_consultas(temp_db, temp_db.get_conflictos_ocurrencias, 1, fechas, 30)
+    assert 'SEARCH c USING COVERING INDEX idx_citas_medico_fecha (medico_id=? AND fecha_hora>? AND fecha_hora<?)' in plan, plan
+
+
+def test_calendario_semana_y_mes_en_una_consulta(temp_db):
+    ana = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    leo = temp_db.create_paciente('Leo', '1990-01-01', False, '555', '')
+    for medico_id, paciente_id, fecha_hora in [(1, ana, '2024-03-04 09:00:00'), (2, leo, '2024-03-04 09:00:00'),
+                                               (1, leo, '2024-03-10 17:40:00'), (1, ana, '2024-03-11 08:00:00'),
+                                               (3, ana, '2024-03-29 10:00:00')]:
+        temp_db.create_cita(paciente_id, medico_id, fecha_hora)
+    temp_db.update_estado_cita(1, 'No-show')
+
+    filas = temp_db.get_citas_rango('2024-03-04', '2024-03-10')
+    assert [(f[1], f[2][5:16], f[4], f[5]) for f in filas] == [
+        (1, '03-04 09:00', 'No-show', 'Ana'), (2, '03-04 09:00', 'Pendiente', 'Leo'),
+        (1, '03-10 17:40', 'Pendiente', 'Leo')]
+    assert dict(zip(temp_db.COLUMNAS_CALENDARIO, filas[0]))['fecha_hora_fin'] == '2024-03-04 09:20:00'
+    assert len(temp_db.get_citas_rango('2024-03-04', '2024-03-10', medico_id=1)) == 2
+
+    assert temp_db.get_citas_por_dia('2024-03-01', '2024-03-31') == {
+        '2024-03-04': {'No-show': 1, 'Pendiente': 1}, '2024-03-10': {'Pendiente': 1},
+        '2024-03-11': {'Pendiente': 1}, '2024-03-29': {'Pendiente': 1}}
+    assert temp_db.get_citas_por_dia('2024-03-01', '2024-03-31', medico_id=3) == {'2024-03-29': {'Pendiente': 1}}
+
+
+def test_migracion_completa_fin_de_citas_existentes(temp_db):
+    paciente_id = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    with temp_db.db_connection() as conn:
+        conn.execute("INSERT INTO citas (paciente_id, medico_id, fecha_hora) VALUES (?, 1, '2024-03-05 23:50:00')",
+                     (paciente_id,))
+    with temp_db.db_connection() as conn:
+        migracion = temp_db.MIGRACIONES_POSTGRES[9] if temp_db._es_postgres() else temp_db._migracion_duracion_citas
+        migracion(conn.cursor())
+    cita = temp_db.get_citas_by_medico_fecha(1, '2024-03-05')[0]
+    assert (cita['duracion_min'], cita['fecha_hora_fin']) == (temp_db.DURACION_CITA, '2024-03-06 00:10:00')
+
+
+@pytest.mark.parametrize('cola', [False, True], ids=['directo', 'cola'])
+def test_reservas_concurrentes_sin_doble_turno(temp_db, monkeypatch, cola):
+    monkeypatch.setattr(temp_db, 'WRITE_QUEUE_ENABLED', cola)
+    paciente_id = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    # 12 recepcionistas piden, en distinto orden, turnos de 20 min cada 5 min
+    inicios = [f'2024-03-05 {9 + m // 60:02d}:{m % 60:02d}:00' for m in range(0, 120, 5)]
+    reservadas, errores = [], []
+    largada = threading.Barrier(12)
+
+    def recepcionista(n):
+        try:
+            largada.wait(5)
+            for fecha_hora in inicios[n % len(inicios):] + inicios[:n % len(inicios)]:
+                if temp_db.reservar_cita(paciente_id, 1, fecha_hora, 20) is not None:
+                    reservadas.append(fecha_hora)
+        except Exception as e:
+            errores.append(e)
+
+    hilos = [threading.Thread(target=recepcionista, args=(n * 2,)) for n in range(12)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert not errores
+    citas = temp_db.get_citas_by_medico_fecha(1, '2024-03-05')
+    assert sorted(c['fecha_hora'] for c in citas) == sorted(reservadas)
+    for anterior, siguiente in zip(citas, citas[1:]):
+        assert anterior['fecha_hora_fin'] <= siguiente['fecha_hora'], (anterior, siguiente)
+    # Sin solapamientos caben a lo sumo 6 turnos de 20 min en 2 horas
+    assert 0 < len(citas) <= 6
@@ -0,0 +1,50 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import datos_sinteticos
+
+TAMAÑOS = {'medicos': 3, 'pacientes': 60, 'citas': 400, 'consultas': 50}
+
+
+def _contenido(db):
+    with db.db_connection() as conn:
+        return {tabla: [tuple(fila) for fila in conn.execute(f"SELECT * FROM {tabla} ORDER BY id").fetchall()]
+                for tabla in ('medicos', 'pacientes', 'citas', 'hce_comun', 'hce_adulto', 'hce_infantil',
+                              'indicaciones_examenes', 'recetas_medicas')}
+
+
+def test_generador_consistente(temp_db):
+    creadas = datos_sinteticos.generar(**TAMAÑOS, lote=100)
+    assert creadas['pacientes'] == 60 and creadas['citas'] == 400 and creadas['hce_comun'] == 50
+    assert creadas['hce_adulto'] + creadas['hce_infantil'] == 50
+
+    contenido = _contenido(temp_db)
+    assert {k: len(v) for k, v in contenido.items() if k in creadas} == \
+        {k: creadas[k] for k in contenido if k in creadas}
+    # Las consultas salen de citas completadas del mismo paciente y médico
+    citas = {c[0]: c for c in contenido['citas']}
+    for hce in contenido['hce_comun']:
+        if hce[3] is not None:
+            cita = citas[hce[3]]
+            assert (cita[1], cita[2], cita[4]) == (hce[1], hce[2], 'Completada')
+    # Los triggers del resumen diario quedaron al día
+    assert temp_db.verificar_resumen_diario() == []
+    # Los médicos generados pueden iniciar sesión
+    medico_id = contenido['medicos'][0][0]
+    assert temp_db.verify_login(f"medico{medico_id}", f"medico{medico_id}")
+    # Con ids explícitos, los inserts normales siguen numerando después de los generados
+    assert temp_db.create_paciente('Nuevo', '2000-01-01', False, '555', '') == 61
+
+
+def test_generador_determinista(temp_db, tmp_path, monkeypatch):
+    datos_sinteticos.generar(**TAMAÑOS)
+    primero = _contenido(temp_db)
+    temp_db.close_pool()
+
+    monkeypatch.setattr(temp_db, 'DB_NAME', str(tmp_path / 'segunda.db'))
+    monkeypatch.setattr(temp_db, 'DB_BACKEND', 'sqlite')
+    temp_db.init_db()
+    datos_sinteticos.generar(**TAMAÑOS)
+    assert _contenido(temp_db) == primero
@@ -0,0 +1,69 @@
+from datetime import date, datetime
+
+import pytest
+
+import disponibilidad
+
+LUNES = date(2024, 3, 4)
+
+
+def _horas(turnos):
+    return [(t['medico_id'], t['fecha_hora'][5:16]) for t in turnos]
+
+
+def test_mapas_y_primeros_libres():
+    horarios = {1: disponibilidad.db.HORARIO_POR_DEFECTO, 2: ((0, '09:00', '10:00'),)}
+    ocupadas = [(1, '2024-03-04 08:00:00', '2024-03-04 08:40:00'),
+                (1, '2024-03-04 09:10:00', '2024-03-04 09:25:00'),  # no alineada: ocupa 09:00-09:40
+                (2, '2024-03-04 09:20:00', '2024-03-04 09:40:00'),
+                (3, '2024-03-04 08:00:00', '2024-03-04 18:00:00')]  # médico fuera de la búsqueda
+    mapas = disponibilidad.mapas_libres(horarios, ocupadas, LUNES, 7)
+    assert _horas(disponibilidad.primeros_libres(mapas, LUNES, 5, 20)) == [
+        (1, '03-04 08:40'), (2, '03-04 09:00'), (1, '03-04 09:40'), (2, '03-04 09:40'), (1, '03-04 10:00')]
+    # Después de las 17:31, el siguiente turno de 30 min cabe recién el martes
+    assert _horas(disponibilidad.primeros_libres(mapas, LUNES, 2, 30, paso_min=10,
+                                                 despues_de=datetime(2024, 3, 4, 17, 31))) == [
+        (1, '03-05 08:00'), (1, '03-05 08:10')]
+    # El fin de semana no hay horario
+    assert not disponibilidad.primeros_libres({1: mapas[1][5:]}, date(2024, 3, 9), 1, 20)
+
+
+def test_dentro_de_horario():
+    horario = ((0, '08:00', '12:00'), (0, '14:00', '15:00'))
+    assert disponibilidad.dentro_de_horario(horario, datetime(2024, 3, 4, 11, 40), 20)
+    assert disponibilidad.dentro_de_horario(horario, '2024-03-04 14:30:00', 30)
+    assert not disponibilidad.dentro_de_horario(horario, datetime(2024, 3, 4, 11, 50), 20)  # termina 12:10
+    assert not disponibilidad.dentro_de_horario(horario, '2024-03-05 09:00:00', 20)  # martes sin atención
+
+
+def test_cita_que_cruza_la_medianoche():
+    horarios = {1: tuple((dia, '00:00', '24:00') for dia in range(7))}
+    mapas = disponibilidad.mapas_libres(horarios, [(1, '2024-03-04 23:30:00', '2024-03-05 01:00:00')], LUNES, 2)
+    assert _horas(disponibilidad.primeros_libres(mapas, LUNES, 1, 60, despues_de=datetime(2024, 3, 4, 23, 0))) == [
+        (1, '03-05 01:00')]
+
+
+def test_proximos_libres_con_horario_y_citas(temp_db):
+    temp_db.create_medico_con_usuario('Dra. Uno', 'Cardiología', 'a@x', 'uno', 'x')
+    temp_db.create_medico_con_usuario('Dr. Dos', 'Cardiología', 'b@x', 'dos', 'x')
+    uno, dos = [m['id'] for m in temp_db.get_all_medicos()]
+    paciente_id = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    # Turno cortado los lunes; el resto de la semana sin atención
+    temp_db.set_horario_medico(uno, [(0, '08:00', '09:00'), (0, '14:00', '15:00')])
+    assert temp_db.get_horario_medico(uno) == ((0, '08:00', '09:00'), (0, '14:00', '15:00'))
+    assert temp_db.get_horario_medico(dos) == temp_db.HORARIO_POR_DEFECTO
+    for hora in ('08:00', '08:30'):
+        assert temp_db.reservar_cita(paciente_id, uno, f'2024-03-04 {hora}:00', 30)
+
+    turnos = disponibilidad.proximos_libres(3, 30, medico_id=uno, desde=datetime(2024, 3, 4, 7, 0))
+    assert _horas(turnos) == [(uno, '03-04 14:00'), (uno, '03-04 14:30'), (uno, '03-11 08:00')]
+    # Cada turno ofrecido se puede reservar
+    assert all(temp_db.reservar_cita(paciente_id, t['medico_id'], t['fecha_hora'], 30) for t in turnos)
+
+    cualquiera = disponibilidad.proximos_libres(2, 30, desde=datetime(2024, 3, 4, 7, 0))
+    assert _horas(cualquiera) == [(dos, '03-04 08:00'), (dos, '03-04 08:30')]
+
+    with pytest.raises(ValueError):
+        temp_db.set_horario_medico(uno, [(0, '08:00', '12:00'), (0, '11:00', '13:00')])
+    with pytest.raises(ValueError):
+        temp_db.set_horario_medico(uno, [(7, '08:00', '12:00')])
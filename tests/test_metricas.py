@@ -0,0 +1,80 @@
+import json
+import re
+import urllib.request
+
+import pytest
+
+import metricas
+
+
+@pytest.fixture
+def metricas_limpias(monkeypatch, tmp_path):
+    monkeypatch.setattr(metricas, 'SLOW_QUERY_LOG', str(tmp_path / 'lentas.log'))
+    metricas.reset()
+    yield metricas
+    metricas.fijar_pagina(None)
+    metricas.reset()
+
+
+def test_histograma_y_filas_por_funcion(temp_db, metricas_limpias):
+    temp_db.create_paciente('Ana Pérez', '1960-06-01', False, '555', '')
+    temp_db.create_paciente('Leo Pérez', '2020-01-01', True, '555', 'Ana Pérez')
+    assert len(temp_db.search_pacientes('Pérez')) == 2
+    assert len(list(temp_db.iter_pacientes(batch_size=1))) == 2
+
+    resumen = {r['funcion']: r for r in metricas.get_resumen_funciones()}
+    assert resumen['create_paciente']['llamadas'] == 2
+    assert resumen['search_pacientes']['filas'] == 2
+    assert resumen['iter_pacientes']['llamadas'] == 1 and resumen['iter_pacientes']['filas'] == 2
+
+    texto = metricas.exportar_openmetrics()
+    assert texto.endswith('# EOF\n')
+    assert 'clinica_db_call_duration_seconds_count{funcion="create_paciente"} 2' in texto
+    assert 'clinica_db_rows_total{funcion="search_pacientes"} 2' in texto
+    # Buckets acumulados y no decrecientes, terminando en el total
+    buckets = [int(n) for n in re.findall(r'_bucket\{funcion="create_paciente",le="[^"]+"\} (\d+)', texto)]
+    assert buckets == sorted(buckets) and buckets[-1] == 2
+
+
+def test_registro_de_lentas_sin_valores(temp_db, metricas_limpias, monkeypatch):
+    monkeypatch.setattr(metricas, 'SLOW_QUERY_MS', 0)
+    metricas.fijar_pagina('Agenda (Citas)')
+    temp_db.create_paciente('Nombre Confidencial', '1960-06-01', False, '555-9876', '')
+    temp_db.search_pacientes('Confidencial')
+
+    with open(metricas.SLOW_QUERY_LOG, encoding='utf-8') as f:
+        entradas = [json.loads(linea) for linea in f]
+    busqueda = [e for e in entradas if e['funcion'] == 'search_pacientes'][-1]
+    assert busqueda['pagina'] == 'Agenda (Citas)'
+    assert busqueda['filas'] == 1 and busqueda['duracion_ms'] >= 0
+    assert busqueda['sql'] and all('?' in s for s in busqueda['sql'])
+    contenido = json.dumps(entradas, ensure_ascii=False)
+    assert 'Confidencial' not in contenido and '555-9876' not in contenido
+    assert metricas.get_consultas_lentas()[0]['funcion'] == 'search_pacientes'
+
+
+def test_error_se_cuenta_y_propaga(metricas_limpias):
+    @metricas.instrumentar
+    def falla():
+        raise ValueError('x')
+
+    with pytest.raises(ValueError):
+        falla()
+    assert 'clinica_db_errors_total{funcion="falla"} 1' in metricas.exportar_openmetrics()
+
+
+def test_endpoint_http_y_archivo(metricas_limpias, tmp_path):
+    metricas.instrumentar(lambda: [1, 2, 3])()
+    servidor = metricas.iniciar_servidor(puerto=0)
+    try:
+        url = f"http://127.0.0.1:{servidor.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as respuesta:
+            assert respuesta.headers['Content-Type'] == metricas.CONTENT_TYPE
+            assert 'clinica_db_rows_total{funcion="<lambda>"} 3' in respuesta.read().decode()
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    ruta = tmp_path / 'clinica.prom'
+    metricas.escribir_metricas(str(ruta))
+    assert ruta.read_text(encoding='utf-8') == metricas.exportar_openmetrics()
@@ -0,0 +1,182 @@
+from datetime import date, datetime
+
+import pytest
+
+import recurrencia
+
+
+def _fechas(fechas):
+    return [f.strftime('%Y-%m-%d %H:%M') for f in fechas]
+
+
+def test_expandir_reglas():
+    inicio = datetime(2024, 1, 31, 9, 0)
+    assert _fechas(recurrencia.expandir(inicio, 'mensual', 1, ocurrencias=4)) == [
+        '2024-01-31 09:00', '2024-02-29 09:00', '2024-03-31 09:00', '2024-04-30 09:00']
+    # Cada 3 meses durante 2 años
+    trimestral = recurrencia.expandir(inicio, 'mensual', 3, hasta=date(2026, 1, 31))
+    assert len(trimestral) == 9 and _fechas(trimestral)[-1] == '2026-01-31 09:00'
+    assert _fechas(recurrencia.expandir(inicio, 'semanal', 2, ocurrencias=3)) == [
+        '2024-01-31 09:00', '2024-02-14 09:00', '2024-02-28 09:00']
+    assert len(recurrencia.expandir(inicio, 'diaria', 1, hasta=datetime(2024, 2, 2, 8, 0))) == 2
+    with pytest.raises(ValueError):
+        recurrencia.expandir(inicio, 'anual', 1, ocurrencias=2)
+    with pytest.raises(ValueError):
+        recurrencia.expandir(inicio, 'semanal', 1)
+    with pytest.raises(ValueError):
+        recurrencia.expandir(inicio, 'diaria', 1, ocurrencias=1000)
+
+
+@pytest.fixture
+def agenda(temp_db):
+    temp_db.create_medico_con_usuario('Dra. Uno', 'Cardiología', 'a@x', 'uno', 'x')
+    medico_id = temp_db.get_all_medicos()[0]['id']
+    ana = temp_db.create_paciente('Ana', '1980-01-01', False, '555', '')
+    beto = temp_db.create_paciente('Beto', '1975-01-01', False, '556', '')
+    return temp_db, medico_id, ana, beto
+
+
+def test_serie_con_conflictos_movidas_y_omitidas(agenda):
+    db, medico_id, ana, beto = agenda
+    # Lunes 4 y 11 de marzo ocupados a las 09:00 por otro paciente
+    for dia in ('04', '11'):
+        assert db.reservar_cita(beto, medico_id, f'2024-03-{dia} 09:00:00', 30)
+    fechas = recurrencia.expandir(datetime(2024, 3, 4, 9, 0), 'semanal', 1, ocurrencias=4)
+    assert sorted(db.get_conflictos_ocurrencias(medico_id, _segundos(fechas), 30)) == [0, 1]
+
+    plan = recurrencia.planificar_serie(medico_id, fechas, 30, mover=False)
+    assert [o['estado'] for o in plan] == ['omitida', 'omitida', 'libre', 'libre']
+
+    plan = recurrencia.planificar_serie(medico_id, fechas, 30)
+    assert [(o['estado'], o['fecha_hora']) for o in plan] == [
+        ('movida', '2024-03-04 09:30:00'), ('movida', '2024-03-11 09:30:00'),
+        ('libre', '2024-03-18 09:00:00'), ('libre', '2024-03-25 09:00:00')]
+    assert plan[0]['motivo'] == "se superpone con otra cita"
+
+    # Otra recepcionista ocupa el 18 entre la planificación y la inserción
+    assert db.reservar_cita(beto, medico_id, '2024-03-18 09:00:00', 30)
+    serie_id, informe = recurrencia.agendar_serie(ana, medico_id, plan, 30, 'semanal', 1)
+    assert [o['estado'] for o in informe] == ['movida', 'movida', 'omitida', 'libre']
+    assert [c['fecha_hora'] for c in db.get_citas_serie(serie_id)] == [
+        '2024-03-04 09:30:00', '2024-03-11 09:30:00', '2024-03-25 09:00:00']
+    serie, = db.get_series_paciente(ana)
+    assert (serie['id'], serie['total'], serie['pendientes'], serie['frecuencia']) == (serie_id, 3, 3, 'semanal')
+
+
+def test_serie_sin_ninguna_cita_libre_no_se_crea(agenda):
+    db, medico_id, ana, beto = agenda
+    plan = recurrencia.planificar_serie(medico_id, [datetime(2024, 3, 4, 9, 0), datetime(2024, 3, 11, 9, 0)], 20)
+    assert [o['estado'] for o in plan] == ['libre', 'libre']
+    # Otra recepcionista ocupa ambos horarios antes de confirmar
+    for dia in ('04', '11'):
+        assert db.reservar_cita(beto, medico_id, f'2024-03-{dia} 09:00:00', 20)
+
+    serie_id, informe = recurrencia.agendar_serie(ana, medico_id, plan, 20, 'semanal', 1)
+    assert serie_id is None and [o['estado'] for o in informe] == ['omitida', 'omitida']
+    assert db.get_series_paciente(ana) == []
+    assert db.create_serie_citas(ana, medico_id, ['2024-03-04 09:00:00'], 20) == (None, [])
+    assert db.get_series_paciente(ana) == []
+
+
+def test_fuera_de_horario_se_mueve(agenda):
+    db, medico_id, ana, _ = agenda
+    db.set_horario_medico(medico_id, [(0, '08:00', '12:00'), (2, '08:00', '12:00')])
+    # Sábado: se mueve al lunes; con tolerancia de 1 día no hay lugar
+    plan = recurrencia.planificar_serie(medico_id, [datetime(2024, 3, 9, 10, 0)], 20)
+    assert (plan[0]['estado'], plan[0]['fecha_hora']) == ('movida', '2024-03-11 08:00:00')
+    assert plan[0]['motivo'] == "fuera del horario de atención"
+    plan = recurrencia.planificar_serie(medico_id, [datetime(2024, 3, 9, 10, 0)], 20, tolerancia_dias=1)
+    assert plan[0]['estado'] == 'omitida'
+
+
+def test_editar_y_cancelar_serie(agenda):
+    db, medico_id, ana, beto = agenda
+    fechas = _segundos(recurrencia.expandir(datetime(2024, 3, 4, 9, 0), 'semanal', 1, ocurrencias=4))
+    serie_id, agendadas = db.create_serie_citas(ana, medico_id, fechas, 20, 'semanal', 1)
+    assert agendadas == fechas
+    primera = db.get_citas_serie(serie_id)[0]['id']
+    db.update_estado_cita(primera, 'Completada')
+    assert db.reservar_cita(beto, medico_id, '2024-03-18 11:00:00', 20)
+
+    # Pasar la serie a las 11:00 y 30 minutos: la del 18 choca y no se toca
+    resultado = db.update_serie_citas(serie_id, hora='11:00', duracion_min=30, desde='2024-03-01')
+    assert resultado == {'actualizadas': 2, 'en_conflicto': ['2024-03-18 09:00:00'], 'fuera_de_horario': [],
+                         'serie_actualizada': False}
+    citas = db.get_citas_serie(serie_id)
+    assert [(c['fecha_hora'][5:16], c['duracion_min'], c['estado']) for c in citas] == [
+        ('03-04 09:00', 20, 'Completada'), ('03-11 11:00', 30, 'Pendiente'),
+        ('03-18 09:00', 20, 'Pendiente'), ('03-25 11:00', 30, 'Pendiente')]
+    assert citas[1]['fecha_hora_fin'] == '2024-03-11 11:30:00'
+    # Las propias citas de la serie no cuentan como conflicto al volver a editarla
+    assert db.update_serie_citas(serie_id, duracion_min=40, desde='2024-03-01')['en_conflicto'] == []
+
+    assert db.cancelar_serie_citas(serie_id, desde='2024-03-15') == 2
+    assert [c['estado'] for c in db.get_citas_serie(serie_id)] == ['Completada', 'Pendiente', 'Cancelada', 'Cancelada']
+    # Sus horarios quedan libres
+    assert db.reservar_cita(beto, medico_id, '2024-03-25 11:00:00', 20)
+
+
+def test_editar_serie_respeta_horario_y_medico(agenda):
+    db, medico_id, ana, _ = agenda
+    db.create_medico_con_usuario('Dr. Dos', 'Cardiología', 'b@x', 'dos', 'x')
+    otro = max(m['id'] for m in db.get_all_medicos())
+    # El 2do médico no atiende los miércoles
+    db.set_horario_medico(otro, [(dia, '08:00', '18:00') for dia in (0, 1, 3, 4)])
+    # Lunes 4, miércoles 6 y viernes 8 de marzo
+    fechas = ['2024-03-04 09:00:00', '2024-03-06 09:00:00', '2024-03-08 09:00:00']
+    serie_id, _ = db.create_serie_citas(ana, medico_id, fechas, 20, 'diaria', 2)
+
+    resultado = recurrencia.editar_serie(serie_id, hora='19:00', desde='2024-03-01')
+    assert resultado['actualizadas'] == 0 and len(resultado['fuera_de_horario']) == 3
+
+    resultado = recurrencia.editar_serie(serie_id, medico_id=otro, desde='2024-03-01')
+    assert resultado == {'actualizadas': 2, 'en_conflicto': [], 'fuera_de_horario': ['2024-03-06 09:00:00'],
+                         'serie_actualizada': False}
+    assert [c['medico_id'] for c in db.get_citas_serie(serie_id)] == [otro, medico_id, otro]
+    assert db.get_series_paciente(ana)[0]['medico_id'] == medico_id
+
+    # Sin la del miércoles pendiente, la serie entera pasa al otro médico
+    db.update_estado_cita(db.get_citas_serie(serie_id)[1]['id'], 'Cancelada')
+    resultado = recurrencia.editar_serie(serie_id, medico_id=otro, duracion_min=30, desde='2024-03-01')
+    assert resultado['actualizadas'] == 2 and resultado['serie_actualizada']
+    serie, = db.get_series_paciente(ana)
+    assert (serie['medico_id'], serie['duracion_min']) == (otro, 30)
+
+
+def test_cancelar_serie_no_altera_asistencia(agenda):
+    db, medico_id, ana, beto = agenda
+    for hora, estado in (('08:00', 'Completada'), ('08:30', 'No-show')):
+        db.update_estado_cita(db.reservar_cita(beto, medico_id, f'2024-03-04 {hora}:00', 20), estado)
+    antes = db.get_noshow_stats(medico_id, '2024-03-01', '2024-03-31')
+    assert (antes['total_citas'], antes['tasa_asistencia']) == (2, 50.0)
+
+    fechas = _segundos(recurrencia.expandir(datetime(2024, 3, 5, 9, 0), 'semanal', 1, ocurrencias=3))
+    serie_id, _ = db.create_serie_citas(ana, medico_id, fechas, 20, 'semanal', 1)
+    assert db.cancelar_serie_citas(serie_id, desde='2024-03-01') == 3
+
+    despues = db.get_noshow_stats(medico_id, '2024-03-01', '2024-03-31')
+    assert despues.pop('total_canceladas') == 3
+    antes.pop('total_canceladas')
+    assert despues == antes
+    assert db.get_citas_stats_por_medico('2024-03-01', '2024-03-31')[medico_id]['total_citas'] == 2
+
+
+def test_cancelar_serie_actualiza_totales_del_mes(agenda):
+    from modules import agenda as pagina
+    db, medico_id, ana, beto = agenda
+    db.reservar_cita(beto, medico_id, '2024-03-05 08:00:00', 20)
+    fechas = _segundos(recurrencia.expandir(datetime(2024, 3, 5, 9, 0), 'semanal', 1, ocurrencias=4))
+    serie_id, _ = db.create_serie_citas(ana, medico_id, fechas, 20, 'semanal', 1)
+    por_dia = db.get_citas_por_dia('2024-03-01', '2024-03-31', medico_id)
+    assert sum(pagina.citas_vigentes(c) for c in por_dia.values()) == 5
+
+    db.cancelar_serie_citas(serie_id, desde='2024-03-01')
+    por_dia = db.get_citas_por_dia('2024-03-01', '2024-03-31', medico_id)
+    assert {dia: pagina.citas_vigentes(c) for dia, c in por_dia.items()} == {
+        '2024-03-05': 1, '2024-03-12': 0, '2024-03-19': 0, '2024-03-26': 0}
+    html = pagina.html_mes(2024, 3, por_dia)
+    assert html.count(' cita(s)</div>') == 1 and html.count('1 cancelada(s)') == 4
+
+
+def _segundos(fechas):
+    return [f.strftime('%Y-%m-%d %H:%M:%S') for f in fechas]